@@ -5,6 +5,7 @@ export AWS_SECRET_ACCESS_KEY=bar
 echo "Create SQS queues..."
 awslocal sqs create-queue --queue-name ProviderHubApiDLQueuelocal
 awslocal sqs create-queue --queue-name ProviderHubApiJobsQueuelocal
+awslocal sqs create-queue --queue-name ProviderHubApiBulkJobsQueuelocal
 
 echo "Create S3 buckets..."
 awslocal s3api create-bucket --bucket provider-hub-api-jobs-local
@@ -0,0 +1,110 @@
+"""
+Compares rendering of flight-offers request bodies, run with:
+python -m src.benchmarks.amadeus_requests
+"""
+import argparse
+import json
+import time
+
+from ..handlers.tasks.runners.amadeus_preselection import get_search_requests
+from ..helpers.amadeus import Amadeus
+
+TASK_PARAMS = {
+    "date_from": "2024-04-01",
+    "date_to": "2024-06-30",
+    "nights_in_dst_from": 7,
+    "nights_in_dst_to": 14,
+    "passengers_map": {"adults": 5, "children": [16, 14, 9]},
+    "fly_from_airports": ["GDN", "WAW", "KRK", "KTW", "POZ"],
+    "fly_to_airports": ["MLE", "GAN"],
+    "return_from_airports": ["MLE", "GAN"],
+    "return_to_airports": ["GDN", "WAW", "KRK", "KTW", "POZ"],
+    "return_from": "2024-04-01",
+    "return_to": "2024-07-31",
+    "allow_opposite_route": False,
+    "currency_code": "PLN",
+    "multicity": False,
+}
+
+
+def render_legacy(flights, passengers_map, currency_code):
+    data = {
+        "currencyCode": currency_code,
+        "searchCriteria": {
+            "allowAlternativeFareOptions": True,
+            "additionalInformation": {
+                "chargeableCheckedBags": True,
+            },
+        },
+        "originDestinations": [
+            {
+                "id": index + 1,
+                "originLocationCode": flight["departure"]["iata"],
+                "destinationLocationCode": flight["arrival"]["iata"],
+                "departureDateTimeRange": {"date": flight["departure_date"]},
+            }
+            for (index, flight) in enumerate(flights)
+        ],
+        "travelers": [
+            *[
+                {
+                    "id": index1 + 1,
+                    "travelerType": "ADULT",
+                    "fareOptions": ["STANDARD"],
+                }
+                for index1 in range(0, passengers_map["adults"])
+            ],
+            *[
+                {
+                    "id": index2 + 1 + passengers_map["adults"],
+                    "travelerType": "CHILD",
+                    "fareOptions": ["STANDARD"],
+                }
+                for (index2, age) in enumerate(passengers_map["children"])
+            ],
+        ],
+        "sources": ["GDS", "PYTON", "LTC", "EAC", "NDC"],
+    }
+    return json.dumps(data)
+
+
+def render_builder(service, flights, passengers_map, currency_code):
+    builder = service.get_request_builder(
+        passengers_map=passengers_map, cabin_class="any", currency_code=currency_code
+    )
+    return builder.render(flights)
+
+
+def measure(func, search_requests, repeat):
+    best = None
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        for search_params in search_requests:
+            func(**search_params)
+        elapsed = time.perf_counter() - tic
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    search_requests = get_search_requests(task_params=dict(TASK_PARAMS))
+    service = Amadeus(client=None)
+
+    legacy = measure(render_legacy, search_requests, args.repeat)
+    builder = measure(
+        lambda **kw: render_builder(service, **kw), search_requests, args.repeat
+    )
+
+    total = len(search_requests)
+    print(f"combinations: {total}")
+    print(f"legacy:  {legacy * 1000:.2f}ms ({legacy / total * 1e6:.2f}us/request)")
+    print(f"builder: {builder * 1000:.2f}ms ({builder / total * 1e6:.2f}us/request)")
+    print(f"speedup: {legacy / builder:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
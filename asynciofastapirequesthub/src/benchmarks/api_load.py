@@ -0,0 +1,298 @@
+"""
+Load test of schedule and status endpoints, served by plain ASGI app and by
+Mangum Lambda handler, against moto stand-in of S3 and SQS, run with:
+python -m src.benchmarks.api_load --requests 500 --concurrency 20
+
+With DEFAULT_LOCALSTACK_URL and ENV_NAME=local localstack is used instead,
+bucket and queues are created when missing.
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from datetime import date, timedelta
+
+import httpx
+import orjson
+
+from ..conf import settings
+from ..endpoints.tasks import get_task_id, get_task_params
+from ..handlers.api import web
+from ..helpers import aws, consts, profiling
+from ..helpers.hedging import LatencyTracker
+from ..main import app
+
+SCENARIOS = ["cache-hit", "cache-miss", "status"]
+DRIVERS = ["asgi", "mangum"]
+MOTO_REGION = "eu-central-1"
+
+TASK_NAME = consts.Tasks.AMADEUS_PRESELECTION
+TASK_PARAMS = {
+    "date_from": "2030-04-25",
+    "date_to": "2030-05-02",
+    "nights_in_dst_from": 7,
+    "nights_in_dst_to": 10,
+    "passengers_map": {"adults": 2, "children": [9]},
+    "fly_from_airports": ["WAW"],
+    "fly_to_airports": ["MLE"],
+    "return_from_airports": ["MLE"],
+    "return_to_airports": ["WAW"],
+    "return_from": "2030-05-02",
+    "return_to": "2030-05-12",
+    "allow_opposite_route": False,
+    "currency_code": "PLN",
+    "multicity": False,
+}
+
+
+def get_offer(index):
+    """
+    Flight offer of roughly the size Amadeus returns (~3KB as json).
+    """
+    segment = {
+        "departure": {"iataCode": "WAW", "terminal": "1", "at": "2030-04-25T06:10:00"},
+        "arrival": {"iataCode": "DOH", "terminal": "2", "at": "2030-04-25T13:20:00"},
+        "carrierCode": "QR",
+        "number": str(200 + index % 50),
+        "aircraft": {"code": "788"},
+        "operating": {"carrierCode": "QR"},
+        "duration": "PT6H10M",
+        "id": str(index),
+        "numberOfStops": 0,
+        "blacklistedInEU": False,
+    }
+    itinerary = {"duration": "PT14H35M", "segments": [segment, segment]}
+    price = f"{3000 + index * 7.5:.2f}"
+    return {
+        "type": "flight-offer",
+        "id": str(index),
+        "source": "GDS",
+        "lastTicketingDate": "2030-04-20",
+        "numberOfBookableSeats": 9,
+        "itineraries": [itinerary, itinerary],
+        "price": {
+            "currency": "PLN",
+            "total": price,
+            "base": price,
+            "grandTotal": price,
+            "fees": [{"amount": "0.00", "type": "SUPPLIER"}],
+        },
+        "validatingAirlineCodes": ["QR"],
+        "travelerPricings": [
+            {
+                "travelerId": str(i),
+                "fareOption": "STANDARD",
+                "travelerType": "ADULT",
+                "price": {"currency": "PLN", "total": price, "base": price},
+            }
+            for i in range(1, 4)
+        ],
+    }
+
+
+def get_miss_params(index):
+    # distinct departure window per request, so every one misses cache
+    date_from = date(2030, 1, 1) + timedelta(days=index % 3000)
+    return {
+        **TASK_PARAMS,
+        "date_from": date_from.isoformat(),
+        "date_to": (date_from + timedelta(days=7)).isoformat(),
+        "return_from": (date_from + timedelta(days=7)).isoformat(),
+        "return_to": (date_from + timedelta(days=17)).isoformat(),
+        "passengers_map": {"adults": 1 + index // 3000, "children": [9]},
+    }
+
+
+def get_request(scenario, index, task_id):
+    if scenario == "status":
+        return "GET", f"{settings.API_PREFIX}/tasks/{task_id}/status", None
+
+    task_params = TASK_PARAMS if scenario == "cache-hit" else get_miss_params(index)
+    body = {"task_name": TASK_NAME, "task_params": task_params}
+    return "POST", f"{settings.API_PREFIX}/tasks/schedule", body
+
+
+def seed(service, offers):
+    """
+    Bucket, queues and READY results of cache-hit task, returns its task_id.
+    """
+    for queue_name in (settings.JOBS_QUEUE_NAME, settings.JOBS_BULK_QUEUE_NAME):
+        aws.get_client_sqs().create_queue(QueueName=queue_name)
+    with contextlib.suppress(aws.get_client_s3().exceptions.BucketAlreadyOwnedByYou):
+        aws.get_client_s3().create_bucket(
+            Bucket=settings.JOBS_BUCKET,
+            CreateBucketConfiguration={
+                "LocationConstraint": settings.DEFAULT_AWS_REGION
+            },
+        )
+
+    task_id = get_task_id(TASK_NAME, get_task_params(TASK_NAME, TASK_PARAMS))
+    service.s3_put_json_obj(
+        bucket=settings.JOBS_BUCKET,
+        key=service.key_results(task_id, service.key_partition()),
+        message={
+            "status": consts.TaskStatus.READY,
+            "results": [get_offer(i) for i in range(offers)],
+        },
+    )
+    return task_id
+
+
+async def run_asgi(scenario, task_id, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = LatencyTracker(window=requests)
+    statuses = []
+    headers = {settings.API_KEY_HEADER_NAME: settings.API_KEY_HEADER_VALUE}
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://testserver"
+    ) as client:
+
+        async def send(index):
+            method, path, body = get_request(scenario, index, task_id)
+            async with semaphore:
+                tic = time.perf_counter()
+                r = await client.request(method, path, json=body, headers=headers)
+                latencies.observe(time.perf_counter() - tic)
+                statuses.append(r.status_code)
+
+        await asyncio.gather(*[send(i) for i in range(requests)])
+    return latencies, statuses
+
+
+def get_lambda_event(method, path, body):
+    return {
+        "resource": "/{proxy+}",
+        "path": path,
+        "httpMethod": method,
+        "headers": {
+            "Content-Type": "application/json",
+            settings.API_KEY_HEADER_NAME: settings.API_KEY_HEADER_VALUE,
+        },
+        "multiValueHeaders": {},
+        "queryStringParameters": None,
+        "multiValueQueryStringParameters": None,
+        "requestContext": {
+            "resourcePath": "/{proxy+}",
+            "httpMethod": method,
+            "path": path,
+            "stage": settings.ENV_NAME,
+            "identity": {"sourceIp": "127.0.0.1"},
+        },
+        "body": orjson.dumps(body).decode() if body is not None else None,
+        "isBase64Encoded": False,
+    }
+
+
+def run_mangum(scenario, task_id, requests):
+    # Lambda container serves one request at a time, so does this driver
+    latencies = LatencyTracker(window=requests)
+    statuses = []
+    for index in range(requests):
+        event = get_lambda_event(*get_request(scenario, index, task_id))
+        tic = time.perf_counter()
+        r = web.handler(event, None)
+        latencies.observe(time.perf_counter() - tic)
+        statuses.append(r["statusCode"])
+    return latencies, statuses
+
+
+def run(loop, driver, scenario, task_id, args):
+    profiler = profiling.MemoryProfiler(enabled=args.trace_memory)
+    profiler.start()
+    try:
+        tic = time.perf_counter()
+        with profiler.phase(scenario):
+            if driver == "asgi":
+                latencies, statuses = loop.run_until_complete(
+                    run_asgi(scenario, task_id, args.requests, args.concurrency)
+                )
+            else:
+                latencies, statuses = run_mangum(scenario, task_id, args.requests)
+        elapsed = time.perf_counter() - tic
+    finally:
+        profiler.stop()
+
+    report = {
+        "driver": driver,
+        "scenario": scenario,
+        "requests": len(statuses),
+        "errors": sum(1 for i in statuses if i >= 400),
+        "rps": round(len(statuses) / elapsed, 1),
+        **{
+            f"p{int(q * 100)}_ms": round(latencies.percentile(q) * 1000, 2)
+            for q in (0.5, 0.95, 0.99)
+        },
+        # peak RSS is the whole process lifetime, earlier scenarios included
+        "rss_delta_mb": profiler.stats["rss_delta_mb"],
+    }
+    if args.trace_memory:
+        report["traced_peak_mb"] = profiler.phases[scenario]["peak_mb"]
+    return report
+
+
+@contextlib.contextmanager
+def stand_in():
+    if settings.use_localstack:
+        yield "localstack"
+        return
+
+    from moto import mock_aws
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    settings.DEFAULT_AWS_REGION = MOTO_REGION
+    with mock_aws():
+        # clients created before the mock would reach real AWS
+        aws.get_client_s3.cache_clear()
+        aws.get_client_sqs.cache_clear()
+        yield "moto"
+    aws.get_client_s3.cache_clear()
+    aws.get_client_sqs.cache_clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--offers", type=int, default=250)
+    parser.add_argument("--drivers", nargs="+", choices=DRIVERS, default=DRIVERS)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="reports tracemalloc peak, latencies are skewed by tracing",
+    )
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    # measured are the endpoints, not logging or metric lines,
+    # cache misses are only queued, jobs are not run inline
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+    settings.METRICS_ENABLED = False
+    settings.JOBS_INLINE_EXECUTOR = False
+
+    # Mangum runs the app in current event loop, as it is in Lambda
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    reports = []
+    try:
+        with stand_in() as name:
+            task_id = seed(aws.AWSServiceAdapter(), args.offers)
+            print(f"stand-in: {name}, offers: {args.offers}, {task_id=}")
+            for driver in args.drivers:
+                for scenario in args.scenarios:
+                    report = run(loop, driver, scenario, task_id, args)
+                    reports.append(report)
+                    print(" ".join(f"{k}={v}" for k, v in report.items()))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+    return reports
+
+
+if __name__ == "__main__":
+    main()
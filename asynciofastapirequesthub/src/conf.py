@@ -19,17 +19,133 @@ class Settings(BaseSettings):
     BACKEND_CORS_ORIGINS: List[int] = []
     PROJECT_NAME: str = "Provider Hub"
     JOBS_QUEUE_NAME: str = f"ProviderHubApiJobsQueue{env}"
+    JOBS_BULK_QUEUE_NAME: str = f"ProviderHubApiBulkJobsQueue{env}"
+    # larger message bodies are offloaded to S3, see sqs_encode_message
+    SQS_CLAIM_CHECK_THRESHOLD: int = 192 * 1024
+    # claim checks are kept as long as queues and DLQ retain messages
+    # (MessageRetentionPeriod), so redriven messages still resolve them
+    SQS_CLAIM_CHECK_RETENTION: int = 3600 * 24 * 14
+    # "sqs" or "local" directory queue shared by processes of a single box,
+    # see helpers.queues and handlers.tasks.worker
+    JOBS_QUEUE_BACKEND: str = "sqs"
+    JOBS_QUEUE_LOCAL_DIR: str = "/tmp/provider-hub-queues"
+    JOBS_QUEUE_VISIBILITY_TIMEOUT: int = 1800
+    # with localstack jobs run inline in the schedule request,
+    # disable when worker consumes the queues
+    JOBS_INLINE_EXECUTOR: bool = True
+    # worker processes (0 uses all vCPUs) and jobs run at once by each one
+    JOBS_WORKER_PROCESSES: int = 0
+    JOBS_WORKER_CONCURRENCY: int = 4
+    # tasks estimated above this number of provider requests are routed to the
+    # bulk lane, so they do not block small interactive searches
+    JOBS_BULK_TASK_COST_THRESHOLD: int = 100
+    # tasks estimated above this number of provider requests are rejected or
+    # split into shards by departure dates, see TaskOverCostPolicy
+    TASKS_MAX_COST: int = 2000
+    TASKS_OVER_COST_POLICY: str = "reject"
+    # when set, provider is searched in this currency only and offers are
+    # converted to task currency locally, see helpers.fx, currency stays in
+    # task_id, so searches are shared between currencies only through
+    # snapshots, hence it takes effect only with JOBS_SNAPSHOTS_ENABLED
+    TASKS_BASE_CURRENCY: str = ""
     JOBS_BUCKET: str = f"provider-hub-api-jobs-{env}"
     JOBS_RESULTS_EXPIRE: int = 3600 * 24
+    # cached results older than soft TTL are still served, but a refresh job
+    # is enqueued in the background, at most one per task within lock time
+    JOBS_RESULTS_SOFT_TTL: int = 3600 * 3
+    JOBS_REVALIDATION_LOCK: int = 900
+    # scheduled tasks are counted per task_id, cache warmer refreshes top
+    # ones spending at most budget of provider requests per day (UTC) over
+    # all its runs, results which would turn stale before its next run are
+    # refreshed, interval matches schedule of taskCacheWarmerHandler
+    JOBS_POPULARITY_TRACKING: bool = True
+    JOBS_WARMER_TOP_TASKS: int = 20
+    JOBS_WARMER_BUDGET: int = 2000
+    JOBS_WARMER_INTERVAL: int = 3600 * 2
+    # task objects are stored under YYYY-MM-DD/ prefixes of the day task
+    # was scheduled, see AWSServiceAdapter.key_partition
+    JOBS_KEYS_PARTITIONED: bool = True
+    # flat keys written before partitioning are looked up last, can be turned
+    # off once JOBS_RESULTS_EXPIRE has passed since partitioning was deployed
+    JOBS_KEYS_FLAT_FALLBACK: bool = True
+    JOBS_EXPIRE_DELETE_CONCURRENCY: int = 8
+    # per-combination offers kept next to results, so refresh runs only
+    # re-query combinations searched earlier than JOBS_REFRESH_FRESHNESS,
+    # opt-in as storing all offers before filtering is costly for every job,
+    # subsumption of tasks relies on snapshots
+    JOBS_SNAPSHOTS_ENABLED: bool = False
+    JOBS_REFRESH_FRESHNESS: int = 1800
+    # tasks covered by search space of a completed task are served from its
+    # snapshot, see amadeus_preselection.find_subsuming_task
+    JOBS_SUBSUMPTION_ENABLED: bool = True
+    # results additionally stored as gzip-member NDJSON chunks with an offset
+    # index, served page by page by /tasks/{task_id}/results
+    JOBS_RESULTS_NDJSON_ENABLED: bool = True
+    JOBS_RESULTS_NDJSON_CHUNK_SIZE: int = 25
+    JOBS_RESULTS_PAGE_LIMIT: int = 250
+    # "parquet" or "arrow" writes flattened results for analytics next to
+    # json results, requires pyarrow, disabled when empty
+    JOBS_RESULTS_COLUMNAR_FORMAT: str = ""
+    # filtering, conversion and compression of results run off the event
+    # loop in "thread" or "process" pool, inline when empty, stages taking
+    # offers or results run in threads also with "process", as pickling
+    # them costs more than they save, processes compress serialized bytes
+    # only, see executors.run_cpu_bound,
+    # JOBS_CPU_WORKERS of 0 uses all vCPUs of the container
+    JOBS_CPU_EXECUTOR: str = "thread"
+    JOBS_CPU_WORKERS: int = 0
+    # tracemalloc phases of jobs and top allocation sites in logs,
+    # peak RSS is reported regardless, see helpers.profiling
+    JOBS_MEMORY_PROFILING: bool = False
 
     AMADEUS_API_KEY: str = "<key>"
     AMADEUS_API_SECRET: str = "<secret>"
     AMADEUS_API_URL: str = "https://travel.api.amadeus.com"
 
     # theoretical limit is 150, but let's keep a slight buffer,
-    # see also taskJobsHandler reservedConcurrency
-    AMADEUS_MAX_REQUESTS_AT_ONCE: int = 70
-    AMADEUS_MAX_REQUESTS_PER_SECOND: int = 70
+    # see also taskJobsHandler and taskBulkJobsHandler reservedConcurrency
+    # (2 interactive containers * 50 + 1 bulk container * 40 = 140)
+    AMADEUS_MAX_REQUESTS_AT_ONCE: int = 50
+    AMADEUS_MAX_REQUESTS_PER_SECOND: int = 50
+    AMADEUS_BULK_MAX_REQUESTS_AT_ONCE: int = 40
+    AMADEUS_BULK_MAX_REQUESTS_PER_SECOND: int = 40
+    # limits above are applied to all jobs run at once by a process instead
+    # of each of them, set by worker which runs several jobs per process
+    AMADEUS_SHARED_JOB_LIMITS: bool = False
+    # global budget shared by all job containers, coordinated through
+    # AMADEUS_RATE_LIMITER_BACKEND ("local", "dynamodb"), disabled when empty
+    AMADEUS_RATE_LIMITER_BACKEND: str = ""
+    AMADEUS_RATE_LIMITER_TABLE: str = f"provider-hub-api-rate-limits-{env}"
+    AMADEUS_RATE_LIMITER_BATCH: int = 10
+    AMADEUS_GLOBAL_MAX_REQUESTS_PER_SECOND: int = 140
+    # used by task estimates until latency is observed by jobs
+    AMADEUS_ESTIMATED_REQUEST_LATENCY: float = 2.0
+    # duplicate searches slower than given percentile of latencies observed
+    # in the job, at most AMADEUS_HEDGE_MAX_RATIO of all requests
+    AMADEUS_HEDGE_ENABLED: bool = False
+    AMADEUS_HEDGE_PERCENTILE: float = 0.95
+    AMADEUS_HEDGE_MIN_SAMPLES: int = 20
+    AMADEUS_HEDGE_MAX_RATIO: float = 0.05
+    # fail fast while Amadeus is degraded globally or for particular route
+    AMADEUS_BREAKER_ENABLED: bool = True
+    AMADEUS_BREAKER_FAILURE_RATIO: float = 0.5
+    AMADEUS_BREAKER_WINDOW: int = 50
+    AMADEUS_BREAKER_MIN_REQUESTS: int = 20
+    AMADEUS_BREAKER_ROUTE_MIN_REQUESTS: int = 5
+    AMADEUS_BREAKER_OPEN_SECONDS: float = 30
+    # offers are reduced to these keys right after parsing, empty keeps all
+    AMADEUS_OFFER_FIELDS: List[str] = []
+    # maxFlightOffers sent with every search, derived from number of task
+    # combinations so that all of them return OVERSAMPLING times offers
+    # filter_results needs to keep its limit after price and time cuts
+    # (about 11 times the limit), 0 disables the cap (Amadeus maximum is 250)
+    AMADEUS_MAX_FLIGHT_OFFERS: int = 250
+    AMADEUS_MIN_FLIGHT_OFFERS: int = 10
+    AMADEUS_FLIGHT_OFFERS_OVERSAMPLING: float = 1.0
+    # second phase re-queries truncated combinations which may hold offers
+    # cheaper than filter_results cut, with AMADEUS_MAX_FLIGHT_OFFERS cap
+    AMADEUS_TWO_PHASE_ENABLED: bool = False
+    AMADEUS_TWO_PHASE_MAX_REQUESTS: int = 20
 
     LOG_CONFIG: Dict = {
         "version": 1,
@@ -62,6 +178,9 @@ class Settings(BaseSettings):
     SENTRY_DSN: str = ""
     SENTRY_SAMPLE_RATE: float = 1.0
     SENTRY_TRACES_SAMPLE_RATE: float = 0.0
+    # CloudWatch embedded metric format lines, see helpers.metrics
+    METRICS_ENABLED: bool = True
+    METRICS_NAMESPACE: str = "ProviderHub"
 
     @computed_field
     @property
@@ -73,6 +192,7 @@ class Settings(BaseSettings):
 
 
 class TestSettings(Settings):
+    JOBS_POPULARITY_TRACKING: bool = False
     LOG_CONFIG: Dict = {
         "version": 1,
         "disable_existing_loggers": False,
@@ -139,8 +259,9 @@ class LocalSettings(Settings):
 
 
 def get_settings():
-    config_type = {"test": TestSettings(), "local": LocalSettings()}
-    return config_type.get(env, Settings())
+    # only selected class is instantiated, each one reads environment and .env
+    config_type = {"test": TestSettings, "local": LocalSettings}
+    return config_type.get(env, Settings)()
 
 
 settings: Settings = get_settings()
@@ -1,5 +1,8 @@
 from .base import ApiBaseException
+from .tasks import InvalidTaskParamsException, TaskCostExceededException
 
 __all__ = [
     "ApiBaseException",
+    "InvalidTaskParamsException",
+    "TaskCostExceededException",
 ]
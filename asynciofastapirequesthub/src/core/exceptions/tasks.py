@@ -0,0 +1,13 @@
+from .base import ApiBaseException
+
+
+class InvalidTaskParamsException(ApiBaseException):
+    code = 422
+    error_code = "INVALID_TASK_PARAMS"
+    message = "INVALID TASK PARAMS"
+
+
+class TaskCostExceededException(ApiBaseException):
+    code = 422
+    error_code = "TASK_COST_EXCEEDED"
+    message = "TASK COST EXCEEDED"
@@ -1,9 +1,11 @@
-import sentry_sdk
-from sentry_sdk.integrations.aws_lambda import AwsLambdaIntegration
-
 from ..conf import settings
 
-if settings.SENTRY_DSN:
+
+def init():
+    # sentry_sdk is imported only when enabled, it is costly on cold start
+    import sentry_sdk
+    from sentry_sdk.integrations.aws_lambda import AwsLambdaIntegration
+
     sentry_sdk.init(
         dsn=settings.SENTRY_DSN,
         integrations=[AwsLambdaIntegration()],
@@ -12,3 +14,7 @@ if settings.SENTRY_DSN:
         max_request_body_size="medium",
         send_default_pii=True,
     )
+
+
+if settings.SENTRY_DSN:
+    init()
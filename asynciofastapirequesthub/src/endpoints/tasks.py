@@ -1,34 +1,452 @@
+import asyncio
+import functools
+import gzip
 import hashlib
 import json
 import logging
+import uuid
+from datetime import date
+from typing import ClassVar, List
 
+import orjson
 from botocore.exceptions import ClientError
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import ORJSONResponse
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import (
+    BaseModel,
+    Field,
+    ValidationError,
+    field_validator,
+    model_validator,
+)
+from starlette.status import HTTP_404_NOT_FOUND
 
 from ..conf import settings
 from ..core import auth
-from ..helpers import consts
-from ..helpers.aws import AWSServiceAdapter, client_s3
+from ..core.exceptions import InvalidTaskParamsException, TaskCostExceededException
+from ..helpers import consts, metrics, queues, revalidation
+from ..helpers.aws import AWSServiceAdapter, get_client_s3
+from ..helpers.utils import ndjson_page_chunks
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
+# popularity puts in flight, referenced so they are not garbage collected
+popularity_tracking = set()
 
 
-class TaskScheduleModel(BaseModel):
+class TaskEstimateModel(BaseModel):
     task_name: str
     task_params: dict
+
+
+class TaskScheduleModel(TaskEstimateModel):
     task_skip_cache: bool = False
+    # re-run task querying provider only for combinations which got stale
+    task_refresh: bool = False
+
+
+class PassengersMapModel(BaseModel):
+    adults: int = Field(ge=1)
+    children: List[int] = []
+
+    @field_validator("children")
+    @classmethod
+    def sort_children(cls, value):
+        return sorted(value)
+
+
+class AmadeusPreselectionParamsModel(BaseModel):
+    """
+    Params are normalized into canonical form, so equivalent searches get
+    the same task_id and share cached results.
+    """
+
+    # fields which do not change results, left out of task_id
+    SIGNATURE_EXCLUDE: ClassVar[set] = {"allow_opposite_route"}
+
+    date_from: date
+    date_to: date
+    nights_in_dst_from: int = Field(ge=0)
+    nights_in_dst_to: int = Field(ge=0)
+    passengers_map: PassengersMapModel
+    fly_from_airports: List[str] = Field(min_length=1)
+    fly_to_airports: List[str] = Field(min_length=1)
+    return_from_airports: List[str] = Field(min_length=1)
+    return_to_airports: List[str] = Field(min_length=1)
+    return_from: date
+    return_to: date
+    allow_opposite_route: bool = False
+    currency_code: str = Field(min_length=3, max_length=3)
+    multicity: bool = False
+
+    @field_validator(
+        "fly_from_airports",
+        "fly_to_airports",
+        "return_from_airports",
+        "return_to_airports",
+    )
+    @classmethod
+    def normalize_airports(cls, value):
+        return sorted({i.strip().upper() for i in value})
+
+    @field_validator("currency_code")
+    @classmethod
+    def normalize_currency_code(cls, value):
+        return value.upper()
+
+    @model_validator(mode="after")
+    def normalize_round_trip_airports(self):
+        # round trips are searched only back to departure airport, other
+        # airports are no-op
+        if not self.multicity:
+            origins = sorted(set(self.fly_from_airports) & set(self.return_to_airports))
+            destinations = sorted(
+                set(self.fly_to_airports) & set(self.return_from_airports)
+            )
+            if not origins:
+                raise ValueError("fly_from_airports and return_to_airports differ")
+            if not destinations:
+                raise ValueError("fly_to_airports and return_from_airports differ")
+            self.fly_from_airports = self.return_to_airports = origins
+            self.fly_to_airports = self.return_from_airports = destinations
+        return self
+
+    @model_validator(mode="after")
+    def check_ranges(self):
+        if self.date_to < self.date_from:
+            raise ValueError("date_to is before date_from")
+        if self.return_to < self.return_from:
+            raise ValueError("return_to is before return_from")
+        if self.nights_in_dst_to < self.nights_in_dst_from:
+            raise ValueError("nights_in_dst_to is lower than nights_in_dst_from")
+        return self
+
+
+TASK_PARAMS_MODELS = {
+    consts.Tasks.AMADEUS_PRESELECTION: AmadeusPreselectionParamsModel,
+}
+
+
+def get_task_params(task_name, task_params):
+    """
+    Validates params of tasks having a model, they are sent to the job in
+    their normalized (dumped) form. Other tasks get params as they are.
+    """
+    model = TASK_PARAMS_MODELS.get(task_name)
+    if model is None:
+        return task_params
+
+    try:
+        return model.model_validate(task_params).model_dump(mode="json")
+    except ValidationError as e:
+        raise InvalidTaskParamsException(
+            message="; ".join(
+                f"{'.'.join(str(i) for i in error['loc']) or 'task_params'}: "
+                f"{error['msg']}"
+                for error in e.errors()
+            )
+        )
 
 
 def get_task_id(task_name, task_params):
+    model = TASK_PARAMS_MODELS.get(task_name)
+    if model is not None:
+        task_params = {
+            k: v for k, v in task_params.items() if k not in model.SIGNATURE_EXCLUDE
+        }
     sig = {"task_name": task_name, "task_params": task_params}
     return hashlib.md5(
         json.dumps(sig, sort_keys=True, ensure_ascii=True).encode("utf-8")
     ).hexdigest()
 
 
+def get_task_cost(task_name, task_params):
+    """
+    Estimated number of provider requests, None when it can't be estimated
+    """
+    # runners pull provider clients in, they are imported only when scheduling
+    from ..handlers.tasks.runners import amadeus_preselection
+
+    estimators = {consts.Tasks.AMADEUS_PRESELECTION: amadeus_preselection.get_task_cost}
+    if task_name not in estimators:
+        return None
+
+    try:
+        return estimators[task_name](task_params)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def get_task_lane(task_cost):
+    if task_cost is not None and task_cost > settings.JOBS_BULK_TASK_COST_THRESHOLD:
+        return consts.TaskLane.BULK
+    return consts.TaskLane.INTERACTIVE
+
+
+def get_task_queue_name(task_lane):
+    if task_lane == consts.TaskLane.BULK:
+        return settings.JOBS_BULK_QUEUE_NAME
+    return settings.JOBS_QUEUE_NAME
+
+
+def get_task_eta(task_name, task_cost, task_lane):
+    """
+    Estimated seconds of provider requests, None when it can't be estimated
+    """
+    from ..handlers.tasks.runners import amadeus_preselection
+
+    estimators = {
+        consts.Tasks.AMADEUS_PRESELECTION: (
+            amadeus_preselection.get_latency,
+            amadeus_preselection.get_task_eta,
+        )
+    }
+    if task_cost is None or task_name not in estimators:
+        return None
+
+    get_latency, get_eta = estimators[task_name]
+    try:
+        latency = get_latency(AWSServiceAdapter())
+    except ClientError:
+        latency = settings.AMADEUS_ESTIMATED_REQUEST_LATENCY
+    return round(get_eta(task_cost, task_lane, latency), 2)
+
+
+def get_task_shards(task_name, task_params):
+    from ..handlers.tasks.runners import amadeus_preselection
+
+    sharders = {consts.Tasks.AMADEUS_PRESELECTION: amadeus_preselection.get_task_shards}
+    if task_name not in sharders:
+        return None
+    return sharders[task_name](task_params, max_cost=settings.TASKS_MAX_COST)
+
+
+def find_subsuming_task(task_name, task_params):
+    """
+    Id of a completed task covering search space of given one, None when
+    there is none or task type does not support it. Only snapshots can
+    serve a subsumed task, so there is nothing to look up without them.
+    """
+    from ..handlers.tasks.runners import amadeus_preselection
+
+    finders = {
+        consts.Tasks.AMADEUS_PRESELECTION: amadeus_preselection.find_subsuming_task
+    }
+    if not (settings.JOBS_SUBSUMPTION_ENABLED and settings.JOBS_SNAPSHOTS_ENABLED):
+        return None
+    if task_name not in finders:
+        return None
+    return finders[task_name](AWSServiceAdapter(), task_params)
+
+
+def is_task_over_cost(task_cost):
+    return (
+        bool(settings.TASKS_MAX_COST)
+        and task_cost is not None
+        and task_cost > settings.TASKS_MAX_COST
+    )
+
+
+def get_admitted_shards(task_name, task_params, task_cost):
+    """
+    Admission control for tasks over TASKS_MAX_COST: they are either rejected
+    or split into shards scheduled as separate tasks, depending on policy.
+    """
+    shards = None
+    if settings.TASKS_OVER_COST_POLICY == consts.TaskOverCostPolicy.SHARD:
+        shards = get_task_shards(task_name, task_params)
+
+    if shards is None:
+        raise TaskCostExceededException(
+            message=f"Task needs {task_cost} provider requests, "
+            f"allowed: {settings.TASKS_MAX_COST}"
+        )
+    return shards
+
+
+@router.post("/tasks/estimate", tags=["tasks"], response_class=ORJSONResponse)
+async def handler_task_estimate(
+    task: TaskEstimateModel, key: str = Depends(auth.api_key_header_scheme)
+):
+    """
+    Number of provider requests task needs and seconds they should take,
+    without scheduling it. task_shards is number of tasks it would be split
+    into and None when task is scheduled as it is.
+    """
+    auth.check(value=key)
+    task_params = get_task_params(task.task_name, task.task_params)
+    task_cost = get_task_cost(task.task_name, task_params)
+    task_lane = get_task_lane(task_cost)
+
+    task_admitted = True
+    task_shards = None
+    if is_task_over_cost(task_cost):
+        try:
+            task_shards = len(get_admitted_shards(task.task_name, task_params, task_cost))
+        except TaskCostExceededException:
+            task_admitted = False
+
+    return {
+        "task_cost": task_cost,
+        "task_lane": task_lane,
+        "task_eta_seconds": get_task_eta(task.task_name, task_cost, task_lane),
+        "task_max_cost": settings.TASKS_MAX_COST,
+        "task_admitted": task_admitted,
+        "task_shards": task_shards,
+    }
+
+
+async def send_task(aws, queue_url, message, task_cost):
+    r = queues.get_queue_backend(aws).send_json_message(queue_url, message)
+
+    if settings.use_localstack and settings.JOBS_INLINE_EXECUTOR:
+        logger.info(f"[LOCALSTACK] Running using local executor {message=}")
+        from ..handlers.tasks.jobs import async_handler as executor
+        from ..handlers.tasks.jobs import get_sqs_mock_data
+
+        await executor(*get_sqs_mock_data(**message))
+
+    logger.info(
+        f"Successfully scheduled message with id={r['MessageId']}, "
+        f"{message=}, {queue_url=}, {task_cost=}"
+    )
+
+
+def is_results_stale(aws, task_id, partition):
+    if not settings.JOBS_RESULTS_SOFT_TTL:
+        return False
+
+    age = aws.s3_get_obj_age(
+        bucket=settings.JOBS_BUCKET, key=aws.key_results(task_id, partition)
+    )
+    return age is not None and age >= settings.JOBS_RESULTS_SOFT_TTL
+
+
+async def revalidate_task(aws, task, task_id, task_params, task_cost):
+    """
+    Enqueues refresh of cached results which are served meanwhile. Refreshed
+    results land in today's partition, so they are picked up once READY.
+    Revalidations are coalesced per task_id, see helpers.revalidation.
+    """
+    partition = aws.key_partition()
+    task_lane = get_task_lane(task_cost)
+
+    async def send(revalidation_id):
+        queue_url = queues.get_queue_backend(aws).get_queue_url(
+            get_task_queue_name(task_lane)
+        )
+        message = {
+            "task_id": task_id,
+            "task_name": task.task_name,
+            "task_params": task_params,
+            "task_lane": task_lane,
+            "task_refresh": True,
+            "task_partition": partition,
+            "task_source_id": None,
+            "task_revalidate": True,
+            "task_revalidation_id": revalidation_id,
+        }
+        await send_task(aws, queue_url, message, task_cost)
+
+    revalidated = await revalidation.enqueue(aws, task_id, partition, send)
+    if not revalidated:
+        logger.info(f"Revalidation of {task.task_name} in progress. {task_id=}")
+    return revalidated
+
+
+def put_popularity(aws, task, task_id, task_params, partition):
+    try:
+        aws.s3_put_obj(
+            bucket=settings.JOBS_BUCKET,
+            key=aws.key_popularity(task_id, uuid.uuid4().hex, partition),
+            body=orjson.dumps(
+                {"task_name": task.task_name, "task_params": task_params}
+            ),
+        )
+    except Exception:
+        logger.warning(f"Could not track popularity of {task_id=}", exc_info=True)
+
+
+def track_popularity(aws, task, task_id, task_params):
+    """
+    Records schedule request for cache warmer, best effort. Object is put
+    in a thread the response does not wait for, in Lambda it may complete
+    in a following invocation or be lost along with the container.
+    """
+    if not settings.JOBS_POPULARITY_TRACKING:
+        return
+
+    tracking = asyncio.ensure_future(
+        asyncio.to_thread(
+            put_popularity, aws, task, task_id, task_params, aws.key_partition()
+        )
+    )
+    popularity_tracking.add(tracking)
+    tracking.add_done_callback(popularity_tracking.discard)
+
+
+async def schedule_task(aws, task, task_id, task_params, task_cost):
+    track_popularity(aws, task, task_id, task_params)
+    cached_partition = None
+    task_source_id = None
+    if not (task.task_skip_cache or task.task_refresh):
+        cached_partition = aws.s3_find_partition(
+            bucket=settings.JOBS_BUCKET,
+            key_func=functools.partial(aws.key_results, task_id),
+        )
+        if cached_partition is None:
+            task_source_id = find_subsuming_task(task.task_name, task_params)
+        metrics.emit(
+            {
+                "CacheRequests": 1,
+                "CacheHits": int(cached_partition is not None),
+                "CacheSubsumedHits": int(task_source_id is not None),
+            },
+            dimensions={"TaskName": task.task_name},
+        )
+
+    if cached_partition is not None:
+        logger.info(f"Served {task.task_name} task results from cache. {task_id=}")
+        if is_results_stale(aws, task_id, cached_partition):
+            revalidated = await revalidate_task(
+                aws, task, task_id, task_params, task_cost
+            )
+            metrics.emit(
+                {"CacheStaleHits": 1, "CacheRevalidations": int(revalidated)},
+                dimensions={"TaskName": task.task_name},
+            )
+        return aws.s3_generate_presigned_url(
+            bucket=settings.JOBS_BUCKET,
+            key=aws.key_results(task_id, cached_partition),
+        )
+
+    # subsumed task still re-queries combinations missing in source snapshot,
+    # so it is routed by its own cost
+    task_lane = get_task_lane(task_cost)
+    queue_url = queues.get_queue_backend(aws).get_queue_url(
+        get_task_queue_name(task_lane)
+    )
+    partition = aws.key_partition()
+    message = {
+        "task_id": task_id,
+        "task_name": task.task_name,
+        "task_params": task_params,
+        "task_lane": task_lane,
+        "task_refresh": task.task_refresh,
+        "task_partition": partition,
+        "task_source_id": task_source_id,
+    }
+    aws.s3_put_json_obj(
+        bucket=settings.JOBS_BUCKET,
+        key=aws.key_results(task_id, partition),
+        message={"status": consts.TaskStatus.SCHEDULED, "results": None},
+    )
+    await send_task(aws, queue_url, message, task_cost)
+    return aws.s3_generate_presigned_url(
+        bucket=settings.JOBS_BUCKET, key=aws.key_results(task_id, partition)
+    )
+
+
 @router.post("/tasks/schedule", tags=["tasks"], response_class=ORJSONResponse)
 async def handler_task_schedule(
     task: TaskScheduleModel, key: str = Depends(auth.api_key_header_scheme)
@@ -37,79 +455,145 @@ async def handler_task_schedule(
     later on results can be fetched by:
     1. using S3 presigned task_results_url
     2. using task_id to call /tasks/{task_id}/status API
+    Tasks over TASKS_MAX_COST are rejected or, with shard policy, scheduled
+    as task_shards each having its own task_id and task_results_url, task_id
+    of sharded task is null as nothing is stored under it.
     """
     auth.check(value=key)
-    try:
-        task_id = get_task_id(task.task_name, task.task_params)
+    task_params = get_task_params(task.task_name, task.task_params)
+    task_cost = get_task_cost(task.task_name, task_params)
+    task_id = get_task_id(task.task_name, task_params)
+
+    shards = None
+    if is_task_over_cost(task_cost):
+        shards = get_admitted_shards(task.task_name, task_params, task_cost)
 
+    try:
         aws = AWSServiceAdapter()
-        should_use_cache = not task.task_skip_cache and aws.s3_check_key_exists(
-            bucket=settings.JOBS_BUCKET, key=aws.key_results(task_id)
-        )
-        if should_use_cache:
-            task_results_url = aws.s3_generate_presigned_url(
-                bucket=settings.JOBS_BUCKET, key=aws.key_results(task_id)
+        if shards is None:
+            task_results_url = await schedule_task(
+                aws, task, task_id, task_params, task_cost
             )
-            logger.info(f"Served {task.task_name} task results from cache. {task_id=}")
-        else:
-            url = aws.sqs_get_queue_url(settings.JOBS_QUEUE_NAME)
-            message = {
-                "task_id": task_id,
-                "task_name": task.task_name,
-                "task_params": task.task_params,
-            }
-            aws.s3_put_json_obj(
-                bucket=settings.JOBS_BUCKET,
-                key=aws.key_results(task_id),
-                message={"status": consts.TaskStatus.SCHEDULED, "results": None},
-            )
-            r = aws.sqs_send_json_message(queue_url=url, message=message)
-
-            if settings.use_localstack:
-                logger.info(f"[LOCALSTACK] Running using local executor {message=}")
-                from ..handlers.tasks.jobs import async_handler as executor
-                from ..handlers.tasks.jobs import get_sqs_mock_data
-
-                await executor(*get_sqs_mock_data(**message))
+            return {"task_id": task_id, "task_results_url": task_results_url}
 
-            task_results_url = aws.s3_generate_presigned_url(
-                bucket=settings.JOBS_BUCKET, key=aws.key_results(task_id)
-            )
-            logger.info(
-                f"Successfully scheduled message with id={r['MessageId']}, "
-                f"body={task.model_dump_json()}, queue={settings.JOBS_QUEUE_NAME}"
+        task_shards = []
+        for shard_params in shards:
+            shard_id = get_task_id(task.task_name, shard_params)
+            shard_cost = get_task_cost(task.task_name, shard_params)
+            task_shards.append(
+                {
+                    "task_id": shard_id,
+                    "task_results_url": await schedule_task(
+                        aws, task, shard_id, shard_params, shard_cost
+                    ),
+                }
             )
     except ClientError as e:
         logger.error(e, exc_info=True)
         raise HTTPException(status_code=400)
 
-    return {"task_id": task_id, "task_results_url": task_results_url}
+    logger.info(f"Sharded {task.task_name} task {task_id=} into {len(shards)} tasks")
+    return {"task_id": None, "task_results_url": None, "task_shards": task_shards}
+
+
+def get_quality(params):
+    for param in params:
+        name, _, value = param.partition("=")
+        if name.strip() == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def accepts_gzip(accept_encoding):
+    # explicit gzip entry takes precedence over wildcard, q=0 rejects coding
+    qualities = {}
+    for value in accept_encoding.lower().split(","):
+        coding, *params = [i.strip() for i in value.split(";")]
+        qualities.setdefault(coding, get_quality(params))
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
+def get_raw_status_response(task_id):
+    """
+    Streams stored gzip bytes of task meta straight from S3, without
+    decompressing and parsing them. Status fields which are part of the
+    regular response body are sent as X-Task-* headers instead.
+    """
+    try:
+        aws = AWSServiceAdapter()
+        _, r = aws.s3_get_partitioned(
+            bucket=settings.JOBS_BUCKET,
+            key_func=functools.partial(aws.key_results, task_id),
+            getter=aws.s3_get_obj,
+        )
+    except ClientError:
+        # fallback to regular response, which handles missing results
+        return None
+
+    headers = {
+        "Content-Encoding": "gzip",
+        "X-Task-Id": task_id,
+        "X-Task-Bucket": settings.JOBS_BUCKET,
+        "X-Task-Processed": "true",
+    }
+    if "ContentLength" in r:
+        headers["Content-Length"] = str(r["ContentLength"])
+
+    return StreamingResponse(
+        r["Body"].iter_chunks(), media_type="application/json", headers=headers
+    )
 
 
 @router.get("/tasks/{task_id}/status", tags=["tasks"], response_class=ORJSONResponse)
-async def handler_task_status(task_id, key: str = Depends(auth.api_key_header_scheme)):
+async def handler_task_status(
+    task_id,
+    price_matrix: bool = False,
+    raw: bool = False,
+    accept_encoding: str = Header(""),
+    key: str = Depends(auth.api_key_header_scheme),
+):
     """
     For computation heavy jobs rely on presigned url returned as task_results_url
     - its contents are served by S3 and are gzipped which makes it more handy.
+    With price_matrix=true cheapest prices per dates and airports are included.
+    With raw=true clients accepting gzip get stored meta document as is,
+    see get_raw_status_response. Behind API Gateway they also send
+    Accept: application/gzip, so the binary body is passed through.
     """
     auth.check(value=key)
     obj = None
+    matrix = None
+
+    if raw and accepts_gzip(accept_encoding):
+        response = get_raw_status_response(task_id)
+        if response is not None:
+            return response
 
     try:
         aws = AWSServiceAdapter()
-        obj = aws.s3_get_json_obj(
-            bucket=settings.JOBS_BUCKET, key=aws.key_results(task_id)
+        partition, obj = aws.s3_get_partitioned(
+            bucket=settings.JOBS_BUCKET,
+            key_func=functools.partial(aws.key_results, task_id),
+            getter=aws.s3_get_json_obj,
         )
         logger.info(
             f"Successfully downloaded results for task_id={task_id} "
             f"from bucket={settings.JOBS_BUCKET}"
         )
-    except client_s3.exceptions.NoSuchKey:
+        if price_matrix:
+            matrix = aws.s3_get_json_obj(
+                bucket=settings.JOBS_BUCKET,
+                key=aws.key_price_matrix(task_id, partition),
+            )
+    except get_client_s3().exceptions.NoSuchKey:
         logger.info(f"Results for task_id={task_id} are not available")
     except ClientError as e:
         logger.error(e, exc_info=True)
 
-    return {
+    response = {
         "task_id": task_id,
         "bucket": settings.JOBS_BUCKET,
         "processed": obj is not None,
@@ -117,3 +601,63 @@ async def handler_task_status(task_id, key: str = Depends(auth.api_key_header_sc
         if not obj
         else obj,
     }
+    if price_matrix:
+        response["price_matrix"] = matrix
+    return response
+
+
+def iter_results_page(aws, task_id, partition, index, offset, limit):
+    chunks, skip = ndjson_page_chunks(index, offset, limit)
+    if not chunks:
+        return
+
+    start = chunks[0][0]
+    end = chunks[-1][0] + chunks[-1][1] - 1
+    body = aws.s3_get_obj_range(
+        bucket=settings.JOBS_BUCKET,
+        # indexes written before pages were versioned have no version
+        key=aws.key_results_ndjson(task_id, partition, index.get("version")),
+        start=start,
+        end=end,
+    )
+
+    for _, length, _ in chunks:
+        lines = gzip.decompress(body.read(length)).splitlines(keepends=True)
+        for line in lines[skip : skip + limit]:  # noqa: E203
+            yield line
+        limit -= len(lines[skip : skip + limit])  # noqa: E203
+        skip = 0
+
+
+@router.get("/tasks/{task_id}/results", tags=["tasks"])
+async def handler_task_results(
+    task_id,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=settings.JOBS_RESULTS_PAGE_LIMIT),
+    key: str = Depends(auth.api_key_header_scheme),
+):
+    """
+    Streams page of task results as NDJSON, only chunks covering requested
+    page are fetched from S3. Total number of results is in X-Total-Count.
+    """
+    auth.check(value=key)
+
+    try:
+        aws = AWSServiceAdapter()
+        partition, index = aws.s3_get_partitioned(
+            bucket=settings.JOBS_BUCKET,
+            key_func=functools.partial(aws.key_results_index, task_id),
+            getter=functools.partial(aws.s3_get_json_obj, gzipped=False),
+        )
+    except get_client_s3().exceptions.NoSuchKey:
+        logger.info(f"Results for task_id={task_id} are not available")
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+    except ClientError as e:
+        logger.error(e, exc_info=True)
+        raise HTTPException(status_code=400)
+
+    return StreamingResponse(
+        iter_results_page(aws, task_id, partition, index, offset, limit),
+        media_type="application/x-ndjson",
+        headers={"X-Total-Count": str(index["total"])},
+    )
@@ -1,4 +1,5 @@
 import asyncio
+import gzip
 import logging
 import logging.config
 import time
@@ -7,9 +8,9 @@ import uuid
 import orjson
 
 from ...conf import settings
-from ...helpers import consts
+from ...helpers import columnar, consts, executors, metrics, profiling, revalidation
 from ...helpers.aws import AWSServiceAdapter
-from ...helpers.utils import bytesto
+from ...helpers.utils import bytesto, ndjson_gzip_lines, ndjson_lines
 from .runners import amadeus_preselection
 
 loop = asyncio.get_event_loop()
@@ -20,29 +21,124 @@ logging.config.dictConfig(settings.LOG_CONFIG)
 from ...core import sentry
 
 
-async def run_job(task_id, task_name, task_params):
+async def run_job(
+    task_id,
+    task_name,
+    task_params,
+    task_lane,
+    task_refresh,
+    task_partition,
+    task_source_id=None,
+    profiler=None,
+):
     handlers = {consts.Tasks.AMADEUS_PRESELECTION: amadeus_preselection.handler}
-    return await handlers[task_name](task_id, task_params)
+    return await handlers[task_name](
+        task_id,
+        task_params,
+        task_lane=task_lane,
+        task_refresh=task_refresh,
+        task_partition=task_partition,
+        task_source_id=task_source_id,
+        profiler=profiler,
+    )
+
+
+def store_columnar_results(service, task_id, task_name, task_partition, results):
+    flatteners = {consts.Tasks.AMADEUS_PRESELECTION: amadeus_preselection.flatten_result}
+    fmt = settings.JOBS_RESULTS_COLUMNAR_FORMAT
+    if not fmt or task_name not in flatteners:
+        return
+
+    try:
+        rows = [
+            {"task_id": task_id, **flatteners[task_name](result)} for result in results
+        ]
+        service.s3_put_obj(
+            bucket=settings.JOBS_BUCKET,
+            key=service.key_results_columnar(task_id, fmt, task_partition),
+            body=columnar.dumps(rows, fmt=fmt),
+        )
+    except Exception:
+        # json results are the source of truth, analytics output is best effort
+        logger.error(f"[JOB-COLUMNAR-ERROR] {task_name=}, {task_id=}", exc_info=True)
+
+
+def delete_results_pages(service, task_id, task_partition):
+    """
+    NDJSON pages of previous run are served from any candidate partition
+    until deleted, so they are removed as soon as task is PENDING again.
+    Index is enough to stop serving them, versioned pages it names are
+    left for partition purge.
+    """
+    partitions = dict.fromkeys([task_partition, *service.key_partitions()])
+    service.s3_delete_objects(
+        bucket=settings.JOBS_BUCKET,
+        items=[
+            key_func(task_id, partition)
+            for partition in partitions
+            for key_func in (service.key_results_index, service.key_results_ndjson)
+        ],
+    )
+
+
+def log_memory(profiler, task_name, task_id):
+    stats = profiler.stats
+    logger.info(f"[JOB-MEMORY] {task_name=}, {task_id=}, {stats=}")
+    for line in profiler.top_allocations:
+        logger.info(f"[JOB-MEMORY][{profiler.top_phase}] {line}")
+    metrics.emit(
+        {"JobRssDelta": stats["rss_delta_mb"]},
+        dimensions={"TaskName": task_name},
+        unit="Megabytes",
+    )
 
 
 async def async_handler(event, context):
     service = AWSServiceAdapter()
-    messages = service.sqs_get_messages(event)
     tic = time.time()
-    for message in messages:
-        body = message["body"]
+    for record in event["Records"]:
+        # undecodable message, e.g. of expired claim check, skips only itself
+        try:
+            body = service.sqs_get_message(record)["body"]
+        except Exception:
+            logger.error(
+                f"[JOB-ERROR] could not decode {record['messageId']=}", exc_info=True
+            )
+            continue
+
         task_id = body["task_id"]
         task_name = body["task_name"]
         task_params = body["task_params"]
+        task_lane = body.get("task_lane", consts.TaskLane.INTERACTIVE)
+        task_refresh = body.get("task_refresh", False)
+        # messages sent before keys were partitioned use flat layout
+        task_partition = body.get("task_partition", "")
+        task_source_id = body.get("task_source_id")
+        # revalidated results are served until the new ones are READY
+        task_revalidate = body.get("task_revalidate", False)
+        task_revalidation_id = body.get("task_revalidation_id")
+        profiler = profiling.MemoryProfiler()
+        profiler.start()
         try:
-            logger.info(f"[JOB-STARTED] {task_name=}, {task_id=}, {task_params=}")
-            service.s3_put_json_obj(
-                bucket=settings.JOBS_BUCKET,
-                key=service.key_results(task_id),
-                message={"status": consts.TaskStatus.PENDING, "results": None},
+            logger.info(
+                f"[JOB-STARTED] {task_name=}, {task_id=}, {task_lane=}, {task_params=}"
             )
+            if not task_revalidate:
+                service.s3_put_json_obj(
+                    bucket=settings.JOBS_BUCKET,
+                    key=service.key_results(task_id, task_partition),
+                    message={"status": consts.TaskStatus.PENDING, "results": None},
+                )
+                delete_results_pages(service, task_id, task_partition)
             results = await run_job(
-                task_name=task_name, task_id=task_id, task_params=task_params
+                task_name=task_name,
+                task_id=task_id,
+                task_params=task_params,
+                task_lane=task_lane,
+                task_refresh=task_refresh,
+                task_partition=task_partition,
+                task_source_id=task_source_id,
+                profiler=profiler,
             )
         except Exception:
             total_time = f'{float("%.2f" % (time.time() - tic,))}s'
@@ -50,40 +146,113 @@ async def async_handler(event, context):
                 f"[JOB-ERROR] after {total_time} {task_name=}, {task_id=}, {task_params=}",
                 exc_info=True,
             )
-            service.s3_put_json_obj(
-                bucket=settings.JOBS_BUCKET,
-                key=service.key_results(task_id),
-                message={"status": consts.TaskStatus.ERROR, "results": None},
-            )
+            if not task_revalidate:
+                service.s3_put_json_obj(
+                    bucket=settings.JOBS_BUCKET,
+                    key=service.key_results(task_id, task_partition),
+                    message={"status": consts.TaskStatus.ERROR, "results": None},
+                )
         else:
             total_time = f'{float("%.2f" % (time.time() - tic,))}s'
-            total_size = round(bytesto(len(orjson.dumps(results)), "m"), 2)
-            logger.info(
-                f"[JOB-SUCCESSFUL] after {total_time}, size: {total_size}MB {task_name=}, {task_id=}, {task_params=}"
-            )
-            service.s3_put_json_obj(
-                bucket=settings.JOBS_BUCKET,
-                key=service.key_results(task_id),
-                message={"status": consts.TaskStatus.READY, "results": results},
-            )
+            with profiler.phase("serialize"):
+                # results are serialized and compressed once off event loop,
+                # size is taken from the same bytes that are uploaded, only
+                # serialized bytes are passed to process pool
+                body = await executors.run_cpu_bound(
+                    orjson.dumps,
+                    {"status": consts.TaskStatus.READY, "results": results},
+                    threaded=True,
+                )
+                size = len(body)
+                body = await executors.run_cpu_bound(gzip.compress, body)
+                total_size = round(bytesto(size, "m"), 2)
+                logger.info(
+                    f"[JOB-SUCCESSFUL] after {total_time}, size: {total_size}MB "
+                    f"{task_name=}, {task_id=}, {task_params=}"
+                )
+                await asyncio.to_thread(
+                    store_columnar_results,
+                    service,
+                    task_id,
+                    task_name,
+                    task_partition,
+                    results,
+                )
+                if settings.JOBS_RESULTS_NDJSON_ENABLED:
+                    lines = await executors.run_cpu_bound(
+                        ndjson_lines, results, threaded=True
+                    )
+                    payload, index = await executors.run_cpu_bound(
+                        ndjson_gzip_lines,
+                        lines,
+                        settings.JOBS_RESULTS_NDJSON_CHUNK_SIZE,
+                    )
+                    # pages of a revalidated task are replaced by a new version,
+                    # index pointing to it is written last, so pages being read
+                    # meanwhile stay consistent with the index read before
+                    index["version"] = uuid.uuid4().hex
+                    await asyncio.to_thread(
+                        service.s3_put_obj,
+                        bucket=settings.JOBS_BUCKET,
+                        key=service.key_results_ndjson(
+                            task_id, task_partition, index["version"]
+                        ),
+                        body=payload,
+                    )
+                    await asyncio.to_thread(
+                        service.s3_put_json_obj,
+                        bucket=settings.JOBS_BUCKET,
+                        key=service.key_results_index(task_id, task_partition),
+                        message=index,
+                        gzipped=False,
+                    )
+                await asyncio.to_thread(
+                    service.s3_put_obj,
+                    bucket=settings.JOBS_BUCKET,
+                    key=service.key_results(task_id, task_partition),
+                    body=body,
+                )
+        finally:
+            log_memory(profiler, task_name, task_id)
+            profiler.stop()
+            if task_revalidate:
+                revalidation.release(
+                    service, task_id, task_partition, task_revalidation_id
+                )
 
 
 def handler(event, context):
     return loop.run_until_complete(async_handler(event, context))
 
 
-def get_sqs_mock_data(task_id, task_name, task_params=None):
+def get_sqs_mock_data(
+    task_id,
+    task_name,
+    task_params=None,
+    task_lane=consts.TaskLane.INTERACTIVE,
+    task_refresh=False,
+    task_partition="",
+    task_source_id=None,
+    task_revalidate=False,
+    task_revalidation_id=None,
+):
     body = {
         "task_id": task_id,
         "task_name": task_name,
         "task_params": task_params or {},
+        "task_lane": task_lane,
+        "task_refresh": task_refresh,
+        "task_partition": task_partition,
+        "task_source_id": task_source_id,
+        "task_revalidate": task_revalidate,
+        "task_revalidation_id": task_revalidation_id,
     }
     mock_event = {
         "Records": [
             {
                 "messageId": "883c7223-233e-4d14-b8e9-b4b77f7ff3a1",
                 "receiptHandle": "AQEBS8qJkXb2kVD/H3xvapFNO1fmzcsNNnWoV0S2MX6/6Hei7SY3iVmmoWutnFj2rgQ3nhOwVyxBsCwTLhRaCIwMz5pKRn/Z12aulsLaHiZVUDrtQW/CDVZQ+dOt5K5Ya6JDUsUHPUrQJZbHB2WTYge49DGMBeqp1uhDbkLsHXEniNTUxwpQb3c0kjxVKL1qsT5drYaAAzJzrhJ3ceZTAJG3FpJJX/AxkXah6LYcoD8hE641N71bQScmWxoNg7MzKmaKaTr+0U4eTeHBzfKTeNz+SKt9OmPBujPyTzndLSUI8MQTS9PbRdvNVen3vRFW31s/ehhmMeHyjdqfUemO7wh3p9um3DL/yyGoZNd+GyLKJM8IQKSN4akKyO56xJxdgaLioxMupD092wTjDHM8Gfld1Q6JsXAzS93QhCik+LMc0j8=",
-                "body": orjson.dumps(body).decode("utf-8"),
+                "body": AWSServiceAdapter().sqs_encode_message(body),
                 "attributes": {
                     "ApproximateReceiveCount": "1",
                     "AWSTraceHeader": "Root=1-65e0a2fb-6521427f4163fad0509b28b7;Parent=7e527bd640e29f6a;Sampled=0;Lineage=30bde1ac:0",
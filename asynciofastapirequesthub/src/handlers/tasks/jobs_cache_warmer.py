@@ -0,0 +1,160 @@
+import asyncio
+import collections
+import functools
+import logging
+import logging.config
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from ...conf import settings
+from ...helpers import consts, queues, revalidation
+from ...helpers.aws import AWSServiceAdapter
+from .runners import amadeus_preselection
+
+loop = asyncio.get_event_loop()
+logger = logging.getLogger(__name__)
+logging.config.dictConfig(settings.LOG_CONFIG)
+
+
+from ...core import sentry
+
+
+def get_popularity(service):
+    """
+    Number of schedule requests per task_id within partitions still kept,
+    along with a key of one of them to read task params from.
+    """
+    counts = collections.Counter()
+    keys = {}
+    for partition in service.key_partitions():
+        prefix = service.key_popularity_prefix(partition)
+        for data in service.s3_get_obj_iterator(
+            bucket=settings.JOBS_BUCKET, prefix=prefix
+        ):
+            for el in data.get("Contents") or []:
+                task_id = el["Key"][len(prefix) :].rsplit("-", 1)[0]  # noqa: E203
+                counts[task_id] += 1
+                keys.setdefault(task_id, el["Key"])
+    return counts, keys
+
+
+def get_task_cost(task_name, task_params):
+    estimators = {consts.Tasks.AMADEUS_PRESELECTION: amadeus_preselection.get_task_cost}
+    if task_name not in estimators:
+        return None
+    return estimators[task_name](task_params)
+
+
+def is_warm(service, task_id):
+    partition = service.s3_find_partition(
+        bucket=settings.JOBS_BUCKET,
+        key_func=functools.partial(service.key_results, task_id),
+    )
+    if partition is None:
+        return False
+
+    age = service.s3_get_obj_age(
+        bucket=settings.JOBS_BUCKET, key=service.key_results(task_id, partition)
+    )
+    # warm until the next run, so peak requests do not get stale results
+    return (
+        age is not None
+        and age + settings.JOBS_WARMER_INTERVAL < settings.JOBS_RESULTS_SOFT_TTL
+    )
+
+
+def get_spent(service, day):
+    try:
+        spend = service.s3_get_json_obj(
+            bucket=settings.JOBS_BUCKET,
+            key=service.key_warmer_spend(day),
+            gzipped=False,
+        )
+    except ClientError:
+        return 0
+    return spend["spent"]
+
+
+async def async_handler(event, context):
+    """
+    Refreshes most scheduled tasks in bulk lane every JOBS_WARMER_INTERVAL
+    through the day, so peak-time requests hit results within soft TTL.
+    Tasks are refreshed as revalidations, cached results are served until
+    new ones are ready. JOBS_WARMER_BUDGET is shared by all runs of a day,
+    spend of previous ones is read from S3.
+    """
+    service = AWSServiceAdapter()
+    counts, keys = get_popularity(service)
+    queue = queues.get_queue_backend(service)
+    queue_url = queue.get_queue_url(settings.JOBS_BULK_QUEUE_NAME)
+    partition = service.key_partition()
+    day = datetime.now(timezone.utc).strftime(service.PARTITION_FORMAT)
+    spent = get_spent(service, day)
+    available = max(settings.JOBS_WARMER_BUDGET - spent, 0)
+    budget = available
+    stats = {
+        "tracked": len(counts),
+        "warm": 0,
+        "warmed": 0,
+        "revalidating": 0,
+        "skipped": 0,
+    }
+
+    for task_id, count in counts.most_common(settings.JOBS_WARMER_TOP_TASKS):
+        if is_warm(service, task_id):
+            stats["warm"] += 1
+            continue
+
+        task = service.s3_get_json_obj(
+            bucket=settings.JOBS_BUCKET, key=keys[task_id], gzipped=False
+        )
+        task_cost = get_task_cost(task["task_name"], task["task_params"])
+        if task_cost is None or task_cost > budget:
+            stats["skipped"] += 1
+            continue
+
+        async def send(revalidation_id):
+            queue.send_json_message(
+                queue_url,
+                {
+                    "task_id": task_id,
+                    "task_name": task["task_name"],
+                    "task_params": task["task_params"],
+                    "task_lane": consts.TaskLane.BULK,
+                    "task_refresh": True,
+                    "task_partition": partition,
+                    "task_source_id": None,
+                    "task_revalidate": True,
+                    "task_revalidation_id": revalidation_id,
+                },
+            )
+
+        # revalidation enqueued by schedule request is already refreshing it
+        if not await revalidation.enqueue(service, task_id, partition, send):
+            stats["revalidating"] += 1
+            continue
+
+        budget -= task_cost
+        stats["warmed"] += 1
+        logger.info(f"[CACHE-WARMER] enqueued {task_id=}, {count=}, {task_cost=}")
+
+    stats["spent"] = available - budget
+    if stats["spent"]:
+        # single instance runs at a time, see reservedConcurrency
+        service.s3_put_json_obj(
+            bucket=settings.JOBS_BUCKET,
+            key=service.key_warmer_spend(day),
+            message={"spent": spent + stats["spent"]},
+            gzipped=False,
+        )
+    logger.info(f"[CACHE-WARMER] {stats=}, spent_today={spent + stats['spent']}")
+    return stats
+
+
+def handler(event, context):
+    return loop.run_until_complete(async_handler(event, context))
+
+
+if __name__ == "__main__":
+    handler(None, None)
@@ -0,0 +1,42 @@
+import asyncio
+import logging
+import logging.config
+import time
+
+import httpx
+
+from ...conf import settings
+from ...helpers import fx
+from ...helpers.aws import AWSServiceAdapter
+
+loop = asyncio.get_event_loop()
+logger = logging.getLogger(__name__)
+logging.config.dictConfig(settings.LOG_CONFIG)
+
+
+from ...core import sentry
+
+
+async def async_handler(event, context):
+    """
+    Stores ECB reference rates used to convert offers searched in
+    TASKS_BASE_CURRENCY, previous table is kept when fetching fails.
+    """
+    async with httpx.AsyncClient() as client:
+        rates = await fx.fetch_rates(client)
+
+    service = AWSServiceAdapter()
+    service.s3_put_json_obj(
+        bucket=settings.JOBS_BUCKET,
+        key=service.key_fx_rates(),
+        message={"rates": rates, "updated_at": time.time()},
+    )
+    logger.info(f"[FX] stored rates of {len(rates)} currencies")
+
+
+def handler(event, context):
+    return loop.run_until_complete(async_handler(event, context))
+
+
+if __name__ == "__main__":
+    handler(None, None)
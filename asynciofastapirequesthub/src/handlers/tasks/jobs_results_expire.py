@@ -1,11 +1,11 @@
 import asyncio
 import logging
 import logging.config
-from datetime import datetime, timezone
+import time
+from datetime import datetime, timedelta, timezone
 
 from ...conf import settings
 from ...helpers.aws import AWSServiceAdapter
-from ...helpers.utils import by_chunk
 
 loop = asyncio.get_event_loop()
 logger = logging.getLogger(__name__)
@@ -14,39 +14,122 @@ logging.config.dictConfig(settings.LOG_CONFIG)
 
 from ...core import sentry
 
+DELETE_BATCH_SIZE = 1000
 
-async def async_handler(event, context):
-    service = AWSServiceAdapter()
-    iterator = service.s3_get_obj_iterator(bucket=settings.JOBS_BUCKET)
 
-    total = 0
-    to_delete = []
-    now = datetime.now(timezone.utc)
+class Purge:
+    """
+    Streams listed keys into delete_objects batches, which are sent
+    concurrently while listing continues.
+    """
+
+    def __init__(self, service, bucket, now):
+        self.service = service
+        self.bucket = bucket
+        self.now = now
+        self.batch = []
+        self.pending = set()
+        self.semaphore = asyncio.Semaphore(settings.JOBS_EXPIRE_DELETE_CONCURRENCY)
+        self.stats = {"listed": 0, "deleted": 0, "partitions": 0}
 
-    for data in iterator:
-        contents = data.get("Contents")
-        if not contents:
-            continue
+    def is_expired(self, last_modified, expire=None):
+        if expire is None:
+            expire = settings.JOBS_RESULTS_EXPIRE
+        return (self.now - last_modified).total_seconds() >= expire
 
-        total += len(contents)
+    def is_partition_expired(self, partition_date):
+        # last object of partition could be written at the end of its day
+        partition_end = partition_date.replace(tzinfo=timezone.utc) + timedelta(days=1)
+        return (self.now - partition_end).total_seconds() >= settings.JOBS_RESULTS_EXPIRE
 
+    async def add(self, contents, expire=None):
+        self.stats["listed"] += len(contents)
         for el in contents:
-            is_key_expired = (
-                now - el["LastModified"]
-            ).total_seconds() >= settings.JOBS_RESULTS_EXPIRE
-            if not is_key_expired:
+            if not self.is_expired(el["LastModified"], expire):
                 continue
 
-            to_delete.append(el["Key"])
+            self.batch.append(el["Key"])
+            if len(self.batch) >= DELETE_BATCH_SIZE:
+                await self.flush()
+
+    async def flush(self):
+        if not self.batch:
+            return
+
+        items, self.batch = self.batch, []
+        await self.semaphore.acquire()
+        task = asyncio.ensure_future(self.delete(items))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def delete(self, items):
+        try:
+            response = await asyncio.to_thread(
+                self.service.s3_delete_objects, bucket=self.bucket, items=items
+            )
+            deleted = len(response["Deleted"])
+            self.stats["deleted"] += deleted
+            logger.info(f"Successfully deleted: {deleted} keys")
+        finally:
+            self.semaphore.release()
+
+    async def wait(self):
+        await self.flush()
+        if self.pending:
+            await asyncio.gather(*self.pending)
+
+    async def run_prefix(self, prefix="", in_partition=False, expire=None):
+        for data in self.service.s3_get_obj_iterator(bucket=self.bucket, prefix=prefix):
+            contents = data.get("Contents")
+            if contents:
+                await self.add(contents, expire)
+
+            for common_prefix in data.get("CommonPrefixes") or []:
+                if in_partition:
+                    await self.run_prefix(
+                        common_prefix["Prefix"], in_partition=True, expire=expire
+                    )
+                else:
+                    await self.run_partition(common_prefix["Prefix"])
+
+    async def run_partition(self, prefix):
+        # claim checks are kept while queues retain messages referring them
+        if prefix == self.service.key_claim_check_prefix():
+            await self.run_prefix(
+                prefix, in_partition=True, expire=settings.SQS_CLAIM_CHECK_RETENTION
+            )
+            return
+
+        partition_date = self.service.key_partition_date(prefix)
+
+        # only date partitions are purged, whole prefix is skipped until
+        # all objects in it may be expired, so fresh ones are never listed
+        if partition_date is None or not self.is_partition_expired(partition_date):
+            return
+
+        self.stats["partitions"] += 1
+        await self.run_prefix(prefix, in_partition=True)
 
-    logger.info(f"Total keys: {total}, deleting: {len(to_delete)}")
 
-    if not to_delete:
-        return
-
-    for items in by_chunk(to_delete):
-        response = service.s3_delete_objects(bucket=settings.JOBS_BUCKET, items=items)
-        logger.info(f"Successfully deleted: {len(response['Deleted'])} keys")
+async def async_handler(event, context):
+    service = AWSServiceAdapter()
+    purge = Purge(
+        service=service,
+        bucket=settings.JOBS_BUCKET,
+        now=datetime.now(timezone.utc),
+    )
+
+    tic = time.time()
+    await purge.run_prefix()
+    await purge.wait()
+
+    total_time = time.time() - tic
+    stats = {
+        **purge.stats,
+        "seconds": round(total_time, 2),
+        "deleted_per_second": round(purge.stats["deleted"] / max(total_time, 1e-3), 2),
+    }
+    logger.info(f"Total keys: {purge.stats['listed']}, {stats=}")
 
 
 def handler(event, context):
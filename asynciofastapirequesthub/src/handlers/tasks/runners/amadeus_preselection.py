@@ -1,17 +1,24 @@
 import asyncio
+import copy
 import functools
+import hashlib
 import itertools
 import logging
 import math
 import re
+import time
 from datetime import datetime, timedelta
 
 import aiometer
 import httpx
+import orjson
+from botocore.exceptions import ClientError
 from starlette.status import HTTP_200_OK
 
 from ....conf import settings
+from ....helpers import consts, executors, fx, hedging, profiling, ratelimit
 from ....helpers.amadeus import Amadeus
+from ....helpers.aws import AWSServiceAdapter
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +31,8 @@ FILTER_PRICE_LEFTOVER_PERCENTAGE = 0.3
 FILTER_TIME_LEFTOVER_PERCENTAGE = 0.3
 FILTER_ENTRY_RESULTS_LIMIT = 250
 
+INDEX_MAX_TASKS = 100
+
 
 def duration_display(iso_duration):
     val = iso_duration.replace("PT", "")
@@ -103,6 +112,34 @@ def result_get_total_time(result):
     return sum([duration_total_in_hours(i["duration"]) for i in result["itineraries"]])
 
 
+def flatten_result(result):
+    """
+    Flat representation of an offer used by columnar results.
+    """
+    itineraries = result.get("itineraries", [])
+    outbound = itineraries[0] if itineraries else {}
+    inbound = itineraries[-1] if len(itineraries) > 1 else {}
+    outbound_segments = outbound.get("segments") or [{}]
+    inbound_segments = inbound.get("segments") or [{}]
+    segments = [i for itinerary in itineraries for i in itinerary.get("segments", [])]
+
+    return {
+        "offer_id": result.get("id"),
+        "price": result_get_price(result),
+        "currency": result["price"].get("currency"),
+        "segments": len(segments),
+        "duration_hours": result_get_total_time(result),
+        "outbound_duration_hours": duration_total_in_hours(outbound.get("duration", "")),
+        "inbound_duration_hours": duration_total_in_hours(inbound.get("duration", "")),
+        "carriers": sorted({i["carrierCode"] for i in segments if "carrierCode" in i}),
+        "validating_carriers": result.get("validatingAirlineCodes", []),
+        "fly_from": outbound_segments[0].get("departure", {}).get("iataCode"),
+        "fly_to": outbound_segments[-1].get("arrival", {}).get("iataCode"),
+        "departure_at": outbound_segments[0].get("departure", {}).get("at"),
+        "return_at": inbound_segments[0].get("departure", {}).get("at"),
+    }
+
+
 def filter_results(items):
     if not items:
         return []
@@ -165,6 +202,48 @@ def filter_results(items):
     return results[:FILTER_ENTRY_RESULTS_LIMIT]
 
 
+def get_price_matrix(search_requests, combinations):
+    """
+    Cheapest price per (departure date, nights) and per airport pair,
+    computed from all offers before they are cut by filter_results.
+    """
+    by_dates = {}
+    by_airports = {}
+    currency_code = None
+
+    for search_params in search_requests:
+        combination = combinations.get(get_combination_key(search_params))
+        if not combination or not combination["offers"]:
+            continue
+
+        currency_code = search_params["currency_code"]
+        price = min(result_get_price(i) for i in combination["offers"])
+        outbound, inbound = search_params["flights"]
+        nights = (
+            datetime.strptime(inbound["departure_date"], SOURCE_DATE_FORMAT)
+            - datetime.strptime(outbound["departure_date"], SOURCE_DATE_FORMAT)
+        ).days
+
+        for group, key in (
+            (by_dates, (outbound["departure_date"], nights)),
+            (by_airports, (outbound["departure"]["iata"], outbound["arrival"]["iata"])),
+        ):
+            if key not in group or price < group[key]:
+                group[key] = price
+
+    return {
+        "currency_code": currency_code,
+        "by_dates": [
+            {"departure_date": departure_date, "nights": nights, "price": price}
+            for (departure_date, nights), price in sorted(by_dates.items())
+        ],
+        "by_airports": [
+            {"fly_from": fly_from, "fly_to": fly_to, "price": price}
+            for (fly_from, fly_to), price in sorted(by_airports.items())
+        ],
+    }
+
+
 def get_search_requests(task_params):
     source_date_from = datetime.strptime(
         task_params.pop("date_from"), SOURCE_DATE_FORMAT
@@ -253,12 +332,387 @@ def get_search_requests(task_params):
     ]
 
 
-async def handler(task_id, task_params):
-    logger.info(f"[AMADEUS-PRESELECTION] {task_id=} {task_params=}")
-    search_requests = get_search_requests(task_params=task_params)
+def get_task_cost(task_params):
+    """
+    Number of requests sent to Amadeus for given task params,
+    get_search_requests mutates params hence the copy.
+    """
+    return len(get_search_requests(task_params=copy.deepcopy(task_params)))
+
+
+def get_task_shards(task_params, max_cost):
+    """
+    Splits task by departure dates into consecutive ranges costing at most
+    max_cost each, None when a single departure date is over the ceiling.
+    """
+    date_from = datetime.strptime(task_params["date_from"], SOURCE_DATE_FORMAT)
+    date_to = datetime.strptime(task_params["date_to"], SOURCE_DATE_FORMAT)
+
+    ranges = []
+    for departure_date in get_date_range(date_from.date(), date_to.date()):
+        day = departure_date.strftime(SOURCE_DATE_FORMAT)
+        cost = get_task_cost({**task_params, "date_from": day, "date_to": day})
+        if cost > max_cost:
+            return None
+
+        if ranges and ranges[-1][2] + cost <= max_cost:
+            ranges[-1][1] = day
+            ranges[-1][2] += cost
+        else:
+            ranges.append([day, day, cost])
+
+    return [
+        {**task_params, "date_from": shard_from, "date_to": shard_to}
+        for shard_from, shard_to, _ in ranges
+    ]
+
+
+def get_task_eta(task_cost, task_lane, latency):
+    """
+    Seconds needed to send task_cost requests, throughput is bound either by
+    rate limits or by the number of requests in flight given their latency.
+    """
+    max_at_once, max_per_second = get_rate_limits(task_lane)
+    if settings.AMADEUS_RATE_LIMITER_BACKEND:
+        max_per_second = min(
+            max_per_second, settings.AMADEUS_GLOBAL_MAX_REQUESTS_PER_SECOND
+        )
+
+    throughput = min(max_per_second, max_at_once / max(latency, 1e-3))
+    return SLEEP_AFTER_OBTAINING_TOKEN_SECONDS + task_cost / throughput + latency
+
+
+def get_filter_entry_offers():
+    """
+    Fewest offers filter_results keeps FILTER_ENTRY_RESULTS_LIMIT of, both
+    its price and time cuts leave a fraction of offers above the limit.
+    """
+    after_price = FILTER_ENTRY_RESULTS_LIMIT / FILTER_TIME_LEFTOVER_PERCENTAGE
+    return math.ceil(math.ceil(after_price) / FILTER_PRICE_LEFTOVER_PERCENTAGE)
+
+
+def get_max_flight_offers(combinations_count):
+    """
+    Per-request offers cap, all combinations together return as many offers
+    as filter_results needs to keep its limit. Amadeus returns cheapest first.
+    """
+    if not settings.AMADEUS_MAX_FLIGHT_OFFERS or not combinations_count:
+        return None
+
+    cap = math.ceil(
+        get_filter_entry_offers()
+        * settings.AMADEUS_FLIGHT_OFFERS_OVERSAMPLING
+        / combinations_count
+    )
+    return max(
+        settings.AMADEUS_MIN_FLIGHT_OFFERS,
+        min(cap, settings.AMADEUS_MAX_FLIGHT_OFFERS),
+    )
+
+
+def get_promising_requests(search_requests, combinations, max_flight_offers):
+    """
+    Requests of combinations truncated by max_flight_offers which could have
+    more offers below the highest price filter_results keeps, cheapest first.
+    """
+    kept = filter_results(
+        [offer for i in combinations.values() for offer in i["offers"]]
+    )
+    threshold = math.inf
+    if len(kept) >= FILTER_ENTRY_RESULTS_LIMIT:
+        threshold = max(result_get_price(i) for i in kept)
+
+    promising = []
+    for search_params in search_requests:
+        combination = combinations.get(get_combination_key(search_params))
+        if not combination or len(combination["offers"]) < max_flight_offers:
+            continue
+
+        prices = [result_get_price(i) for i in combination["offers"]]
+        if max(prices) < threshold:
+            promising.append((min(prices), search_params))
+
+    return [i for _, i in sorted(promising, key=lambda x: x[0])]
+
+
+def get_rate_limits(task_lane):
+    if task_lane == consts.TaskLane.BULK:
+        return (
+            settings.AMADEUS_BULK_MAX_REQUESTS_AT_ONCE,
+            settings.AMADEUS_BULK_MAX_REQUESTS_PER_SECOND,
+        )
+    return (
+        settings.AMADEUS_MAX_REQUESTS_AT_ONCE,
+        settings.AMADEUS_MAX_REQUESTS_PER_SECOND,
+    )
+
+
+def get_combination_key(search_params):
+    outbound, inbound = search_params["flights"]
+    return "|".join(
+        (
+            outbound["departure_date"],
+            inbound["departure_date"],
+            outbound["departure"]["iata"],
+            outbound["arrival"]["iata"],
+            inbound["departure"]["iata"],
+            inbound["arrival"]["iata"],
+        )
+    )
+
+
+def covers_flight_offers(stored, needed):
+    """
+    Offers searched with stored cap include all the ones searched with
+    needed cap would return, None stands for search without cap.
+    """
+    if stored is None:
+        return True
+    return needed is not None and stored >= needed
+
+
+def is_combination_covered(combination, max_flight_offers):
+    """
+    Combination holds all offers search with max_flight_offers would return,
+    one which got fewer offers than its cap was not truncated at all.
+    """
+    stored = combination.get("max_flight_offers", 0)
+    if covers_flight_offers(stored, max_flight_offers):
+        return True
+    return bool(stored) and len(combination["offers"]) < stored
+
+
+def get_retained_combinations(
+    snapshot, search_requests, freshness, now, max_flight_offers=None
+):
+    """
+    Combinations searched by previous run which are still part of the task
+    (e.g. departure dates did not change), are not older than freshness and
+    hold all offers of a search with max_flight_offers cap. Combinations
+    stored without cap were searched before it was recorded, they are not
+    covered.
+    """
+    if not snapshot:
+        return {}
+
+    keys = {get_combination_key(i) for i in search_requests}
+    return {
+        key: combination
+        for key, combination in snapshot["combinations"].items()
+        if key in keys
+        and now - combination["searched_at"] < freshness
+        and is_combination_covered(combination, max_flight_offers)
+    }
+
+
+def get_snapshot(aws, task_id):
+    try:
+        _, snapshot = aws.s3_get_partitioned(
+            bucket=settings.JOBS_BUCKET,
+            key_func=functools.partial(aws.key_snapshot, task_id),
+            getter=aws.s3_get_json_obj,
+        )
+        return snapshot
+    except ClientError:
+        logger.info(f"[AMADEUS-PRESELECTION] snapshot not available {task_id=}")
+        return None
+
+
+def get_snapshot_combinations(
+    aws, snapshot_id, search_requests, currencies, freshness, now
+):
+    """
+    Combinations retained from snapshot and all of them regardless of age
+    and cap, which are kept when re-query of a combination fails. Snapshot
+    without currency was searched in task currency.
+    """
+    if not snapshot_id or not settings.JOBS_SNAPSHOTS_ENABLED:
+        return {}, {}
+
+    task_currency, search_currency = currencies
+    snapshot = get_snapshot(aws, snapshot_id)
+    # offers are reused only in currency they were searched in
+    if not snapshot or snapshot.get("currency_code", task_currency) != search_currency:
+        return {}, {}
+
+    retained = get_retained_combinations(
+        snapshot,
+        search_requests,
+        freshness=freshness,
+        now=now,
+        max_flight_offers=get_max_flight_offers(len(search_requests)),
+    )
+    fallback = get_retained_combinations(
+        snapshot, search_requests, freshness=math.inf, now=now, max_flight_offers=0
+    )
+    return retained, fallback
+
+
+def get_search_currency(aws, currency_code):
+    """
+    Currency Amadeus is searched in, base currency when offers can be
+    converted from it to task currency. Results are cached per currency,
+    offers searched in base currency are reused only from snapshots.
+    """
+    base_currency = settings.TASKS_BASE_CURRENCY
+    if not base_currency or base_currency == currency_code:
+        return currency_code
+    if not settings.JOBS_SNAPSHOTS_ENABLED:
+        return currency_code
+
+    if not fx.get_rates(aws).supports(base_currency, currency_code):
+        logger.warning(f"[AMADEUS-PRESELECTION] can't convert to {currency_code=}")
+        return currency_code
+    return base_currency
+
+
+def get_search_params(aws, task_params):
+    return {
+        **task_params,
+        "currency_code": get_search_currency(aws, task_params["currency_code"]),
+    }
+
+
+def convert_price(price, rates, from_currency, to_currency):
+    converted = {**price, "currency": to_currency}
+    for field in ("total", "base", "grandTotal"):
+        if field in price:
+            converted[field] = rates.convert(price[field], from_currency, to_currency)
+    if "fees" in price:
+        converted["fees"] = [
+            {**i, "amount": rates.convert(i["amount"], from_currency, to_currency)}
+            for i in price["fees"]
+        ]
+    return converted
+
+
+def convert_offer(offer, rates, from_currency, to_currency):
+    converted = {
+        **offer,
+        "price": convert_price(offer["price"], rates, from_currency, to_currency),
+    }
+    if "travelerPricings" in offer:
+        converted["travelerPricings"] = [
+            {
+                **i,
+                "price": convert_price(i["price"], rates, from_currency, to_currency),
+            }
+            if "price" in i
+            else i
+            for i in offer["travelerPricings"]
+        ]
+    return converted
+
+
+def convert_combinations(combinations, rates, from_currency, to_currency):
+    return {
+        key: {
+            **combination,
+            "offers": [
+                convert_offer(i, rates, from_currency, to_currency)
+                for i in combination["offers"]
+            ],
+        }
+        for key, combination in combinations.items()
+    }
+
+
+def get_index_signature(task_params):
+    """
+    Task can subsume another one only when searched for same passengers
+    and currency, index is kept per such signature.
+    """
+    sig = {
+        "passengers_map": task_params["passengers_map"],
+        "currency_code": task_params["currency_code"],
+    }
+    return hashlib.md5(orjson.dumps(sig, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def get_combination_keys(task_params):
+    search_requests = get_search_requests(task_params=copy.deepcopy(task_params))
+    return {get_combination_key(i) for i in search_requests}
+
+
+def get_index(aws, signature):
+    try:
+        return aws.s3_get_json_obj(
+            bucket=settings.JOBS_BUCKET,
+            key=aws.key_task_index(consts.Tasks.AMADEUS_PRESELECTION, signature),
+        )
+    except ClientError:
+        return {"tasks": []}
+
+
+def update_index(aws, task_id, task_params, now, max_flight_offers=None):
+    """
+    Registers completed task which snapshot holds all its combinations,
+    tasks older than JOBS_RESULTS_EXPIRE are dropped from index meanwhile.
+    Combination keys and offers cap are stored along, so lookups do not
+    rebuild keys and skip tasks searched with lower cap than needed.
+    Concurrent updates may lose an entry, which only costs a cache miss.
+    """
+    signature = get_index_signature(task_params)
+    tasks = [
+        i
+        for i in get_index(aws, signature)["tasks"]
+        if i["task_id"] != task_id
+        and now - i["completed_at"] < settings.JOBS_RESULTS_EXPIRE
+    ]
+    tasks.insert(
+        0,
+        {
+            "task_id": task_id,
+            "task_params": task_params,
+            "combination_keys": sorted(get_combination_keys(task_params)),
+            "max_flight_offers": max_flight_offers,
+            "completed_at": now,
+        },
+    )
+    aws.s3_put_json_obj(
+        bucket=settings.JOBS_BUCKET,
+        key=aws.key_task_index(consts.Tasks.AMADEUS_PRESELECTION, signature),
+        message={"tasks": tasks[:INDEX_MAX_TASKS]},
+    )
+
+
+def find_subsuming_task(aws, task_params, now=None):
+    """
+    Id of a completed task which searched every combination of given task,
+    so its offers can be taken from that task snapshot instead of Amadeus.
+    Wider task is searched with lower cap, its combinations truncated below
+    cap of given task are re-queried, see get_retained_combinations.
+    """
+    now = now or time.time()
+    # tasks are indexed by currency they are searched in
+    task_params = get_search_params(aws, task_params)
+    keys = get_combination_keys(task_params)
+    if not keys:
+        return None
+
+    for i in get_index(aws, get_index_signature(task_params))["tasks"]:
+        if now - i["completed_at"] >= settings.JOBS_RESULTS_EXPIRE:
+            continue
+        # entries written before keys were stored have params only
+        covered = i.get("combination_keys")
+        if covered is None:
+            covered = get_combination_keys(i["task_params"])
+        if keys.issubset(covered):
+            return i["task_id"]
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_shared_limiter(task_lane):
+    return ratelimit.SharedLimiter(*get_rate_limits(task_lane))
+
+
+async def search(search_requests, task_lane):
+    if not search_requests:
+        return [], {}
 
     async with httpx.AsyncClient() as client:
-        service = Amadeus(client=client)
+        service = Amadeus(client=client, rate_limiter=ratelimit.get_rate_limiter())
         logger.info(
             f"[AMADEUS-PRESELECTION] obtaining auth token, prepared: {len(search_requests)} requests to Amadeus"
         )
@@ -270,40 +724,257 @@ async def handler(task_id, task_params):
             f"[AMADEUS-PRESELECTION] got auth token, sending: {len(search_requests)} requests to Amadeus"
         )
 
+        max_at_once, max_per_second = get_rate_limits(task_lane)
         jobs = [
             functools.partial(service.async_search, **search_params)
             for search_params in search_requests
         ]
+        if settings.AMADEUS_SHARED_JOB_LIMITS:
+            # other jobs of the process draw from the same limits
+            limiter = get_shared_limiter(task_lane)
+            jobs = [functools.partial(limiter.run, job) for job in jobs]
+        hedger = None
+        if settings.AMADEUS_HEDGE_ENABLED:
+            (max_at_once, max_per_second), hedge_budget = hedging.get_hedge_budget(
+                max_at_once, max_per_second
+            )
+            hedger = hedging.get_hedger(
+                *hedge_budget, accept=lambda r: r["status"] == HTTP_200_OK
+            )
+            jobs = [functools.partial(hedger.run, job) for job in jobs]
+
         responses = await aiometer.run_all(
             jobs,
-            max_at_once=settings.AMADEUS_MAX_REQUESTS_AT_ONCE,
-            max_per_second=settings.AMADEUS_MAX_REQUESTS_PER_SECOND,
+            max_at_once=max_at_once,
+            max_per_second=max_per_second,
+        )
+
+    stats = {
+        "short_circuited": service.breakers.short_circuited
+        if service.breakers is not None
+        else 0,
+        "latency_samples": len(service.latencies),
+        "latency_p50": service.latencies.percentile(0.5),
+        **(hedger.stats if hedger is not None else {}),
+    }
+    return responses, stats
+
+
+async def requery_truncated(
+    search_requests, combinations, max_flight_offers, task_lane
+):
+    """
+    Second phase of two-phase search, promising combinations truncated by
+    max_flight_offers are searched again with AMADEUS_MAX_FLIGHT_OFFERS cap.
+    Returns number of re-queried combinations.
+    """
+    if not (
+        settings.AMADEUS_TWO_PHASE_ENABLED
+        and max_flight_offers
+        and max_flight_offers < settings.AMADEUS_MAX_FLIGHT_OFFERS
+    ):
+        return 0
+
+    # filters all offers of the task, kept off event loop like filter stage
+    promising = await executors.run_cpu_bound(
+        get_promising_requests,
+        search_requests,
+        combinations,
+        max_flight_offers,
+        threaded=True,
+    )
+    promising = [
+        {**i, "max_flight_offers": settings.AMADEUS_MAX_FLIGHT_OFFERS}
+        for i in promising[: settings.AMADEUS_TWO_PHASE_MAX_REQUESTS]
+    ]
+    responses, _ = await search(promising, task_lane)
+
+    requeried = 0
+    for search_params, r in zip(promising, responses):
+        # phase one offers are kept when re-query fails
+        if r["status"] == HTTP_200_OK:
+            requeried += 1
+            combinations[get_combination_key(search_params)].update(
+                max_flight_offers=settings.AMADEUS_MAX_FLIGHT_OFFERS, offers=r["data"]
+            )
+    return requeried
+
+
+def store_latency(aws, search_stats, now):
+    """
+    Observed provider latency is kept for /tasks/estimate of following tasks.
+    """
+    if not search_stats.get("latency_samples"):
+        return
+
+    aws.s3_put_json_obj(
+        bucket=settings.JOBS_BUCKET,
+        key=aws.key_task_stats(consts.Tasks.AMADEUS_PRESELECTION),
+        message={
+            "latency": search_stats["latency_p50"],
+            "samples": search_stats["latency_samples"],
+            "updated_at": now,
+        },
+    )
+
+
+def get_latency(aws):
+    try:
+        stats = aws.s3_get_json_obj(
+            bucket=settings.JOBS_BUCKET,
+            key=aws.key_task_stats(consts.Tasks.AMADEUS_PRESELECTION),
+        )
+        return stats["latency"]
+    except (ClientError, KeyError):
+        return settings.AMADEUS_ESTIMATED_REQUEST_LATENCY
+
+
+async def handler(
+    task_id,
+    task_params,
+    task_lane=consts.TaskLane.INTERACTIVE,
+    task_refresh=False,
+    task_partition="",
+    task_source_id=None,
+    profiler=None,
+):
+    profiler = profiler or profiling.MemoryProfiler(enabled=False)
+    logger.info(
+        f"[AMADEUS-PRESELECTION] {task_id=} {task_lane=} {task_refresh=} "
+        f"{task_source_id=} {task_params=}"
+    )
+    aws = AWSServiceAdapter()
+    now = time.time()
+    task_currency = task_params["currency_code"]
+    task_params = get_search_params(aws, task_params)
+    search_currency = task_params["currency_code"]
+    index_params = copy.deepcopy(task_params)
+    search_requests = get_search_requests(task_params=task_params)
+
+    snapshot_id, freshness = None, None
+    if task_source_id:
+        # task is subsumed by source task, its offers are valid until expiry
+        snapshot_id, freshness = task_source_id, settings.JOBS_RESULTS_EXPIRE
+    elif task_refresh:
+        snapshot_id, freshness = task_id, settings.JOBS_REFRESH_FRESHNESS
+
+    # snapshot holds all offers of a task, it is read and parsed in a thread
+    combinations, fallback = await asyncio.to_thread(
+        get_snapshot_combinations,
+        aws,
+        snapshot_id,
+        search_requests,
+        (task_currency, search_currency),
+        freshness=freshness,
+        now=now,
+    )
+    retained = len(combinations)
+    max_flight_offers = get_max_flight_offers(len(search_requests))
+    pending = [
+        {**i, "max_flight_offers": max_flight_offers}
+        for i in search_requests
+        if get_combination_key(i) not in combinations
+    ]
+    with profiler.phase("aggregation"):
+        responses, search_stats = await search(pending, task_lane)
+
+        ok_responses = 0
+        error_responses = 0
+        error_statuses = set()
+
+        for search_params, r in zip(pending, responses):
+            key = get_combination_key(search_params)
+            if r["status"] != HTTP_200_OK:
+                error_responses += 1
+                error_statuses.add(r["status"])
+                # stale offers are kept when re-query fails
+                if key in fallback:
+                    combinations[key] = fallback[key]
+                continue
+
+            ok_responses += 1
+            combinations[key] = {
+                "searched_at": now,
+                "max_flight_offers": max_flight_offers,
+                "offers": r["data"],
+            }
+
+        requeried = await requery_truncated(
+            pending, combinations, max_flight_offers, task_lane
         )
+    profiler.count(
+        "offers_held", sum(len(i["offers"]) for i in combinations.values())
+    )
 
-    ok_responses = 0
-    error_responses = 0
-    error_statuses = set()
-    results = []
+    with profiler.phase("filter"):
+        # conversion, filtering and compression run off the event loop, so they
+        # overlap with searches of other tasks processed in the same container
+        task_combinations = combinations
+        if search_currency != task_currency:
+            task_combinations = await executors.run_cpu_bound(
+                convert_combinations,
+                combinations,
+                fx.get_rates(aws),
+                search_currency,
+                task_currency,
+                threaded=True,
+            )
 
-    for r in responses:
-        if r["status"] != HTTP_200_OK:
-            error_responses += 1
-            error_statuses.add(r["status"])
-            continue
+        results = [
+            offer
+            for search_params in search_requests
+            for offer in task_combinations.get(
+                get_combination_key(search_params), {}
+            ).get("offers", [])
+        ]
 
-        ok_responses += 1
-        results.extend(r["data"])
+        found = len(results)
+        price_matrix, results = await asyncio.gather(
+            executors.run_cpu_bound(
+                get_price_matrix, search_requests, task_combinations, threaded=True
+            ),
+            executors.run_cpu_bound(filter_results, results, threaded=True),
+        )
+    profiler.count("offers_results", len(results))
+
+    with profiler.phase("store"):
+        await asyncio.to_thread(
+            aws.s3_put_json_obj,
+            bucket=settings.JOBS_BUCKET,
+            key=aws.key_price_matrix(task_id, task_partition),
+            message={**price_matrix, "currency_code": task_currency},
+        )
+        if settings.JOBS_SNAPSHOTS_ENABLED:
+            await asyncio.to_thread(
+                aws.s3_put_json_obj,
+                bucket=settings.JOBS_BUCKET,
+                key=aws.key_snapshot(task_id, task_partition),
+                message={
+                    "currency_code": search_currency,
+                    "combinations": combinations,
+                },
+            )
+            if settings.JOBS_SUBSUMPTION_ENABLED and not (
+                error_responses or task_source_id
+            ):
+                await asyncio.to_thread(
+                    update_index, aws, task_id, index_params, now, max_flight_offers
+                )
 
-    found = len(results)
-    results = filter_results(results)
+        await asyncio.to_thread(store_latency, aws, search_stats, now)
 
     stats = {
         "total_tasks": len(search_requests),
+        "retained": retained,
+        "max_flight_offers": max_flight_offers,
+        "requeried": requeried,
         "200_responses": ok_responses,
         "XXX_responses": error_responses,
         "XXX_codes": list(error_statuses),
         "found": found,
         "filtered": len(results),
+        **search_stats,
+        **profiler.stats,
     }
     logger.info(f"[AMADEUS-PRESELECTION] post concurrent run {stats=}")
     return results
@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import logging
+import logging.config
+import multiprocessing
+import os
+import signal
+
+from ...conf import settings
+from ...helpers.aws import AWSServiceAdapter
+from ...helpers.queues import get_queue_backend
+from ...helpers.ratelimit import RateLimiterBackend
+from . import jobs
+
+logger = logging.getLogger(__name__)
+logging.config.dictConfig(settings.LOG_CONFIG)
+
+
+from ...core import sentry
+
+RECEIVE_WAIT_SECONDS = 5
+RECEIVE_ERROR_BACKOFF_SECONDS = 5
+# sized for a Lambda container running a single job
+JOB_RATE_LIMITS = (
+    "AMADEUS_MAX_REQUESTS_AT_ONCE",
+    "AMADEUS_MAX_REQUESTS_PER_SECOND",
+    "AMADEUS_BULK_MAX_REQUESTS_AT_ONCE",
+    "AMADEUS_BULK_MAX_REQUESTS_PER_SECOND",
+)
+
+
+class Worker:
+    """
+    Receives messages from queues in order of priority and runs them with
+    the jobs handler, at most concurrency jobs at once. Message is deleted
+    once handled, failed handling leaves it for redelivery.
+    """
+
+    def __init__(self, backend, queue_names, concurrency):
+        self.backend = backend
+        self.queue_urls = [backend.get_queue_url(i) for i in queue_names]
+        self.concurrency = concurrency
+        self.pending = set()
+        self.stopping = asyncio.Event()
+        self.stats = {"handled": 0, "failed": 0}
+
+    async def handle(self, queue_url, record):
+        try:
+            await jobs.async_handler({"Records": [record]}, None)
+        except Exception:
+            self.stats["failed"] += 1
+            logger.error(f"[WORKER] {record['messageId']=} failed", exc_info=True)
+            return
+
+        await self.backend.delete_message(queue_url, record["receiptHandle"])
+        self.stats["handled"] += 1
+
+    async def receive(self):
+        # lower priority queue is polled only when higher ones are empty,
+        # long poll is done on the last one
+        for i, queue_url in enumerate(self.queue_urls):
+            last = i == len(self.queue_urls) - 1
+            records = await self.backend.receive_messages(
+                queue_url,
+                max_messages=self.concurrency - len(self.pending),
+                wait_seconds=RECEIVE_WAIT_SECONDS if last else 0,
+            )
+            if records:
+                return queue_url, records
+        return None, []
+
+    async def run(self):
+        logger.info(f"[WORKER] started, {os.getpid()=}, {self.queue_urls=}")
+        while not self.stopping.is_set():
+            if len(self.pending) >= self.concurrency:
+                await asyncio.wait(self.pending, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            try:
+                queue_url, records = await self.receive()
+            except Exception:
+                # queue may be briefly unavailable, worker keeps polling it
+                logger.error("[WORKER] receiving messages failed", exc_info=True)
+                await asyncio.sleep(RECEIVE_ERROR_BACKOFF_SECONDS)
+                continue
+
+            for record in records:
+                task = asyncio.ensure_future(self.handle(queue_url, record))
+                self.pending.add(task)
+                task.add_done_callback(self.pending.discard)
+
+        if self.pending:
+            await asyncio.gather(*self.pending)
+        logger.info(f"[WORKER] stopped, {os.getpid()=}, {self.stats=}")
+        return self.stats
+
+
+def share_rate_limits(processes):
+    """
+    Per-job Amadeus limits are split between worker processes, jobs run at
+    once by a process share one limiter of its part, see
+    AMADEUS_SHARED_JOB_LIMITS. Budget of local rate limiter is per process,
+    it is split likewise.
+    """
+    for name in JOB_RATE_LIMITS:
+        setattr(settings, name, max(1, getattr(settings, name) // processes))
+    settings.AMADEUS_SHARED_JOB_LIMITS = True
+
+    if settings.AMADEUS_RATE_LIMITER_BACKEND == RateLimiterBackend.LOCAL:
+        settings.AMADEUS_GLOBAL_MAX_REQUESTS_PER_SECOND = max(
+            1, settings.AMADEUS_GLOBAL_MAX_REQUESTS_PER_SECOND // processes
+        )
+
+
+async def async_run(queue_names, concurrency):
+    worker = Worker(
+        backend=get_queue_backend(AWSServiceAdapter()),
+        queue_names=queue_names,
+        concurrency=concurrency,
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stopping.set)
+    return await worker.run()
+
+
+def run(queue_names, concurrency, processes=1):
+    share_rate_limits(processes)
+    asyncio.run(async_run(queue_names, concurrency))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs jobs from task queues.")
+    parser.add_argument(
+        "--processes", type=int, default=settings.JOBS_WORKER_PROCESSES
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=settings.JOBS_WORKER_CONCURRENCY
+    )
+    parser.add_argument(
+        "--queues",
+        nargs="+",
+        default=[settings.JOBS_QUEUE_NAME, settings.JOBS_BULK_QUEUE_NAME],
+        help="queue names in order of priority",
+    )
+    args = parser.parse_args()
+
+    count = args.processes or os.cpu_count() or 1
+    processes = [
+        multiprocessing.Process(target=run, args=(args.queues, args.concurrency, count))
+        for _ in range(count)
+    ]
+    for process in processes:
+        process.start()
+
+    # children get SIGINT from terminal on their own, SIGTERM is forwarded
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(
+        signal.SIGTERM, lambda *_: [i.terminate() for i in processes if i.is_alive()]
+    )
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,19 @@
-import json
+import collections
 import logging
+import time
 import uuid
 
 import httpx
-from starlette.status import HTTP_408_REQUEST_TIMEOUT
+import orjson
+from starlette.status import (
+    HTTP_408_REQUEST_TIMEOUT,
+    HTTP_429_TOO_MANY_REQUESTS,
+    HTTP_500_INTERNAL_SERVER_ERROR,
+    HTTP_503_SERVICE_UNAVAILABLE,
+)
 
 from ..conf import settings
+from .hedging import LatencyTracker
 
 DEFAULT_CURRENCY = "PLN"
 DEFAULT_TIMEOUT = 10
@@ -33,6 +41,255 @@ cabin_class_map = {
 logger = logging.getLogger(__name__)
 
 
+class CircuitState:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """
+    Opens when ratio of failures among recent requests crosses the threshold,
+    after open_seconds lets a limited number of probes through (half-open)
+    and closes again on the first successful one.
+    """
+
+    def __init__(
+        self,
+        failure_ratio,
+        min_requests,
+        window,
+        open_seconds,
+        half_open_probes=1,
+        clock=time.monotonic,
+    ):
+        self.failure_ratio = failure_ratio
+        self.min_requests = min_requests
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.clock = clock
+        self.outcomes = collections.deque(maxlen=window)
+        self.state = CircuitState.CLOSED
+        self.opened_at = None
+        self.probes = 0
+
+    def allow(self):
+        if self.state == CircuitState.OPEN:
+            if self.clock() - self.opened_at < self.open_seconds:
+                return False
+            self.state = CircuitState.HALF_OPEN
+            self.probes = 0
+
+        if self.state == CircuitState.HALF_OPEN:
+            if self.probes >= self.half_open_probes:
+                return False
+            self.probes += 1
+
+        return True
+
+    def release(self):
+        # request allowed by this breaker was not sent after all
+        if self.state == CircuitState.HALF_OPEN and self.probes:
+            self.probes -= 1
+
+    def open(self):
+        self.state = CircuitState.OPEN
+        self.opened_at = self.clock()
+        self.outcomes.clear()
+
+    def record(self, success):
+        if self.state == CircuitState.HALF_OPEN:
+            if success:
+                self.state = CircuitState.CLOSED
+            else:
+                self.open()
+            return
+
+        self.outcomes.append(success)
+        total = len(self.outcomes)
+        failures = total - sum(self.outcomes)
+        if total >= self.min_requests and failures / total >= self.failure_ratio:
+            self.open()
+
+
+class CircuitBreakers:
+    """
+    Global breaker and one breaker per route (origin/destination pairs).
+    """
+
+    def __init__(self):
+        self.global_breaker = self.make_breaker(
+            min_requests=settings.AMADEUS_BREAKER_MIN_REQUESTS
+        )
+        self.route_breakers = {}
+        self.short_circuited = 0
+
+    @staticmethod
+    def make_breaker(min_requests):
+        return CircuitBreaker(
+            failure_ratio=settings.AMADEUS_BREAKER_FAILURE_RATIO,
+            min_requests=min_requests,
+            window=settings.AMADEUS_BREAKER_WINDOW,
+            open_seconds=settings.AMADEUS_BREAKER_OPEN_SECONDS,
+        )
+
+    @staticmethod
+    def get_route(flights):
+        return ",".join(
+            f"{flight['departure']['iata']}-{flight['arrival']['iata']}"
+            for flight in flights
+        )
+
+    def get_route_breaker(self, route):
+        breaker = self.route_breakers.get(route)
+        if breaker is None:
+            breaker = self.make_breaker(
+                min_requests=settings.AMADEUS_BREAKER_ROUTE_MIN_REQUESTS
+            )
+            self.route_breakers[route] = breaker
+        return breaker
+
+    def allow(self, route):
+        if not self.global_breaker.allow():
+            self.short_circuited += 1
+            return False
+
+        if not self.get_route_breaker(route).allow():
+            self.global_breaker.release()
+            self.short_circuited += 1
+            return False
+
+        return True
+
+    def record(self, route, success):
+        self.global_breaker.record(success)
+        self.get_route_breaker(route).record(success)
+
+    def release(self, route):
+        self.global_breaker.release()
+        self.get_route_breaker(route).release()
+
+
+def is_provider_failure(status):
+    return status in (
+        HTTP_408_REQUEST_TIMEOUT,
+        HTTP_429_TOO_MANY_REQUESTS,
+    ) or (status >= HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def parse_flight_offers(content, fields=None):
+    """
+    Parses raw flight-offers response and returns its data array only,
+    dictionaries and meta are dropped right away. When fields are given
+    offers are reduced to these keys, so the rest of each offer can be
+    released before results of the whole fan-out are aggregated.
+    """
+    document = orjson.loads(content)
+    if not isinstance(document, dict):
+        return []
+
+    offers = document.get("data") or []
+    if fields:
+        offers = [{k: offer[k] for k in fields if k in offer} for offer in offers]
+    return offers
+
+
+class SearchRequestBuilder:
+    """
+    Renders v2/shopping/flight-offers request bodies, parts invariant for
+    a task (travelers, criteria, currency) are serialized only once and
+    originDestinations are spliced into them for every combination.
+    """
+
+    SOURCES = ["GDS", "PYTON", "LTC", "EAC", "NDC"]
+
+    def __init__(
+        self,
+        passengers_map,
+        cabin_class=CabinClass.ANY,
+        currency_code=DEFAULT_CURRENCY,
+        max_flight_offers=None,
+    ):
+        self.passengers_map = passengers_map
+        self.cabin_class = cabin_class
+        self.currency_code = currency_code
+        self.max_flight_offers = max_flight_offers
+        self._templates = {}
+
+    def get_travelers(self):
+        adults = self.passengers_map["adults"]
+        return [
+            *[
+                {
+                    "id": index1 + 1,
+                    "travelerType": "ADULT",
+                    "fareOptions": ["STANDARD"],
+                }
+                for index1 in range(0, adults)
+            ],
+            *[
+                {
+                    "id": index2 + 1 + adults,
+                    "travelerType": "CHILD",
+                    "fareOptions": ["STANDARD"],
+                }
+                for (index2, age) in enumerate(self.passengers_map["children"])
+            ],
+        ]
+
+    def get_search_criteria(self, flights_count):
+        criteria = {
+            "allowAlternativeFareOptions": True,
+            "additionalInformation": {
+                "chargeableCheckedBags": True,
+            },
+        }
+
+        if self.max_flight_offers:
+            criteria["maxFlightOffers"] = self.max_flight_offers
+
+        if self.cabin_class and self.cabin_class != CabinClass.ANY:
+            criteria["flightFilters"] = {
+                "cabinRestrictions": [
+                    {
+                        "cabin": cabin_class_map[self.cabin_class],
+                        "originDestinationIds": list(range(1, flights_count + 1)),
+                    }
+                ]
+            }
+
+        return criteria
+
+    def get_template(self, flights_count):
+        # serialized body without the closing brace, cabin restrictions
+        # refer to originDestinations ids so template depends on their count
+        template = self._templates.get(flights_count)
+        if template is None:
+            data = {
+                "currencyCode": self.currency_code,
+                "searchCriteria": self.get_search_criteria(flights_count),
+                "travelers": self.get_travelers(),
+                "sources": self.SOURCES,
+            }
+            template = orjson.dumps(data)[:-1] + b',"originDestinations":'
+            self._templates[flights_count] = template
+        return template
+
+    def render(self, flights):
+        origin_destinations = [
+            {
+                "id": index + 1,
+                "originLocationCode": flight["departure"]["iata"],
+                "destinationLocationCode": flight["arrival"]["iata"],
+                "departureDateTimeRange": {"date": flight["departure_date"]},
+            }
+            for (index, flight) in enumerate(flights)
+        ]
+        return (
+            self.get_template(len(flights)) + orjson.dumps(origin_destinations) + b"}"
+        )
+
+
 class Amadeus:
     def __init__(
         self,
@@ -40,12 +297,18 @@ class Amadeus:
         base_url=settings.AMADEUS_API_URL,
         api_key=settings.AMADEUS_API_KEY,
         api_secret=settings.AMADEUS_API_SECRET,
+        rate_limiter=None,
     ):
         self.client = client
+        self.rate_limiter = rate_limiter
+        self.breakers = CircuitBreakers() if settings.AMADEUS_BREAKER_ENABLED else None
         self.base_url = base_url
         self.api_key = api_key
         self.api_secret = api_secret
         self.access_token = None
+        self.request_builders = {}
+        # provider latency of completed searches, reported to task estimates
+        self.latencies = LatencyTracker()
 
     def api_url(self, path):
         return f"{self.base_url}/{path}"
@@ -88,80 +351,97 @@ class Amadeus:
         data = r.json()
         return data["access_token"]
 
+    def record_outcome(self, route, status):
+        if self.breakers is not None:
+            self.breakers.record(route, success=not is_provider_failure(status))
+
+    def get_request_builder(
+        self, passengers_map, cabin_class, currency_code, max_flight_offers=None
+    ):
+        key = (
+            currency_code,
+            cabin_class,
+            passengers_map["adults"],
+            len(passengers_map["children"]),
+            max_flight_offers,
+        )
+        builder = self.request_builders.get(key)
+        if builder is None:
+            builder = SearchRequestBuilder(
+                passengers_map=passengers_map,
+                cabin_class=cabin_class,
+                currency_code=currency_code,
+                max_flight_offers=max_flight_offers,
+            )
+            self.request_builders[key] = builder
+        return builder
+
     async def async_search(
         self,
         flights,
         passengers_map,
         cabin_class=CabinClass.ANY,
         currency_code=DEFAULT_CURRENCY,
+        max_flight_offers=None,
     ):
         await self.async_install_access_token()
         url = self.api_url("v2/shopping/flight-offers")
 
-        data = {
-            "currencyCode": currency_code,
-            "searchCriteria": {
-                "allowAlternativeFareOptions": True,
-                "additionalInformation": {
-                    "chargeableCheckedBags": True,
-                },
-            },
-            "originDestinations": [
-                {
-                    "id": index + 1,
-                    "originLocationCode": flight["departure"]["iata"],
-                    "destinationLocationCode": flight["arrival"]["iata"],
-                    "departureDateTimeRange": {"date": flight["departure_date"]},
-                }
-                for (index, flight) in enumerate(flights)
-            ],
-            "travelers": [
-                *[
-                    {
-                        "id": index1 + 1,
-                        "travelerType": "ADULT",
-                        "fareOptions": ["STANDARD"],
-                    }
-                    for index1 in range(0, passengers_map["adults"])
-                ],
-                *[
-                    {
-                        "id": index2 + 1 + passengers_map["adults"],
-                        "travelerType": "CHILD",
-                        "fareOptions": ["STANDARD"],
-                    }
-                    for (index2, age) in enumerate(passengers_map["children"])
-                ],
-            ],
-            "sources": ["GDS", "PYTON", "LTC", "EAC", "NDC"],
-        }
+        builder = self.get_request_builder(
+            passengers_map=passengers_map,
+            cabin_class=cabin_class,
+            currency_code=currency_code,
+            max_flight_offers=max_flight_offers,
+        )
+        content = builder.render(flights)
+        headers = self._default_headers
 
-        if cabin_class and cabin_class != CabinClass.ANY:
-            data["searchCriteria"]["flightFilters"] = {
-                "cabinRestrictions": [
-                    {
-                        "cabin": cabin_class_map[cabin_class],
-                        "originDestinationIds": [
-                            i["id"] for i in data.get("originDestinations")
-                        ],
-                    }
-                ]
-            }
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"[AMADEUS] sending POST to {url} with {content} and headers={headers}"
+            )
 
-        json_data = json.dumps(data)
+        route = CircuitBreakers.get_route(flights)
+        if self.breakers is not None and not self.breakers.allow(route):
+            return {"data": [], "status": HTTP_503_SERVICE_UNAVAILABLE}
+
+        recorded = False
+        try:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+
+            tic = time.monotonic()
+            try:
+                r = await self.client.post(
+                    url,
+                    content=content,
+                    headers=headers,
+                    timeout=DEFAULT_TIMEOUT,
+                )
+            except httpx.TimeoutException:
+                recorded = True
+                self.record_outcome(route, HTTP_408_REQUEST_TIMEOUT)
+                return {"data": [], "status": HTTP_408_REQUEST_TIMEOUT}
+            except httpx.HTTPError:
+                recorded = True
+                self.record_outcome(route, HTTP_503_SERVICE_UNAVAILABLE)
+                raise
+
+            self.latencies.observe(time.monotonic() - tic)
+            recorded = True
+            self.record_outcome(route, r.status_code)
+        finally:
+            # cancelled (e.g. by hedging) or failed before any outcome, so
+            # a half-open probe slot is not held forever
+            if not recorded and self.breakers is not None:
+                self.breakers.release(route)
 
-        logger.debug(
-            f"[AMADEUS] sending POST to {url} with {json_data} and headers={self._default_headers}"
-        )
         try:
-            r = await self.client.post(
-                url,
-                data=json_data,
-                headers=self._default_headers,
-                timeout=DEFAULT_TIMEOUT,
+            offers = parse_flight_offers(
+                r.content, fields=settings.AMADEUS_OFFER_FIELDS
             )
-            data = r.json()
-        except httpx.TimeoutException:
-            return {"data": [], "status": HTTP_408_REQUEST_TIMEOUT}
+        except orjson.JSONDecodeError:
+            logger.warning(f"[AMADEUS] invalid JSON response status={r.status_code}")
+            offers = []
 
-        return {"data": data.get("data", []), "status": r.status_code}
+        return {"data": offers, "status": r.status_code}
@@ -1,67 +1,216 @@
+import functools
 import gzip
 import io
 import json
 import logging
+import math
+import uuid
+from datetime import datetime, timedelta, timezone
 
-import boto3
 import orjson
-from botocore.client import Config
 from botocore.exceptions import ClientError
 
 from ..conf import settings
-from ..helpers.utils import bytesto
+from ..helpers.utils import bytesto, gzip_json
 
 logger = logging.getLogger(__name__)
 
 
-if settings.use_localstack:
-    client_s3 = boto3.client(
-        "s3",
-        region_name=settings.DEFAULT_AWS_REGION,
-        endpoint_url=settings.DEFAULT_LOCALSTACK_URL,
-    )
-    client_sqs = boto3.client(
-        "sqs",
-        region_name=settings.DEFAULT_AWS_REGION,
-        endpoint_url=settings.DEFAULT_LOCALSTACK_URL,
-    )
-else:
-    client_s3 = boto3.client(
-        "s3",
-        region_name=settings.DEFAULT_AWS_REGION,
-        endpoint_url=f"https://s3.{settings.DEFAULT_AWS_REGION}.amazonaws.com",
+@functools.lru_cache(maxsize=None)
+def get_client_s3():
+    """
+    Clients are created on first use, so cold start does not pay for them
+    when a handler never touches given service.
+    """
+    import boto3
+
+    if settings.use_localstack:
+        endpoint_url = settings.DEFAULT_LOCALSTACK_URL
+    else:
+        endpoint_url = f"https://s3.{settings.DEFAULT_AWS_REGION}.amazonaws.com"
+    return boto3.client(
+        "s3", region_name=settings.DEFAULT_AWS_REGION, endpoint_url=endpoint_url
     )
-    client_sqs = boto3.client("sqs", region_name=settings.DEFAULT_AWS_REGION)
+
+
+@functools.lru_cache(maxsize=None)
+def get_client_sqs():
+    import boto3
+
+    kwargs = {"region_name": settings.DEFAULT_AWS_REGION}
+    if settings.use_localstack:
+        kwargs["endpoint_url"] = settings.DEFAULT_LOCALSTACK_URL
+    return boto3.client("sqs", **kwargs)
+
+
+def __getattr__(name):
+    # keeps `from helpers.aws import client_s3` working without eager clients
+    clients = {"client_s3": get_client_s3, "client_sqs": get_client_sqs}
+    if name in clients:
+        return clients[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class AWSServiceAdapter:
-    def key_results(self, task_id):
-        return f"{task_id}-results"
+    PARTITION_FORMAT = "%Y-%m-%d"
 
-    def sqs_get_messages(self, event):
-        return [
-            {
-                "attributes": record["attributes"],
-                "id": record["messageId"],
-                "body": orjson.loads(record["body"]),
-            }
-            for record in event["Records"]
+    def key_partition(self, now=None):
+        """
+        Keys are grouped under date prefixes, so expired results can be purged
+        by whole prefixes. Empty partition stands for flat (legacy) layout.
+        """
+        if not settings.JOBS_KEYS_PARTITIONED:
+            return ""
+        now = now or datetime.now(timezone.utc)
+        return now.strftime(self.PARTITION_FORMAT)
+
+    def key_partitions(self, now=None):
+        """
+        Partitions which may still hold task objects, newest first. Partition
+        is kept until its last day is older than JOBS_RESULTS_EXPIRE and purge
+        runs once a day, hence the additional day. Flat layout comes last,
+        it is still written by jobs of messages sent before partitioning.
+        """
+        if not settings.JOBS_KEYS_PARTITIONED:
+            return [""]
+        now = now or datetime.now(timezone.utc)
+        days = math.ceil(settings.JOBS_RESULTS_EXPIRE / (3600 * 24)) + 1
+        partitions = [
+            self.key_partition(now - timedelta(days=i)) for i in range(days + 1)
         ]
+        if settings.JOBS_KEYS_FLAT_FALLBACK:
+            partitions.append("")
+        return partitions
+
+    def key_partition_date(self, partition):
+        try:
+            return datetime.strptime(partition.rstrip("/"), self.PARTITION_FORMAT)
+        except ValueError:
+            return None
+
+    def _key(self, partition, name):
+        return f"{partition}/{name}" if partition else name
+
+    def key_results(self, task_id, partition=""):
+        return self._key(partition, f"{task_id}-results")
+
+    def key_task_stats(self, task_name):
+        # not partitioned, overwritten by every job of given task
+        return f"_stats/{task_name}"
+
+    def key_warmer_spend(self, day):
+        # not partitioned, day is set even in flat layout
+        return f"_warmer/{day}"
+
+    def key_fx_rates(self):
+        return "_fx/rates"
+
+    def key_task_index(self, task_name, signature):
+        return f"_index/{task_name}/{signature}"
+
+    def key_price_matrix(self, task_id, partition=""):
+        return self._key(partition, f"{task_id}-price-matrix")
+
+    def key_snapshot(self, task_id, partition=""):
+        return self._key(partition, f"{task_id}-snapshot")
+
+    def key_popularity_prefix(self, partition=""):
+        return self._key(partition, "_popularity/")
+
+    def key_popularity(self, task_id, request_id, partition=""):
+        # one object per schedule request, counted by listing the prefix
+        return f"{self.key_popularity_prefix(partition)}{task_id}-{request_id}"
+
+    def key_claim_check_prefix(self):
+        # not partitioned, claims outlive partitions, see jobs_results_expire
+        return "_claims/"
+
+    def key_claim_check(self, claim_id):
+        return f"{self.key_claim_check_prefix()}{claim_id}"
+
+    def key_revalidation(self, task_id, partition=""):
+        return self._key(partition, f"{task_id}-revalidation")
+
+    def key_results_ndjson(self, task_id, partition="", version=None):
+        # versioned pages are never overwritten, index names the current one
+        if version:
+            return self._key(partition, f"{task_id}-results-{version}.ndjson.gz")
+        return self._key(partition, f"{task_id}-results.ndjson.gz")
+
+    def key_results_index(self, task_id, partition=""):
+        return self._key(partition, f"{task_id}-results.index")
+
+    def key_results_columnar(self, task_id, fmt, partition=""):
+        return self._key(partition, f"{task_id}-results.{fmt}")
+
+    def sqs_encode_message(self, message):
+        """
+        Bodies over SQS_CLAIM_CHECK_THRESHOLD are stored in S3 and only
+        a claim check referring to them is sent (SQS limit is 256 KB).
+        """
+        body = orjson.dumps(message)
+        if len(body) <= settings.SQS_CLAIM_CHECK_THRESHOLD:
+            return body.decode("utf-8")
+
+        key = self.key_claim_check(uuid.uuid4().hex)
+        self.s3_put_obj(
+            bucket=settings.JOBS_BUCKET, key=key, body=gzip.compress(body)
+        )
+        logger.info(f"[SQS] body of {len(body)} bytes offloaded to {key=}")
+        return orjson.dumps(
+            {"claim_check": {"bucket": settings.JOBS_BUCKET, "key": key}}
+        ).decode("utf-8")
+
+    def sqs_decode_body(self, body):
+        message = orjson.loads(body)
+        claim_check = message.get("claim_check")
+        if claim_check is None:
+            return message
+
+        # claims are not deleted once read, messages redriven from DLQ
+        # resolve them until SQS_CLAIM_CHECK_RETENTION
+        return self.s3_get_json_obj(
+            bucket=claim_check["bucket"], key=claim_check["key"]
+        )
+
+    def sqs_get_message(self, record):
+        return {
+            "attributes": record["attributes"],
+            "id": record["messageId"],
+            "body": self.sqs_decode_body(record["body"]),
+        }
+
+    def sqs_get_messages(self, event):
+        return [self.sqs_get_message(record) for record in event["Records"]]
 
     def sqs_get_queue_url(self, name: str):
-        r = client_sqs.get_queue_url(QueueName=name)
+        r = get_client_sqs().get_queue_url(QueueName=name)
         return r["QueueUrl"]
 
     def sqs_send_json_message(self, queue_url, message):
-        return client_sqs.send_message(
-            QueueUrl=queue_url, MessageBody=orjson.dumps(message).decode("utf-8")
+        return get_client_sqs().send_message(
+            QueueUrl=queue_url, MessageBody=self.sqs_encode_message(message)
+        )
+
+    def sqs_receive_messages(self, queue_url, max_messages, wait_seconds):
+        r = get_client_sqs().receive_message(
+            QueueUrl=queue_url,
+            MaxNumberOfMessages=max_messages,
+            WaitTimeSeconds=wait_seconds,
+            AttributeNames=["All"],
+        )
+        return r.get("Messages") or []
+
+    def sqs_delete_message(self, queue_url, receipt_handle):
+        return get_client_sqs().delete_message(
+            QueueUrl=queue_url, ReceiptHandle=receipt_handle
         )
 
     def s3_get_obj(self, bucket, key):
-        return client_s3.get_object(Bucket=bucket, Key=key)
+        return get_client_s3().get_object(Bucket=bucket, Key=key)
 
     def s3_get_json_obj(self, bucket, key, gzipped=True):
-        r = client_s3.get_object(Bucket=bucket, Key=key)
+        r = get_client_s3().get_object(Bucket=bucket, Key=key)
 
         if not gzipped:
             content = r["Body"]
@@ -73,50 +222,85 @@ class AWSServiceAdapter:
 
     def s3_put_json_obj(self, bucket, key, message, gzipped=True):
         if not gzipped:
-            return client_s3.put_object(
+            return get_client_s3().put_object(
                 Body=orjson.dumps(message), Bucket=bucket, Key=key
             )
 
-        total_size_before = round(bytesto(len(orjson.dumps(message)), "m"), 2)
-
-        buff = io.BytesIO()
-        with gzip.GzipFile(fileobj=buff, mode="wb") as f:
-            with io.TextIOWrapper(f, encoding="utf-8") as wrapper:
-                wrapper.write(orjson.dumps(message).decode("utf-8"))
-        buff.seek(0)
-
-        total_size_after = round(bytesto(buff.getbuffer().nbytes, "m"), 2)
-
+        size, body = gzip_json(message)
         logger.info(
-            f"[S3] stored {total_size_before}MB json as {total_size_after}MB gzip"
+            f"[S3] stored {round(bytesto(size, 'm'), 2)}MB json "
+            f"as {round(bytesto(len(body), 'm'), 2)}MB gzip"
         )
+        return get_client_s3().put_object(Body=body, Bucket=bucket, Key=key)
+
+    def s3_put_obj(self, bucket, key, body):
+        return get_client_s3().put_object(Body=body, Bucket=bucket, Key=key)
 
-        return client_s3.put_object(Body=buff, Bucket=bucket, Key=key)
+    def s3_get_obj_range(self, bucket, key, start, end):
+        r = get_client_s3().get_object(
+            Bucket=bucket, Key=key, Range=f"bytes={start}-{end}"
+        )
+        return r["Body"]
 
     def s3_generate_presigned_url(
         self, bucket, key, expiration=settings.JOBS_RESULTS_EXPIRE
     ):
-        return client_s3.generate_presigned_url(
+        return get_client_s3().generate_presigned_url(
             "get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=expiration
         )
 
     def s3_check_key_exists(self, bucket, key):
         try:
-            client_s3.head_object(Bucket=bucket, Key=key)
+            get_client_s3().head_object(Bucket=bucket, Key=key)
             return True
         except ClientError:
             return False
 
-    def s3_get_obj_iterator(self, bucket):
-        paginator = client_s3.get_paginator("list_objects")
+    def s3_get_obj_age(self, bucket, key, now=None):
+        """
+        Seconds since object was last modified, None when it does not exist.
+        """
+        try:
+            r = get_client_s3().head_object(Bucket=bucket, Key=key)
+        except ClientError:
+            return None
+        now = now or datetime.now(timezone.utc)
+        return (now - r["LastModified"]).total_seconds()
+
+    def s3_find_partition(self, bucket, key_func):
+        """
+        Newest partition holding key returned by key_func, None when missing.
+        """
+        for partition in self.key_partitions():
+            if self.s3_check_key_exists(bucket=bucket, key=key_func(partition)):
+                return partition
+        return None
+
+    def s3_get_partitioned(self, bucket, key_func, getter):
+        """
+        Calls getter for keys of candidate partitions, newest first, returns
+        partition and result of the first existing one. Raises NoSuchKey
+        when none of partitions holds the key.
+        """
+        error = None
+        for partition in self.key_partitions():
+            try:
+                return partition, getter(bucket=bucket, key=key_func(partition))
+            except get_client_s3().exceptions.NoSuchKey as e:
+                error = e
+        raise error
+
+    def s3_get_obj_iterator(self, bucket, prefix=""):
+        paginator = get_client_s3().get_paginator("list_objects_v2")
         return paginator.paginate(
             Bucket=bucket,
+            Prefix=prefix,
             Delimiter="/",
-            PaginationConfig={"PageSize": None},
+            PaginationConfig={"PageSize": 1000},
         )
 
     def s3_delete_objects(self, bucket, items):
-        return client_s3.delete_objects(
+        return get_client_s3().delete_objects(
             Bucket=bucket,
             Delete={"Objects": [{"Key": i} for i in items], "Quiet": False},
         )
@@ -0,0 +1,29 @@
+import io
+
+
+class ColumnarFormat:
+    PARQUET = "parquet"
+    ARROW = "arrow"
+
+
+def dumps(rows, fmt=ColumnarFormat.PARQUET):
+    """
+    Serializes flat rows as Parquet or Arrow IPC file, pyarrow is imported
+    lazily as it is only needed when columnar results are enabled.
+    """
+    import pyarrow as pa
+
+    table = pa.Table.from_pylist(rows)
+    buff = io.BytesIO()
+
+    if fmt == ColumnarFormat.PARQUET:
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, buff, compression="zstd")
+    elif fmt == ColumnarFormat.ARROW:
+        with pa.ipc.new_file(buff, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        raise ValueError(f"Unknown columnar format: {fmt}")
+
+    return buff.getvalue()
@@ -2,6 +2,16 @@ class Tasks:
     AMADEUS_PRESELECTION = "amadeus-preselection"
 
 
+class TaskLane:
+    INTERACTIVE = "interactive"
+    BULK = "bulk"
+
+
+class TaskOverCostPolicy:
+    REJECT = "reject"
+    SHARD = "shard"
+
+
 class TaskStatus:
     NOT_STARTED = "not-started"
     SCHEDULED = "scheduled"
@@ -0,0 +1,51 @@
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import os
+
+from ..conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def get_workers():
+    return settings.JOBS_CPU_WORKERS or os.cpu_count() or 1
+
+
+@functools.lru_cache(maxsize=None)
+def get_thread_executor():
+    return concurrent.futures.ThreadPoolExecutor(
+        max_workers=get_workers(), thread_name_prefix="cpu"
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_executor():
+    """
+    Pool CPU-bound stages of jobs run in, so event loop keeps serving
+    in-flight requests. Process pool needs /dev/shm which Lambda does not
+    provide, thread pool is used there instead.
+    """
+    if settings.JOBS_CPU_EXECUTOR == "process":
+        try:
+            return concurrent.futures.ProcessPoolExecutor(max_workers=get_workers())
+        except (OSError, NotImplementedError):
+            logger.warning("[EXECUTORS] process pool is not available, using threads")
+
+    return get_thread_executor()
+
+
+async def run_cpu_bound(func, *args, threaded=False):
+    """
+    Runs func in executor pool, inline when JOBS_CPU_EXECUTOR is empty.
+    In process pool func and args are pickled, so pass module level
+    functions and serialized bytes. Stages taking large nested structures
+    (e.g. all offers of a task) are not supported by process pool, they
+    pass threaded=True to run in thread pool regardless.
+    """
+    if not settings.JOBS_CPU_EXECUTOR:
+        return func(*args)
+
+    executor = get_thread_executor() if threaded else get_executor()
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
@@ -0,0 +1,70 @@
+import logging
+import time
+import xml.etree.ElementTree as ET
+from decimal import ROUND_HALF_UP, Decimal
+
+from botocore.exceptions import ClientError
+
+from ..conf import settings
+
+logger = logging.getLogger(__name__)
+
+ECB_RATES_URL = "https://www.ecb.europa.eu/stats/eurofxref/eurofxref-daily.xml"
+ECB_BASE_CURRENCY = "EUR"
+RATES_CACHE_SECONDS = 3600
+CENT = Decimal("0.01")
+
+
+def parse_ecb_rates(content):
+    """
+    Rates of currencies per 1 EUR from ECB daily reference rates document.
+    """
+    rates = {ECB_BASE_CURRENCY: "1"}
+    for el in ET.fromstring(content).iter():
+        if el.tag.endswith("Cube") and "currency" in el.attrib:
+            rates[el.attrib["currency"]] = el.attrib["rate"]
+    return rates
+
+
+class FxRates:
+    def __init__(self, rates):
+        self.rates = {k: Decimal(str(v)) for k, v in rates.items()}
+
+    def supports(self, *currencies):
+        return all(i in self.rates for i in currencies)
+
+    def get_rate(self, from_currency, to_currency):
+        return self.rates[to_currency] / self.rates[from_currency]
+
+    def convert(self, amount, from_currency, to_currency):
+        value = Decimal(str(amount)) * self.get_rate(from_currency, to_currency)
+        return str(value.quantize(CENT, rounding=ROUND_HALF_UP))
+
+
+async def fetch_rates(client):
+    r = await client.get(ECB_RATES_URL)
+    r.raise_for_status()
+    return parse_ecb_rates(r.content)
+
+
+cache = {"rates": None, "loaded_at": 0.0}
+
+
+def get_rates(aws, now=None):
+    """
+    Rates table stored by jobs_fx_rates handler, kept in memory for an hour.
+    Empty table when it was never stored, nothing can be converted then.
+    """
+    now = now or time.time()
+    if cache["rates"] is not None and now - cache["loaded_at"] < RATES_CACHE_SECONDS:
+        return cache["rates"]
+
+    try:
+        data = aws.s3_get_json_obj(bucket=settings.JOBS_BUCKET, key=aws.key_fx_rates())
+        rates = FxRates(data["rates"])
+    except ClientError:
+        logger.warning("[FX] rates are not available")
+        rates = FxRates({})
+
+    cache.update(rates=rates, loaded_at=now)
+    return rates
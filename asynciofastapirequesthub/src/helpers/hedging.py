@@ -0,0 +1,159 @@
+import asyncio
+import collections
+import math
+import time
+
+from ..conf import settings
+from .ratelimit import LocalTokenBucketStore
+
+
+class LatencyTracker:
+    def __init__(self, window=1000):
+        self.samples = collections.deque(maxlen=window)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def observe(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)
+        return ordered[max(index, 0)]
+
+
+class Hedger:
+    """
+    Sends a duplicate request when the original one is slower than given
+    percentile of latencies observed so far and returns the first accepted
+    response, failed fast ones (e.g. short-circuited) do not win.
+    Hedges are capped to max_ratio of all requests and draw from their own
+    share of concurrency and rate budget, see get_hedge_budget.
+    """
+
+    def __init__(
+        self,
+        percentile,
+        min_samples,
+        max_ratio,
+        accept=None,
+        max_at_once=None,
+        max_per_second=None,
+    ):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.accept = accept or (lambda result: True)
+        self.slots = None if max_at_once is None else asyncio.Semaphore(max_at_once)
+        self.rate = max_per_second
+        self.tokens = None if max_per_second is None else LocalTokenBucketStore()
+        self.latencies = LatencyTracker()
+        self.requests = 0
+        self.hedges_issued = 0
+        self.hedges_won = 0
+
+    @property
+    def stats(self):
+        return {
+            "hedges_issued": self.hedges_issued,
+            "hedges_won": self.hedges_won,
+        }
+
+    def get_hedge_delay(self):
+        if len(self.latencies) < self.min_samples:
+            return None
+        return self.latencies.percentile(self.percentile)
+
+    async def can_hedge(self):
+        if self.hedges_issued >= math.floor(self.requests * self.max_ratio):
+            return False
+        if self.slots is not None and self.slots.locked():
+            return False
+        if self.tokens is not None:
+            if not self.rate:
+                return False
+            granted, _ = await self.tokens.take("hedges", self.rate, self.rate)
+            return bool(granted)
+        return True
+
+    async def run(self, factory):
+        self.requests += 1
+        tic = time.monotonic()
+        delay = self.get_hedge_delay()
+        primary = asyncio.ensure_future(factory())
+
+        if delay is not None:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if not done and await self.can_hedge():
+                return await self._run_hedged(factory, primary, tic)
+
+        result = await primary
+        self.latencies.observe(time.monotonic() - tic)
+        return result
+
+    async def _run_hedge(self, factory):
+        if self.slots is None:
+            return await factory()
+        async with self.slots:
+            return await factory()
+
+    def is_accepted(self, task):
+        return task.exception() is None and self.accept(task.result())
+
+    async def _run_hedged(self, factory, primary, tic):
+        self.hedges_issued += 1
+        hedge = asyncio.ensure_future(self._run_hedge(factory))
+        pending = {primary, hedge}
+        winner = None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            # primary is preferred when both complete at once
+            for task in sorted(done, key=lambda i: i is not primary):
+                if self.is_accepted(task):
+                    winner = task
+                    break
+
+        for task in pending:
+            task.cancel()
+
+        if winner is None:
+            # neither was accepted, primary result or error is returned as is
+            winner = primary
+        elif winner is hedge:
+            self.hedges_won += 1
+
+        self.latencies.observe(time.monotonic() - tic)
+        return winner.result()
+
+
+def get_hedge_budget(max_at_once, max_per_second):
+    """
+    Share of job concurrency and rate reserved for hedges, remaining limits
+    are used for original requests, so together they stay within budget.
+    """
+    ratio = settings.AMADEUS_HEDGE_MAX_RATIO
+    hedge_at_once = min(max_at_once - 1, math.ceil(max_at_once * ratio))
+    hedge_per_second = min(max_per_second - 1, math.ceil(max_per_second * ratio))
+    return (
+        (max_at_once - hedge_at_once, max_per_second - hedge_per_second),
+        (hedge_at_once, hedge_per_second),
+    )
+
+
+def get_hedger(max_at_once=None, max_per_second=None, accept=None):
+    if not settings.AMADEUS_HEDGE_ENABLED:
+        return None
+
+    return Hedger(
+        percentile=settings.AMADEUS_HEDGE_PERCENTILE,
+        min_samples=settings.AMADEUS_HEDGE_MIN_SAMPLES,
+        max_ratio=settings.AMADEUS_HEDGE_MAX_RATIO,
+        accept=accept,
+        max_at_once=max_at_once,
+        max_per_second=max_per_second,
+    )
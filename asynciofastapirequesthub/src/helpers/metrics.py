@@ -0,0 +1,33 @@
+import sys
+import time
+
+import orjson
+
+from ..conf import settings
+
+
+def emit(values, dimensions=None, unit="Count"):
+    """
+    Writes metrics as a CloudWatch embedded metric format line to stdout,
+    Lambda turns it into metrics without any API calls.
+    """
+    if not settings.METRICS_ENABLED:
+        return
+
+    dimensions = dimensions or {}
+    payload = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": settings.METRICS_NAMESPACE,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": [{"Name": name, "Unit": unit} for name in values],
+                }
+            ],
+        },
+        **dimensions,
+        **values,
+    }
+    sys.stdout.write(orjson.dumps(payload).decode() + "\n")
+    sys.stdout.flush()
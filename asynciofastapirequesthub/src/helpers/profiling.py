@@ -0,0 +1,137 @@
+import contextlib
+import linecache
+import resource
+import sys
+import threading
+import tracemalloc
+
+from ..conf import settings
+from .utils import bytesto
+
+TRACEMALLOC_FRAMES = 1
+TOP_ALLOCATIONS = 10
+
+# tracing is process-wide, it is stopped when the last profiler using it
+# stops, jobs run concurrently by a worker share it
+tracing_lock = threading.Lock()
+tracing = {"users": 0, "owned": False}
+
+
+def get_peak_rss():
+    """
+    Peak resident set size of the process in bytes, it only grows,
+    so it covers whole lifetime of warm container.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def get_rss():
+    """
+    Current resident set size of the process in bytes, peak one where
+    /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return get_peak_rss()
+
+
+def to_mb(size):
+    return round(bytesto(size, "m"), 2)
+
+
+def format_statistic(statistic):
+    frame = statistic.traceback[0]
+    line = linecache.getline(frame.filename, frame.lineno).strip()
+    return f"{frame.filename}:{frame.lineno} {to_mb(statistic.size)}MB {line}"
+
+
+class MemoryProfiler:
+    """
+    Memory allocated by phases of a job traced with tracemalloc, along with
+    top allocation sites of the most demanding phase. Tracing slows jobs
+    down, it is enabled by JOBS_MEMORY_PROFILING only. Allocations of all
+    threads are traced, so jobs run concurrently by a worker overlap, and
+    peak of a phase is an upper bound then, as it is reset only while a
+    single job is traced. Work offloaded to process pool is not traced.
+    Change of RSS since start is reported regardless, it also includes
+    memory of jobs run concurrently.
+    """
+
+    def __init__(self, enabled=None):
+        self.enabled = settings.JOBS_MEMORY_PROFILING if enabled is None else enabled
+        self.started = False
+        self.rss_at_start = None
+        self.phases = {}
+        self.counts = {}
+        self.top_peak = 0
+        self.top_phase = None
+        self.top_allocations = []
+
+    def start(self):
+        self.rss_at_start = get_rss()
+        if not self.enabled or self.started:
+            return
+
+        with tracing_lock:
+            if tracing["users"] == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                tracing["owned"] = True
+            tracing["users"] += 1
+        self.started = True
+
+    def stop(self):
+        if not self.started:
+            return
+
+        with tracing_lock:
+            tracing["users"] -= 1
+            if tracing["users"] == 0 and tracing["owned"]:
+                tracemalloc.stop()
+                tracing["owned"] = False
+        self.started = False
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.started:
+            yield
+            return
+
+        with tracing_lock:
+            if tracing["users"] == 1:
+                tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            self.phases[name] = {
+                "retained_mb": to_mb(current - before),
+                "peak_mb": to_mb(peak - before),
+            }
+            if peak - before > self.top_peak:
+                self.top_peak = peak - before
+                self.top_phase = name
+                statistics = tracemalloc.take_snapshot().statistics("lineno")
+                self.top_allocations = [
+                    format_statistic(i) for i in statistics[:TOP_ALLOCATIONS]
+                ]
+
+    def count(self, name, value):
+        self.counts[name] = value
+
+    @property
+    def stats(self):
+        stats = {"peak_rss_mb": to_mb(get_peak_rss())}
+        if self.rss_at_start is not None:
+            stats["rss_delta_mb"] = to_mb(get_rss() - self.rss_at_start)
+        if self.enabled:
+            stats.update(
+                memory_phases=self.phases,
+                memory_counts=self.counts,
+                memory_top_phase=self.top_phase,
+            )
+        return stats
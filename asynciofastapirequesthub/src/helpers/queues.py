@@ -0,0 +1,197 @@
+import abc
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+import orjson
+
+from ..conf import settings
+
+logger = logging.getLogger(__name__)
+
+RECEIVE_POLL_INTERVAL = 0.2
+INFLIGHT_DIR = "inflight"
+
+
+class QueueBackendName:
+    SQS = "sqs"
+    LOCAL = "local"
+
+
+def get_record(message_id, receipt_handle, body, attributes, source):
+    """
+    Message in the shape of Lambda SQS event record, so received messages
+    are handled by the same code as the ones delivered by Lambda.
+    """
+    return {
+        "messageId": message_id,
+        "receiptHandle": receipt_handle,
+        "body": body,
+        "attributes": attributes,
+        "messageAttributes": {},
+        "eventSource": source,
+    }
+
+
+class QueueBackend(abc.ABC):
+    """
+    Queues tasks are sent to and workers receive them from. Received
+    messages are redelivered unless deleted within visibility timeout.
+    """
+
+    @abc.abstractmethod
+    def get_queue_url(self, name):
+        pass
+
+    @abc.abstractmethod
+    def send_json_message(self, queue_url, message):
+        pass
+
+    @abc.abstractmethod
+    async def receive_messages(self, queue_url, max_messages, wait_seconds):
+        pass
+
+    @abc.abstractmethod
+    async def delete_message(self, queue_url, receipt_handle):
+        pass
+
+
+class SQSQueueBackend(QueueBackend):
+    def __init__(self, aws):
+        self.aws = aws
+
+    def get_queue_url(self, name):
+        return self.aws.sqs_get_queue_url(name)
+
+    def send_json_message(self, queue_url, message):
+        return self.aws.sqs_send_json_message(queue_url=queue_url, message=message)
+
+    async def receive_messages(self, queue_url, max_messages, wait_seconds):
+        messages = await asyncio.to_thread(
+            self.aws.sqs_receive_messages,
+            queue_url=queue_url,
+            # SQS receives at most 10 messages at once
+            max_messages=min(max_messages, 10),
+            wait_seconds=wait_seconds,
+        )
+        return [
+            get_record(
+                i["MessageId"],
+                i["ReceiptHandle"],
+                i["Body"],
+                i["Attributes"],
+                "aws:sqs",
+            )
+            for i in messages
+        ]
+
+    async def delete_message(self, queue_url, receipt_handle):
+        await asyncio.to_thread(
+            self.aws.sqs_delete_message,
+            queue_url=queue_url,
+            receipt_handle=receipt_handle,
+        )
+
+
+class LocalQueueBackend(QueueBackend):
+    """
+    Queue kept as files in a directory shared by API and worker processes
+    on a single box. Messages are claimed by atomic rename into inflight
+    directory, so every one is received by exactly one worker.
+    """
+
+    def __init__(self, root, visibility_timeout, clock=time.time):
+        self.root = root
+        self.visibility_timeout = visibility_timeout
+        self.clock = clock
+
+    def get_queue_url(self, name):
+        queue_url = os.path.join(self.root, name)
+        os.makedirs(os.path.join(queue_url, INFLIGHT_DIR), exist_ok=True)
+        return queue_url
+
+    def send_json_message(self, queue_url, message):
+        message_id = uuid.uuid4().hex
+        # names sort in order messages were sent in
+        name = f"{time.time_ns()}-{message_id}.json"
+        tmp_path = os.path.join(queue_url, f".{name}")
+        with open(tmp_path, "wb") as fh:
+            fh.write(orjson.dumps(message))
+        os.rename(tmp_path, os.path.join(queue_url, name))
+        return {"MessageId": message_id}
+
+    def requeue_expired(self, queue_url):
+        inflight = os.path.join(queue_url, INFLIGHT_DIR)
+        for name in os.listdir(inflight):
+            path = os.path.join(inflight, name)
+            try:
+                if self.clock() - os.path.getmtime(path) >= self.visibility_timeout:
+                    os.rename(path, os.path.join(queue_url, name))
+                    logger.warning(f"[QUEUE] redelivering {name=} after timeout")
+            except FileNotFoundError:
+                # deleted or requeued by another process meanwhile
+                continue
+
+    def claim_messages(self, queue_url, max_messages):
+        self.requeue_expired(queue_url)
+        records = []
+        for name in sorted(os.listdir(queue_url)):
+            if len(records) >= max_messages:
+                break
+            if name.startswith(".") or not name.endswith(".json"):
+                continue
+
+            path = os.path.join(queue_url, INFLIGHT_DIR, name)
+            try:
+                # claim time is set before the file shows up in inflight,
+                # so requeue_expired of another process never sees it stale
+                now = self.clock()
+                os.utime(os.path.join(queue_url, name), (now, now))
+                os.rename(os.path.join(queue_url, name), path)
+            except FileNotFoundError:
+                # claimed by another worker
+                continue
+
+            with open(path, "rb") as fh:
+                body = fh.read().decode("utf-8")
+            message_id = name[: -len(".json")].split("-", 1)[1]
+            records.append(
+                get_record(
+                    message_id,
+                    path,
+                    body,
+                    {"SentTimestamp": name.split("-", 1)[0][:-6]},
+                    "local",
+                )
+            )
+        return records
+
+    async def receive_messages(self, queue_url, max_messages, wait_seconds):
+        deadline = time.monotonic() + wait_seconds
+        while True:
+            records = await asyncio.to_thread(
+                self.claim_messages, queue_url, max_messages
+            )
+            if records or time.monotonic() >= deadline:
+                return records
+            await asyncio.sleep(RECEIVE_POLL_INTERVAL)
+
+    async def delete_message(self, queue_url, receipt_handle):
+        try:
+            os.remove(receipt_handle)
+        except FileNotFoundError:
+            logger.warning(f"[QUEUE] {receipt_handle=} was already redelivered")
+
+
+def get_queue_backend(aws):
+    backend = settings.JOBS_QUEUE_BACKEND
+    if backend == QueueBackendName.SQS:
+        return SQSQueueBackend(aws)
+    if backend == QueueBackendName.LOCAL:
+        return LocalQueueBackend(
+            root=settings.JOBS_QUEUE_LOCAL_DIR,
+            visibility_timeout=settings.JOBS_QUEUE_VISIBILITY_TIMEOUT,
+        )
+    raise ValueError(f"Unknown queue backend: {backend}")
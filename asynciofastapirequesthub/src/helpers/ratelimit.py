@@ -0,0 +1,205 @@
+import abc
+import asyncio
+import functools
+import logging
+import time
+
+from ..conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiterBackend:
+    LOCAL = "local"
+    DYNAMODB = "dynamodb"
+
+
+def refill(tokens, updated_at, now, rate, capacity):
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+
+class TokenBucketStore(abc.ABC):
+    """
+    Keeps token buckets shared by all limiters using the same key,
+    take returns number of granted tokens and seconds to wait when none.
+    """
+
+    @abc.abstractmethod
+    async def take(self, key, rate, capacity, requested=1):
+        pass
+
+
+class LocalTokenBucketStore(TokenBucketStore):
+    """
+    In-memory stand-in, shared only within a single process.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.buckets = {}
+
+    async def take(self, key, rate, capacity, requested=1):
+        now = self.clock()
+        tokens, updated_at = self.buckets.get(key, (capacity, now))
+        tokens = refill(tokens, updated_at, now, rate, capacity)
+
+        granted = min(requested, int(tokens))
+        self.buckets[key] = (tokens - granted, now)
+
+        if granted:
+            return granted, 0.0
+        return 0, (1 - tokens) / rate
+
+
+class DynamoDBTokenBucketStore(TokenBucketStore):
+    """
+    Bucket kept as a single DynamoDB item updated with optimistic locking,
+    so all job containers draw from the same provider quota.
+    """
+
+    MAX_CONFLICT_RETRIES = 5
+
+    def __init__(self, table_name, client=None, clock=time.time):
+        if client is None:
+            import boto3
+
+            kwargs = {"region_name": settings.DEFAULT_AWS_REGION}
+            if settings.use_localstack:
+                kwargs["endpoint_url"] = settings.DEFAULT_LOCALSTACK_URL
+            client = boto3.client("dynamodb", **kwargs)
+
+        self.table_name = table_name
+        self.client = client
+        self.clock = clock
+
+    def _take(self, key, rate, capacity, requested):
+        for _ in range(self.MAX_CONFLICT_RETRIES):
+            item = self.client.get_item(
+                TableName=self.table_name,
+                Key={"key": {"S": key}},
+                ConsistentRead=True,
+            ).get("Item")
+
+            now = self.clock()
+            if item:
+                version = int(item["version"]["N"])
+                tokens = refill(
+                    float(item["tokens"]["N"]),
+                    float(item["updated_at"]["N"]),
+                    now,
+                    rate,
+                    capacity,
+                )
+            else:
+                version = 0
+                tokens = capacity
+
+            granted = min(requested, int(tokens))
+            try:
+                self.client.put_item(
+                    TableName=self.table_name,
+                    Item={
+                        "key": {"S": key},
+                        "tokens": {"N": str(tokens - granted)},
+                        "updated_at": {"N": str(now)},
+                        "version": {"N": str(version + 1)},
+                    },
+                    ConditionExpression="attribute_not_exists(#k) OR version = :v",
+                    ExpressionAttributeNames={"#k": "key"},
+                    ExpressionAttributeValues={":v": {"N": str(version)}},
+                )
+            except self.client.exceptions.ConditionalCheckFailedException:
+                continue
+
+            if granted:
+                return granted, 0.0
+            return 0, (1 - tokens) / rate
+
+        # other containers won every attempt, back off for a single token time
+        return 0, 1 / rate
+
+    async def take(self, key, rate, capacity, requested=1):
+        return await asyncio.to_thread(self._take, key, rate, capacity, requested)
+
+
+class TokenBucketLimiter:
+    """
+    Draws tokens from the store in batches and hands them out locally,
+    so the shared store is queried once per batch instead of per request.
+    """
+
+    def __init__(self, store, key, rate, capacity=None, batch=1):
+        self.store = store
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.batch = batch
+        self.tokens = 0
+        self._lock = None
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            while not self.tokens:
+                granted, wait = await self.store.take(
+                    self.key, self.rate, self.capacity, requested=self.batch
+                )
+                self.tokens += granted
+                if not granted:
+                    await asyncio.sleep(wait)
+
+            self.tokens -= 1
+
+
+class SharedLimiter:
+    """
+    Requests at once and per second limits shared by all jobs of a process,
+    every request waits for a free slot and a token of local bucket.
+    """
+
+    def __init__(self, max_at_once, max_per_second):
+        self.max_at_once = max_at_once
+        self.bucket = TokenBucketLimiter(
+            LocalTokenBucketStore(), key="shared", rate=max_per_second
+        )
+        self._semaphore = None
+
+    async def run(self, job):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_at_once)
+
+        async with self._semaphore:
+            await self.bucket.acquire()
+            return await job()
+
+
+local_store = LocalTokenBucketStore()
+
+
+@functools.lru_cache(maxsize=None)
+def get_dynamodb_store(table_name):
+    # one client per process, limiter is built for every search
+    return DynamoDBTokenBucketStore(table_name=table_name)
+
+
+def get_rate_limiter():
+    backend = settings.AMADEUS_RATE_LIMITER_BACKEND
+    if not backend:
+        return None
+
+    if backend == RateLimiterBackend.LOCAL:
+        store = local_store
+    elif backend == RateLimiterBackend.DYNAMODB:
+        store = get_dynamodb_store(settings.AMADEUS_RATE_LIMITER_TABLE)
+    else:
+        raise ValueError(f"Unknown rate limiter backend: {backend}")
+
+    logger.info(f"[RATE-LIMITER] using {backend=}")
+    return TokenBucketLimiter(
+        store=store,
+        key="amadeus",
+        rate=settings.AMADEUS_GLOBAL_MAX_REQUESTS_PER_SECOND,
+        batch=settings.AMADEUS_RATE_LIMITER_BATCH,
+    )
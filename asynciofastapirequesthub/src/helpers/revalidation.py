@@ -0,0 +1,59 @@
+import logging
+import uuid
+
+from botocore.exceptions import ClientError
+
+from ..conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def is_in_progress(aws, task_id, partition):
+    age = aws.s3_get_obj_age(
+        bucket=settings.JOBS_BUCKET, key=aws.key_revalidation(task_id, partition)
+    )
+    return age is not None and age < settings.JOBS_REVALIDATION_LOCK
+
+
+async def enqueue(aws, task_id, partition, send):
+    """
+    Revalidations are coalesced per task_id by a marker object, send is
+    awaited with id of the new revalidation unless one is in progress.
+    Marker is written once the message is sent, so failed send does not
+    lock task out for JOBS_REVALIDATION_LOCK. Job finishing before marker
+    is written leaves it to expire on its own.
+    """
+    if is_in_progress(aws, task_id, partition):
+        return False
+
+    revalidation_id = uuid.uuid4().hex
+    await send(revalidation_id)
+    aws.s3_put_json_obj(
+        bucket=settings.JOBS_BUCKET,
+        key=aws.key_revalidation(task_id, partition),
+        message={"revalidation_id": revalidation_id},
+        gzipped=False,
+    )
+    return True
+
+
+def release(aws, task_id, partition, revalidation_id):
+    """
+    Deletes marker written for given revalidation, the one of a newer
+    revalidation started after this one expired is kept.
+    """
+    key = aws.key_revalidation(task_id, partition)
+    try:
+        marker = aws.s3_get_json_obj(
+            bucket=settings.JOBS_BUCKET, key=key, gzipped=False
+        )
+    except ClientError:
+        return False
+
+    # markers written before ids were introduced have none
+    if marker.get("revalidation_id") != revalidation_id:
+        logger.info(f"[REVALIDATION] {key=} is held by another revalidation")
+        return False
+
+    aws.s3_delete_objects(bucket=settings.JOBS_BUCKET, items=[key])
+    return True
@@ -1,3 +1,8 @@
+import gzip
+
+import orjson
+
+
 def bytesto(data, to, bsize=1024):
     a = {"k": 1, "m": 2, "g": 3, "t": 4, "p": 5, "e": 6}
     r = float(data)
@@ -26,3 +31,50 @@ def by_chunk(items, chunk_size=1000):
             bucket = []
         bucket.append(item)
     yield bucket
+
+
+def gzip_json(message):
+    """
+    Serializes message once and compresses the bytes, returns size of
+    serialized json along with gzip payload.
+    """
+    body = orjson.dumps(message)
+    return len(body), gzip.compress(body)
+
+
+def ndjson_lines(items):
+    return [orjson.dumps(i) + b"\n" for i in items]
+
+
+def ndjson_gzip_lines(lines, chunk_size):
+    """
+    Compresses encoded NDJSON lines where every chunk_size lines form
+    separate gzip member, returns payload and index of [offset, length,
+    count] per chunk so chunks can be read back with byte range requests.
+    """
+    payload = bytearray()
+    chunks = []
+    for chunk in by_chunk(lines, chunk_size):
+        if not chunk:
+            continue
+        member = gzip.compress(b"".join(chunk))
+        chunks.append([len(payload), len(member), len(chunk)])
+        payload += member
+
+    index = {"chunk_size": chunk_size, "total": len(lines), "chunks": chunks}
+    return bytes(payload), index
+
+
+def ndjson_gzip_chunks(items, chunk_size):
+    return ndjson_gzip_lines(ndjson_lines(items), chunk_size)
+
+
+def ndjson_page_chunks(index, offset, limit):
+    """
+    Chunks of the index covering items from offset to offset + limit,
+    returned with number of lines to skip in the first one.
+    """
+    chunk_size = index["chunk_size"]
+    first = offset // chunk_size
+    last = (offset + limit - 1) // chunk_size
+    return index["chunks"][first : last + 1], offset - first * chunk_size  # noqa: E203
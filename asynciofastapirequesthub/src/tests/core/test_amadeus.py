@@ -0,0 +1,246 @@
+import asyncio
+
+import httpx
+import orjson
+import pytest
+from starlette.status import HTTP_200_OK, HTTP_503_SERVICE_UNAVAILABLE
+
+from ...helpers.amadeus import (
+    Amadeus,
+    CircuitBreaker,
+    CircuitState,
+    SearchRequestBuilder,
+    parse_flight_offers,
+)
+
+FLIGHTS = [
+    {
+        "departure": {"iata": "WAW"},
+        "arrival": {"iata": "MLE"},
+        "departure_date": "2024-04-25",
+    },
+    {
+        "departure": {"iata": "MLE"},
+        "arrival": {"iata": "WAW"},
+        "departure_date": "2024-05-02",
+    },
+]
+
+
+def test_request_builder_renders_full_request_body():
+    builder = SearchRequestBuilder(
+        passengers_map={"adults": 2, "children": [9]}, currency_code="EUR"
+    )
+
+    assert orjson.loads(builder.render(FLIGHTS)) == {
+        "currencyCode": "EUR",
+        "searchCriteria": {
+            "allowAlternativeFareOptions": True,
+            "additionalInformation": {"chargeableCheckedBags": True},
+        },
+        "originDestinations": [
+            {
+                "id": 1,
+                "originLocationCode": "WAW",
+                "destinationLocationCode": "MLE",
+                "departureDateTimeRange": {"date": "2024-04-25"},
+            },
+            {
+                "id": 2,
+                "originLocationCode": "MLE",
+                "destinationLocationCode": "WAW",
+                "departureDateTimeRange": {"date": "2024-05-02"},
+            },
+        ],
+        "travelers": [
+            {"id": 1, "travelerType": "ADULT", "fareOptions": ["STANDARD"]},
+            {"id": 2, "travelerType": "ADULT", "fareOptions": ["STANDARD"]},
+            {"id": 3, "travelerType": "CHILD", "fareOptions": ["STANDARD"]},
+        ],
+        "sources": ["GDS", "PYTON", "LTC", "EAC", "NDC"],
+    }
+
+
+def test_request_builder_renders_cabin_restrictions_for_all_flights():
+    builder = SearchRequestBuilder(
+        passengers_map={"adults": 1, "children": []}, cabin_class="business"
+    )
+    data = orjson.loads(builder.render(FLIGHTS))
+
+    assert data["searchCriteria"]["flightFilters"] == {
+        "cabinRestrictions": [{"cabin": "BUSINESS", "originDestinationIds": [1, 2]}]
+    }
+
+
+def test_request_builder_renders_max_flight_offers_when_set():
+    passengers_map = {"adults": 1, "children": []}
+    capped = SearchRequestBuilder(passengers_map=passengers_map, max_flight_offers=20)
+    uncapped = SearchRequestBuilder(passengers_map=passengers_map)
+
+    capped_criteria = orjson.loads(capped.render(FLIGHTS))["searchCriteria"]
+    uncapped_criteria = orjson.loads(uncapped.render(FLIGHTS))["searchCriteria"]
+
+    assert capped_criteria["maxFlightOffers"] == 20
+    assert "maxFlightOffers" not in uncapped_criteria
+
+
+def test_request_builder_is_reused_for_task_invariant_params():
+    service = Amadeus(client=None)
+    builder = service.get_request_builder(
+        passengers_map={"adults": 2, "children": [9]},
+        cabin_class="any",
+        currency_code="PLN",
+    )
+
+    assert builder is service.get_request_builder(
+        passengers_map={"adults": 2, "children": [4]},
+        cabin_class="any",
+        currency_code="PLN",
+    )
+    assert builder is not service.get_request_builder(
+        passengers_map={"adults": 2, "children": [9]},
+        cabin_class="any",
+        currency_code="EUR",
+    )
+
+
+def test_parse_flight_offers_returns_data_only():
+    content = orjson.dumps(
+        {
+            "meta": {"count": 1},
+            "data": [{"id": "1", "price": {"grandTotal": "10.00"}}],
+            "dictionaries": {"carriers": {"LO": "LOT"}},
+        }
+    )
+
+    assert parse_flight_offers(content) == [
+        {"id": "1", "price": {"grandTotal": "10.00"}}
+    ]
+
+
+def test_parse_flight_offers_reduces_offers_to_given_fields():
+    content = orjson.dumps(
+        {"data": [{"id": "1", "price": {"grandTotal": "10.00"}, "type": "offer"}]}
+    )
+
+    assert parse_flight_offers(content, fields=["price", "itineraries"]) == [
+        {"price": {"grandTotal": "10.00"}}
+    ]
+
+
+@pytest.mark.parametrize("content", [b'{"errors": [{"code": 38189}]}', b"[]"])
+def test_parse_flight_offers_returns_empty_list_without_data(content):
+    assert parse_flight_offers(content) == []
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def get_breaker(clock):
+    return CircuitBreaker(
+        failure_ratio=0.5, min_requests=4, window=10, open_seconds=30, clock=clock
+    )
+
+
+def test_circuit_breaker_opens_after_failure_ratio_is_reached():
+    breaker = get_breaker(Clock())
+    for success in (True, False, True):
+        breaker.record(success)
+    assert breaker.state == CircuitState.CLOSED
+
+    breaker.record(False)
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.allow() is False
+
+
+def test_circuit_breaker_probes_when_half_open_and_closes_on_success():
+    clock = Clock()
+    breaker = get_breaker(clock)
+    breaker.open()
+
+    clock.now += 30
+    assert breaker.allow() is True
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.allow() is False
+
+    breaker.record(True)
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.allow() is True
+
+
+def test_circuit_breaker_reopens_on_failed_probe():
+    clock = Clock()
+    breaker = get_breaker(clock)
+    breaker.open()
+
+    clock.now += 30
+    assert breaker.allow() is True
+    breaker.record(False)
+
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.allow() is False
+
+
+@pytest.mark.asyncio
+async def test_search_fails_fast_while_route_breaker_is_open():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(HTTP_200_OK, json={"data": [{"id": "1"}]})
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        service = Amadeus(client=client)
+        service.access_token = "token"
+        passengers_map = {"adults": 1, "children": []}
+
+        route = service.breakers.get_route(FLIGHTS)
+        service.breakers.get_route_breaker(route).open()
+
+        r = await service.async_search(flights=FLIGHTS, passengers_map=passengers_map)
+        assert r == {"data": [], "status": HTTP_503_SERVICE_UNAVAILABLE}
+        assert calls == []
+        assert service.breakers.short_circuited == 1
+
+        other_flights = [{**FLIGHTS[0], "arrival": {"iata": "GAN"}}]
+        r = await service.async_search(
+            flights=other_flights, passengers_map=passengers_map
+        )
+        assert r == {"data": [{"id": "1"}], "status": HTTP_200_OK}
+        assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_half_open_probe_releases_breaker():
+    async def handler(request):
+        await asyncio.sleep(10)
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        service = Amadeus(client=client)
+        service.access_token = "token"
+
+        route = service.breakers.get_route(FLIGHTS)
+        breaker = service.breakers.get_route_breaker(route)
+        breaker.open()
+        breaker.opened_at -= breaker.open_seconds
+
+        probe = asyncio.ensure_future(
+            service.async_search(
+                flights=FLIGHTS, passengers_map={"adults": 1, "children": []}
+            )
+        )
+        await asyncio.sleep(0.01)
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert breaker.allow() is False
+
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert breaker.probes == 0
+        assert service.breakers.allow(route) is True
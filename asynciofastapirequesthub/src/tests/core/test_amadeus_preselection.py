@@ -0,0 +1,572 @@
+import pytest
+from starlette.status import HTTP_200_OK
+
+from ...conf import settings
+from ...handlers.tasks.runners.amadeus_preselection import (
+    filter_results,
+    find_subsuming_task,
+    flatten_result,
+    get_combination_key,
+    get_max_flight_offers,
+    get_price_matrix,
+    get_retained_combinations,
+    get_search_currency,
+    get_search_requests,
+    get_task_cost,
+    get_task_shards,
+    handler,
+    update_index,
+)
+from ...helpers import fx
+from ...helpers.aws import AWSServiceAdapter
+from ..helpers import get_amadeus_offer, get_amadeus_task_params
+
+
+def test_price_matrix_contains_cheapest_price_per_dates_and_airports():
+    search_requests = get_search_requests(
+        get_amadeus_task_params(
+            fly_from_airports=["WAW", "KRK"], return_to_airports=["WAW", "KRK"]
+        )
+    )
+    prices = {
+        ("2024-04-25", "WAW"): ["300.00", "200.00"],
+        ("2024-04-25", "KRK"): ["250.00"],
+        ("2024-04-26", "WAW"): ["400.00"],
+        ("2024-04-26", "KRK"): [],
+    }
+    combinations = {
+        get_combination_key(i): {
+            "searched_at": 0,
+            "offers": [
+                get_amadeus_offer(price)
+                for price in prices[
+                    (
+                        i["flights"][0]["departure_date"],
+                        i["flights"][0]["departure"]["iata"],
+                    )
+                ]
+            ],
+        }
+        for i in search_requests
+    }
+
+    assert get_price_matrix(search_requests, combinations) == {
+        "currency_code": "PLN",
+        "by_dates": [
+            {"departure_date": "2024-04-25", "nights": 7, "price": 200.0},
+            {"departure_date": "2024-04-26", "nights": 7, "price": 400.0},
+        ],
+        "by_airports": [
+            {"fly_from": "KRK", "fly_to": "MLE", "price": 250.0},
+            {"fly_from": "WAW", "fly_to": "MLE", "price": 200.0},
+        ],
+    }
+
+
+def test_price_matrix_skips_missing_combinations():
+    search_requests = get_search_requests(get_amadeus_task_params())
+
+    assert get_price_matrix(search_requests, {}) == {
+        "currency_code": None,
+        "by_dates": [],
+        "by_airports": [],
+    }
+
+
+def test_retained_combinations_skip_stale_and_removed_ones():
+    search_requests = get_search_requests(get_amadeus_task_params())
+    fresh, stale = [get_combination_key(i) for i in search_requests]
+    snapshot = {
+        "combinations": {
+            fresh: {"searched_at": 950, "max_flight_offers": None, "offers": []},
+            stale: {"searched_at": 800, "max_flight_offers": None, "offers": []},
+            "2024-01-01|2024-01-08|WAW|MLE|MLE|WAW": {
+                "searched_at": 990,
+                "max_flight_offers": None,
+                "offers": [],
+            },
+        }
+    }
+
+    assert get_retained_combinations(
+        snapshot, search_requests, freshness=100, now=1000
+    ) == {fresh: {"searched_at": 950, "max_flight_offers": None, "offers": []}}
+
+
+@pytest.mark.parametrize(
+    "stored,needed,retained",
+    [
+        (None, None, True),
+        (None, 10, True),
+        (250, 10, True),
+        (10, 10, True),
+        (10, 250, False),
+        (250, None, False),
+        ("missing", 10, False),
+    ],
+)
+def test_retained_combinations_skip_ones_searched_with_lower_cap(
+    stored, needed, retained
+):
+    search_requests = get_search_requests(get_amadeus_task_params())
+    key = get_combination_key(search_requests[0])
+    combination = {"searched_at": 950, "offers": []}
+    if stored != "missing":
+        combination["max_flight_offers"] = stored
+    if isinstance(stored, int):
+        # search got as many offers as cap allowed
+        combination["offers"] = [get_amadeus_offer("100.00")] * stored
+
+    combinations = get_retained_combinations(
+        {"combinations": {key: combination}},
+        search_requests,
+        freshness=100,
+        now=1000,
+        max_flight_offers=needed,
+    )
+
+    assert (key in combinations) is retained
+
+
+def test_retained_combinations_keep_ones_not_truncated_by_lower_cap():
+    search_requests = get_search_requests(get_amadeus_task_params())
+    key = get_combination_key(search_requests[0])
+    combination = {
+        "searched_at": 950,
+        "max_flight_offers": 10,
+        "offers": [get_amadeus_offer("100.00")] * 3,
+    }
+
+    combinations = get_retained_combinations(
+        {"combinations": {key: combination}},
+        search_requests,
+        freshness=100,
+        now=1000,
+        max_flight_offers=250,
+    )
+
+    assert key in combinations
+
+
+@pytest.mark.asyncio
+async def test_refresh_searches_only_stale_combinations(mocker):
+    mocker.patch.object(settings, "JOBS_SNAPSHOTS_ENABLED", True)
+    search_requests = get_search_requests(get_amadeus_task_params())
+    fresh, stale = [get_combination_key(i) for i in search_requests]
+    retained_offer = get_amadeus_offer("100.00")
+    new_offer = get_amadeus_offer("200.00")
+
+    mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.time.time",
+        return_value=10_000,
+    )
+    mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.AWSServiceAdapter.s3_get_json_obj",
+        return_value={
+            "combinations": {
+                fresh: {
+                    "searched_at": 9_990,
+                    "max_flight_offers": 250,
+                    "offers": [retained_offer],
+                },
+                stale: {"searched_at": 0, "max_flight_offers": 250, "offers": []},
+            }
+        },
+    )
+    mocked_s3_put_json_obj = mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.AWSServiceAdapter.s3_put_json_obj"
+    )
+    mocked_search = mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.search",
+        return_value=([{"status": HTTP_200_OK, "data": [new_offer]}], {}),
+    )
+    mocker.patch("src.handlers.tasks.runners.amadeus_preselection.update_index")
+
+    results = await handler("123", get_amadeus_task_params(), task_refresh=True)
+
+    pending = mocked_search.call_args.args[0]
+    assert [get_combination_key(i) for i in pending] == [stale]
+    assert results == [retained_offer, new_offer]
+
+    snapshot = mocked_s3_put_json_obj.call_args.kwargs["message"]
+    assert snapshot["combinations"][stale] == {
+        "searched_at": 10_000,
+        "max_flight_offers": 250,
+        "offers": [new_offer],
+    }
+
+
+@pytest.mark.asyncio
+async def test_refresh_keeps_stale_offers_when_requery_fails(mocker):
+    mocker.patch.object(settings, "JOBS_SNAPSHOTS_ENABLED", True)
+    search_requests = get_search_requests(get_amadeus_task_params())
+    fresh, stale = [get_combination_key(i) for i in search_requests]
+    stale_offer = get_amadeus_offer("300.00")
+
+    mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.time.time",
+        return_value=10_000,
+    )
+    mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.AWSServiceAdapter.s3_get_json_obj",
+        return_value={
+            "combinations": {
+                fresh: {"searched_at": 9_990, "max_flight_offers": 250, "offers": []},
+                stale: {"searched_at": 0, "offers": [stale_offer]},
+            }
+        },
+    )
+    mocked_s3_put_json_obj = mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.AWSServiceAdapter.s3_put_json_obj"
+    )
+    mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.search",
+        return_value=([{"status": 429, "data": []}], {}),
+    )
+
+    results = await handler("123", get_amadeus_task_params(), task_refresh=True)
+
+    assert results == [stale_offer]
+    snapshot = mocked_s3_put_json_obj.call_args.kwargs["message"]
+    assert snapshot["combinations"][stale] == {
+        "searched_at": 0,
+        "offers": [stale_offer],
+    }
+
+
+def test_flatten_result():
+    def segment(departure, arrival, at, carrier):
+        return {
+            "departure": {"iataCode": departure, "at": at},
+            "arrival": {"iataCode": arrival},
+            "carrierCode": carrier,
+        }
+
+    offer = {
+        "id": "1",
+        "price": {"currency": "PLN", "grandTotal": "1234.50"},
+        "validatingAirlineCodes": ["EK"],
+        "itineraries": [
+            {
+                "duration": "PT10H30M",
+                "segments": [
+                    segment("WAW", "DXB", "2024-04-25T10:00:00", "EK"),
+                    segment("DXB", "MLE", "2024-04-25T22:00:00", "EK"),
+                ],
+            },
+            {
+                "duration": "PT9H",
+                "segments": [segment("MLE", "WAW", "2024-05-02T08:00:00", "QR")],
+            },
+        ],
+    }
+
+    assert flatten_result(offer) == {
+        "offer_id": "1",
+        "price": 1234.5,
+        "currency": "PLN",
+        "segments": 3,
+        "duration_hours": 19.5,
+        "outbound_duration_hours": 10.5,
+        "inbound_duration_hours": 9.0,
+        "carriers": ["EK", "QR"],
+        "validating_carriers": ["EK"],
+        "fly_from": "WAW",
+        "fly_to": "MLE",
+        "departure_at": "2024-04-25T10:00:00",
+        "return_at": "2024-05-02T08:00:00",
+    }
+
+
+def test_task_shards_split_departure_dates_within_max_cost():
+    task_params = get_amadeus_task_params(
+        date_from="2024-04-20",
+        date_to="2024-04-26",
+        nights_in_dst_from=6,
+        nights_in_dst_to=8,
+        return_from="2024-04-20",
+        return_to="2024-05-10",
+    )
+
+    shards = get_task_shards(task_params, max_cost=7)
+
+    assert [(i["date_from"], i["date_to"]) for i in shards] == [
+        ("2024-04-20", "2024-04-21"),
+        ("2024-04-22", "2024-04-23"),
+        ("2024-04-24", "2024-04-25"),
+        ("2024-04-26", "2024-04-26"),
+    ]
+    assert sum(get_task_cost(i) for i in shards) == get_task_cost(task_params)
+
+
+def test_task_shards_are_none_when_single_date_is_over_max_cost():
+    assert get_task_shards(get_amadeus_task_params(), max_cost=0) is None
+
+
+def get_wide_task_params():
+    return get_amadeus_task_params(
+        date_to="2024-05-05",
+        fly_from_airports=["GDN", "KRK", "WAW"],
+        fly_to_airports=["GAN", "MLE"],
+        return_from_airports=["GAN", "MLE"],
+        return_to_airports=["GDN", "KRK", "WAW"],
+        nights_in_dst_to=11,
+        return_to="2024-05-12",
+    )
+
+
+def test_find_subsuming_task_returns_task_covering_search_space(mocker):
+    mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.AWSServiceAdapter.s3_get_json_obj",
+        return_value={
+            "tasks": [
+                {
+                    "task_id": "expired",
+                    "task_params": get_wide_task_params(),
+                    "completed_at": 0,
+                },
+                {
+                    "task_id": "narrow",
+                    "task_params": get_amadeus_task_params(date_to="2024-04-25"),
+                    "max_flight_offers": 250,
+                    "completed_at": 10_000,
+                },
+                {
+                    "task_id": "capped",
+                    "task_params": get_wide_task_params(),
+                    "max_flight_offers": 10,
+                    "completed_at": 10_000,
+                },
+                {
+                    "task_id": "wide",
+                    "task_params": get_wide_task_params(),
+                    "max_flight_offers": 250,
+                    "completed_at": 10_000,
+                },
+            ]
+        },
+    )
+    aws = AWSServiceAdapter()
+    now = settings.JOBS_RESULTS_EXPIRE + 100
+
+    # cap of wider task does not stop subsumption, retention checks offers
+    assert find_subsuming_task(aws, get_amadeus_task_params(), now=now) == "capped"
+    assert (
+        find_subsuming_task(
+            aws,
+            get_amadeus_task_params(nights_in_dst_to=12, return_to="2024-05-20"),
+            now=now,
+        )
+        is None
+    )
+
+
+def test_update_index_registers_task_and_drops_expired_ones(mocker):
+    mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.AWSServiceAdapter.s3_get_json_obj",
+        return_value={
+            "tasks": [
+                {"task_id": "old", "task_params": {}, "completed_at": 0},
+                {"task_id": "recent", "task_params": {}, "completed_at": 100},
+            ]
+        },
+    )
+    mocked_s3_put_json_obj = mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.AWSServiceAdapter.s3_put_json_obj"
+    )
+    now = settings.JOBS_RESULTS_EXPIRE + 50
+
+    update_index(AWSServiceAdapter(), "123", get_amadeus_task_params(), now, 250)
+
+    tasks = mocked_s3_put_json_obj.call_args.kwargs["message"]["tasks"]
+    assert [i["task_id"] for i in tasks] == ["123", "recent"]
+    assert tasks[0]["task_params"] == get_amadeus_task_params()
+    assert tasks[0]["max_flight_offers"] == 250
+    assert tasks[0]["combination_keys"] == sorted(
+        get_combination_key(i)
+        for i in get_search_requests(get_amadeus_task_params())
+    )
+
+
+def test_find_subsuming_task_uses_stored_combination_keys(mocker):
+    keys = [
+        get_combination_key(i) for i in get_search_requests(get_wide_task_params())
+    ]
+    mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.AWSServiceAdapter.s3_get_json_obj",
+        return_value={
+            "tasks": [
+                {
+                    "task_id": "wide",
+                    "task_params": get_wide_task_params(),
+                    "combination_keys": keys,
+                    "max_flight_offers": 250,
+                    "completed_at": 10_000,
+                },
+            ]
+        },
+    )
+    mocked_get_search_requests = mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.get_search_requests",
+        wraps=get_search_requests,
+    )
+
+    task_id = find_subsuming_task(
+        AWSServiceAdapter(), get_amadeus_task_params(), now=10_100
+    )
+
+    assert task_id == "wide"
+    # only combinations of the looked up task are built
+    assert mocked_get_search_requests.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_subsumed_task_is_served_from_source_snapshot(mocker):
+    mocker.patch.object(settings, "JOBS_SNAPSHOTS_ENABLED", True)
+    wide_requests = get_search_requests(get_wide_task_params())
+    offers = {get_combination_key(i): get_amadeus_offer("100.00") for i in wide_requests}
+
+    mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.time.time",
+        return_value=10_000,
+    )
+    mocked_s3_get_json_obj = mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.AWSServiceAdapter.s3_get_json_obj",
+        return_value={
+            "combinations": {
+                key: {"searched_at": 9_000, "max_flight_offers": 250, "offers": [offer]}
+                for key, offer in offers.items()
+            }
+        },
+    )
+    mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.AWSServiceAdapter.s3_put_json_obj"
+    )
+    mocked_update_index = mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.update_index"
+    )
+    mocked_search = mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.search",
+        return_value=([], {}),
+    )
+
+    results = await handler("123", get_amadeus_task_params(), task_source_id="wide")
+
+    assert mocked_search.call_args.args[0] == []
+    assert len(results) == 2
+    assert "wide-snapshot" in mocked_s3_get_json_obj.call_args.kwargs["key"]
+    mocked_update_index.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_task_is_searched_in_base_currency_and_converted(mocker):
+    mocker.patch.object(settings, "JOBS_SNAPSHOTS_ENABLED", True)
+    mocker.patch.object(settings, "TASKS_BASE_CURRENCY", "EUR")
+    mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.fx.get_rates",
+        return_value=fx.FxRates({"EUR": "1", "PLN": "4"}),
+    )
+    mocked_s3_put_json_obj = mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.AWSServiceAdapter.s3_put_json_obj"
+    )
+    mocker.patch("src.handlers.tasks.runners.amadeus_preselection.update_index")
+    offer = get_amadeus_offer("100.00")
+    offer["price"].update(currency="EUR", fees=[{"amount": "1.50", "type": "X"}])
+    mocked_search = mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.search",
+        return_value=([{"status": HTTP_200_OK, "data": [offer]}] * 2, {}),
+    )
+
+    results = await handler("123", get_amadeus_task_params(currency_code="PLN"))
+
+    assert {i["currency_code"] for i in mocked_search.call_args.args[0]} == {"EUR"}
+    assert results[0]["price"] == {
+        "currency": "PLN",
+        "total": "400.00",
+        "grandTotal": "400.00",
+        "fees": [{"amount": "6.00", "type": "X"}],
+    }
+    messages = {
+        i.kwargs["key"].rsplit("-", 1)[-1]: i.kwargs["message"]
+        for i in mocked_s3_put_json_obj.call_args_list
+    }
+    assert messages["matrix"]["currency_code"] == "PLN"
+    assert messages["matrix"]["by_dates"][0]["price"] == 400.0
+    assert messages["snapshot"]["currency_code"] == "EUR"
+    snapshot_offers = list(messages["snapshot"]["combinations"].values())[0]["offers"]
+    assert snapshot_offers == [offer]
+
+
+@pytest.mark.parametrize("snapshots_enabled,expected", [(True, "EUR"), (False, "PLN")])
+def test_base_currency_is_searched_only_with_snapshots(
+    mocker, snapshots_enabled, expected
+):
+    mocker.patch.object(settings, "JOBS_SNAPSHOTS_ENABLED", snapshots_enabled)
+    mocker.patch.object(settings, "TASKS_BASE_CURRENCY", "EUR")
+    mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.fx.get_rates",
+        return_value=fx.FxRates({"EUR": "1", "PLN": "4"}),
+    )
+
+    assert get_search_currency(None, "PLN") == expected
+
+
+@pytest.mark.parametrize(
+    "combinations_count,expected",
+    [(0, None), (1, 250), (4, 250), (11, 250), (40, 70), (1000, 10)],
+)
+def test_max_flight_offers_depend_on_number_of_combinations(
+    combinations_count, expected
+):
+    assert get_max_flight_offers(combinations_count) == expected
+
+
+@pytest.mark.parametrize("combinations_count", [12, 40, 300])
+def test_max_flight_offers_keep_number_of_filtered_results(combinations_count):
+    # every combination has more offers than cap, cheapest come first
+    combinations = [
+        [
+            get_amadeus_offer(f"{100 + i:.2f}", duration=f"PT{1 + (i * 7 + j) % 20}H")
+            for i in range(250)
+        ]
+        for j in range(combinations_count)
+    ]
+    cap = get_max_flight_offers(combinations_count)
+
+    uncapped = filter_results([i for offers in combinations for i in offers])
+    capped = filter_results([i for offers in combinations for i in offers[:cap]])
+
+    assert len(capped) == len(uncapped) == 250
+
+
+@pytest.mark.asyncio
+async def test_two_phase_requeries_truncated_combinations(mocker):
+    mocker.patch.object(settings, "AMADEUS_TWO_PHASE_ENABLED", True)
+    mocker.patch.object(settings, "AMADEUS_MIN_FLIGHT_OFFERS", 1)
+    mocker.patch.object(settings, "AMADEUS_FLIGHT_OFFERS_OVERSAMPLING", 0.0001)
+    mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.AWSServiceAdapter.s3_put_json_obj"
+    )
+    mocker.patch("src.handlers.tasks.runners.amadeus_preselection.update_index")
+    cheap, expensive = get_amadeus_offer("100.00"), get_amadeus_offer("300.00")
+    mocked_search = mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.search",
+        side_effect=[
+            (
+                [
+                    {"status": HTTP_200_OK, "data": [cheap]},
+                    {"status": HTTP_200_OK, "data": []},
+                ],
+                {},
+            ),
+            ([{"status": HTTP_200_OK, "data": [cheap, expensive]}], {}),
+        ],
+    )
+
+    results = await handler("123", get_amadeus_task_params())
+
+    first, second = [i.args[0] for i in mocked_search.call_args_list]
+    assert [i["max_flight_offers"] for i in first] == [1, 1]
+    assert [i["max_flight_offers"] for i in second] == [250]
+    assert get_combination_key(second[0]) == get_combination_key(first[0])
+    assert results == [cheap, expensive]
@@ -0,0 +1,80 @@
+import gzip
+import io
+from datetime import datetime, timezone
+
+import orjson
+from botocore.response import StreamingBody
+
+from ...conf import settings
+from ...handlers.tasks.jobs import get_sqs_mock_data
+from ...helpers.aws import AWSServiceAdapter
+
+
+def test_sqs_message_under_threshold_is_sent_inline(mocker):
+    mocked_s3_put_obj = mocker.patch("src.helpers.aws.AWSServiceAdapter.s3_put_obj")
+    aws = AWSServiceAdapter()
+
+    body = aws.sqs_encode_message({"task_id": "123"})
+
+    assert orjson.loads(body) == {"task_id": "123"}
+    assert aws.sqs_decode_body(body) == {"task_id": "123"}
+    mocked_s3_put_obj.assert_not_called()
+
+
+def test_sqs_message_over_threshold_is_offloaded_to_s3(mocker):
+    mocker.patch.object(settings, "SQS_CLAIM_CHECK_THRESHOLD", 100)
+    stored = {}
+    mocker.patch(
+        "src.helpers.aws.AWSServiceAdapter.s3_put_obj",
+        side_effect=lambda bucket, key, body: stored.update({key: body}),
+    )
+    mocker.patch(
+        "src.helpers.aws.get_client_s3",
+        return_value=mocker.Mock(
+            get_object=lambda Bucket, Key: {
+                "Body": StreamingBody(io.BytesIO(stored[Key]), len(stored[Key]))
+            }
+        ),
+    )
+    aws = AWSServiceAdapter()
+    message = {"task_id": "123", "task_params": {"airports": ["WAW"] * 100}}
+
+    body = aws.sqs_encode_message(message)
+
+    claim_check = orjson.loads(body)["claim_check"]
+    assert claim_check["bucket"] == settings.JOBS_BUCKET
+    assert claim_check["key"].startswith("_claims/")
+    assert orjson.loads(gzip.decompress(stored[claim_check["key"]])) == message
+    assert aws.sqs_decode_body(body) == message
+
+    event, _ = get_sqs_mock_data(task_id="123", task_name="task")
+    assert aws.sqs_get_messages(event)[0]["body"]["task_id"] == "123"
+
+
+def test_flat_keys_are_looked_up_after_partitions(mocker):
+    mocker.patch.object(settings, "JOBS_KEYS_PARTITIONED", True)
+    mocker.patch.object(settings, "JOBS_RESULTS_EXPIRE", 3600 * 24)
+    now = datetime(2024, 4, 25, 12, tzinfo=timezone.utc)
+    aws = AWSServiceAdapter()
+
+    assert aws.key_partitions(now) == ["2024-04-25", "2024-04-24", "2024-04-23", ""]
+
+    mocker.patch.object(settings, "JOBS_KEYS_FLAT_FALLBACK", False)
+    assert aws.key_partitions(now) == ["2024-04-25", "2024-04-24", "2024-04-23"]
+
+
+def test_results_of_messages_sent_before_partitioning_are_found(mocker):
+    mocker.patch.object(settings, "JOBS_KEYS_PARTITIONED", True)
+    existing = {"123-results"}
+    mocker.patch.object(
+        AWSServiceAdapter,
+        "s3_check_key_exists",
+        side_effect=lambda bucket, key: key in existing,
+    )
+
+    partition = AWSServiceAdapter().s3_find_partition(
+        bucket=settings.JOBS_BUCKET,
+        key_func=lambda partition: AWSServiceAdapter().key_results("123", partition),
+    )
+
+    assert partition == ""
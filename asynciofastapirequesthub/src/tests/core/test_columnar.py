@@ -0,0 +1,31 @@
+import io
+
+import pytest
+
+from ...helpers import columnar
+
+pa = pytest.importorskip("pyarrow")
+
+ROWS = [
+    {"task_id": "123", "price": 100.5, "carriers": ["LO", "EK"]},
+    {"task_id": "123", "price": 200.0, "carriers": ["QR"]},
+]
+
+
+def test_dumps_parquet():
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(io.BytesIO(columnar.dumps(ROWS)))
+    assert table.to_pylist() == ROWS
+
+
+def test_dumps_arrow_ipc():
+    table = pa.ipc.open_file(
+        pa.BufferReader(columnar.dumps(ROWS, fmt=columnar.ColumnarFormat.ARROW))
+    ).read_all()
+    assert table.to_pylist() == ROWS
+
+
+def test_dumps_raises_for_unknown_format():
+    with pytest.raises(ValueError):
+        columnar.dumps(ROWS, fmt="csv")
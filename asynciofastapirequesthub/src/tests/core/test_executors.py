@@ -0,0 +1,61 @@
+import concurrent.futures
+import threading
+
+import pytest
+
+from ...conf import settings
+from ...helpers import executors
+
+
+def get_thread_name():
+    return threading.current_thread().name
+
+
+@pytest.fixture(autouse=True)
+def clear_executor():
+    executors.get_executor.cache_clear()
+    executors.get_thread_executor.cache_clear()
+    yield
+    executors.get_executor.cache_clear()
+    executors.get_thread_executor.cache_clear()
+
+
+@pytest.mark.asyncio
+async def test_run_cpu_bound_off_event_loop_thread(mocker):
+    mocker.patch.object(settings, "JOBS_CPU_EXECUTOR", "thread")
+
+    assert (await executors.run_cpu_bound(get_thread_name)).startswith("cpu")
+
+
+@pytest.mark.asyncio
+async def test_run_cpu_bound_inline_when_disabled(mocker):
+    mocker.patch.object(settings, "JOBS_CPU_EXECUTOR", "")
+
+    assert await executors.run_cpu_bound(get_thread_name) == get_thread_name()
+
+
+def test_process_pool_falls_back_to_threads(mocker):
+    mocker.patch.object(settings, "JOBS_CPU_EXECUTOR", "process")
+    mocker.patch.object(settings, "JOBS_CPU_WORKERS", 2)
+    mocker.patch(
+        "src.helpers.executors.concurrent.futures.ProcessPoolExecutor",
+        side_effect=OSError("[Errno 38] Function not implemented"),
+    )
+
+    executor = executors.get_executor()
+
+    assert isinstance(executor, concurrent.futures.ThreadPoolExecutor)
+    assert executor._max_workers == 2
+
+
+@pytest.mark.asyncio
+async def test_threaded_stages_skip_process_pool(mocker):
+    mocker.patch.object(settings, "JOBS_CPU_EXECUTOR", "process")
+    mocked_process_pool = mocker.patch(
+        "src.helpers.executors.concurrent.futures.ProcessPoolExecutor"
+    )
+
+    name = await executors.run_cpu_bound(get_thread_name, threaded=True)
+
+    assert name.startswith("cpu")
+    mocked_process_pool.assert_not_called()
@@ -0,0 +1,46 @@
+from botocore.exceptions import ClientError
+
+from ...helpers import fx
+from ...helpers.aws import AWSServiceAdapter
+
+ECB_RATES = b"""<?xml version="1.0" encoding="UTF-8"?>
+<gesmes:Envelope xmlns:gesmes="http://www.gesmes.org/xml/2002-08-01" xmlns="http://www.ecb.int/vocabulary/2002-08-01/eurofxref">
+    <gesmes:subject>Reference rates</gesmes:subject>
+    <Cube>
+        <Cube time="2024-04-25">
+            <Cube currency="USD" rate="1.0715"/>
+            <Cube currency="PLN" rate="4.3283"/>
+        </Cube>
+    </Cube>
+</gesmes:Envelope>"""
+
+
+def test_parse_ecb_rates():
+    assert fx.parse_ecb_rates(ECB_RATES) == {
+        "EUR": "1",
+        "USD": "1.0715",
+        "PLN": "4.3283",
+    }
+
+
+def test_fx_rates_convert_between_any_currencies():
+    rates = fx.FxRates(fx.parse_ecb_rates(ECB_RATES))
+
+    assert rates.supports("EUR", "PLN")
+    assert not rates.supports("EUR", "GBP")
+    assert rates.convert("100.00", "EUR", "PLN") == "432.83"
+    assert rates.convert("432.83", "PLN", "EUR") == "100.00"
+    assert rates.convert("100", "USD", "PLN") == "403.95"
+
+
+def test_get_rates_are_cached_and_empty_when_missing(mocker):
+    mocker.patch.dict(fx.cache, {"rates": None, "loaded_at": 0.0})
+    mocked_s3_get_json_obj = mocker.patch(
+        "src.helpers.aws.AWSServiceAdapter.s3_get_json_obj",
+        side_effect=ClientError(error_response={}, operation_name="name"),
+    )
+    aws = AWSServiceAdapter()
+
+    assert not fx.get_rates(aws, now=10_000).supports("EUR")
+    assert not fx.get_rates(aws, now=10_001).supports("EUR")
+    assert mocked_s3_get_json_obj.call_count == 1
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from ...conf import settings
+from ...helpers.hedging import Hedger, LatencyTracker, get_hedge_budget
+
+
+def get_factory(delays):
+    calls = []
+
+    async def factory():
+        index = len(calls)
+        calls.append(index)
+        await asyncio.sleep(delays[index])
+        return index
+
+    return factory, calls
+
+
+def test_latency_tracker_percentile():
+    tracker = LatencyTracker()
+    assert tracker.percentile(0.95) is None
+
+    for i in range(1, 101):
+        tracker.observe(i)
+
+    assert tracker.percentile(0.5) == 50
+    assert tracker.percentile(0.95) == 95
+    assert tracker.percentile(1) == 100
+
+
+@pytest.mark.asyncio
+async def test_hedger_does_not_hedge_before_collecting_samples():
+    hedger = Hedger(percentile=0.5, min_samples=5, max_ratio=1)
+    factory, calls = get_factory([0.01])
+
+    assert await hedger.run(factory) == 0
+    assert calls == [0]
+    assert hedger.stats == {"hedges_issued": 0, "hedges_won": 0}
+
+
+@pytest.mark.asyncio
+async def test_hedger_returns_first_response_of_slow_request():
+    hedger = Hedger(percentile=0.5, min_samples=1, max_ratio=1)
+    hedger.latencies.observe(0.01)
+    factory, calls = get_factory([1, 0.01])
+
+    assert await hedger.run(factory) == 1
+    assert calls == [0, 1]
+    assert hedger.stats == {"hedges_issued": 1, "hedges_won": 1}
+
+
+@pytest.mark.asyncio
+async def test_hedger_keeps_hedges_within_ratio():
+    hedger = Hedger(percentile=0.5, min_samples=1, max_ratio=0.5)
+    hedger.latencies.observe(0.01)
+    factory, calls = get_factory([0.05, 0.05])
+
+    assert await hedger.run(factory) == 0
+    assert calls == [0]
+    assert hedger.stats == {"hedges_issued": 0, "hedges_won": 0}
+
+
+def get_status_factory(responses):
+    calls = []
+
+    async def factory():
+        delay, status = responses[len(calls)]
+        calls.append(status)
+        await asyncio.sleep(delay)
+        return {"status": status}
+
+    return factory, calls
+
+
+@pytest.mark.asyncio
+async def test_hedger_ignores_fast_failed_hedge():
+    hedger = Hedger(
+        percentile=0.5,
+        min_samples=1,
+        max_ratio=1,
+        accept=lambda r: r["status"] == 200,
+    )
+    hedger.latencies.observe(0.01)
+    factory, calls = get_status_factory([(0.05, 200), (0, 503)])
+
+    assert await hedger.run(factory) == {"status": 200}
+    assert calls == [200, 503]
+    assert hedger.stats == {"hedges_issued": 1, "hedges_won": 0}
+
+
+@pytest.mark.asyncio
+async def test_hedger_returns_primary_when_neither_is_accepted():
+    hedger = Hedger(
+        percentile=0.5,
+        min_samples=1,
+        max_ratio=1,
+        accept=lambda r: r["status"] == 200,
+    )
+    hedger.latencies.observe(0.01)
+    factory, _ = get_status_factory([(0.05, 429), (0, 503)])
+
+    assert await hedger.run(factory) == {"status": 429}
+
+
+@pytest.mark.asyncio
+async def test_hedger_does_not_hedge_without_budget():
+    hedger = Hedger(
+        percentile=0.5, min_samples=1, max_ratio=1, max_at_once=1, max_per_second=0
+    )
+    hedger.latencies.observe(0.01)
+    factory, calls = get_factory([0.05, 0.01])
+
+    assert await hedger.run(factory) == 0
+    assert calls == [0]
+
+
+def test_hedge_budget_is_carved_out_of_job_limits(mocker):
+    mocker.patch.object(settings, "AMADEUS_HEDGE_MAX_RATIO", 0.05)
+
+    assert get_hedge_budget(50, 50) == ((47, 47), (3, 3))
+    assert get_hedge_budget(1, 1) == ((1, 1), (0, 0))
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[3]
+
+# generous budgets (microseconds), they guard against regressions like
+# eager clients or provider imports, not against slow CI machines
+BUDGETS = {
+    "src.handlers.api.web": 4_000_000,
+    "src.handlers.tasks.jobs": 3_000_000,
+}
+
+# pulled in lazily, on first use
+LAZY_MODULES = {
+    "src.handlers.api.web": ["boto3", "sentry_sdk", "src.handlers.tasks.runners"],
+    "src.handlers.tasks.jobs": ["boto3", "sentry_sdk"],
+}
+
+
+def get_import_times(module):
+    env = {**os.environ, "ENV_NAME": "test", "SENTRY_DSN": ""}
+    r = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    times = {}
+    for line in r.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize("module", BUDGETS.keys())
+def test_handler_import_within_budget(module):
+    times = get_import_times(module)
+
+    assert times[module] < BUDGETS[module]
+    for lazy_module in LAZY_MODULES[module]:
+        assert lazy_module not in times
@@ -0,0 +1,225 @@
+import concurrent.futures
+import gzip
+
+import orjson
+import pytest
+from botocore.exceptions import ClientError
+
+from ...conf import settings
+from ...handlers.tasks.jobs import async_handler, get_sqs_mock_data
+from ...helpers import consts
+
+
+@pytest.mark.asyncio
+async def test_revalidation_keeps_cached_results_until_new_ones_are_ready(mocker):
+    mocked_s3_put_json_obj = mocker.patch(
+        "src.handlers.tasks.jobs.AWSServiceAdapter.s3_put_json_obj"
+    )
+    mocker.patch(
+        "src.handlers.tasks.jobs.AWSServiceAdapter.s3_get_json_obj",
+        return_value={"revalidation_id": "abc"},
+    )
+    mocked_s3_delete_objects = mocker.patch(
+        "src.handlers.tasks.jobs.AWSServiceAdapter.s3_delete_objects"
+    )
+    mocker.patch("src.handlers.tasks.jobs.run_job", side_effect=ValueError)
+
+    await async_handler(
+        *get_sqs_mock_data(
+            task_id="123",
+            task_name=consts.Tasks.AMADEUS_PRESELECTION,
+            task_refresh=True,
+            task_partition="2024-04-25",
+            task_revalidate=True,
+            task_revalidation_id="abc",
+        )
+    )
+
+    mocked_s3_put_json_obj.assert_not_called()
+    mocked_s3_delete_objects.assert_called_once_with(
+        bucket=settings.JOBS_BUCKET, items=["2024-04-25/123-revalidation"]
+    )
+
+
+@pytest.mark.asyncio
+async def test_revalidation_marker_of_newer_revalidation_is_kept(mocker):
+    mocker.patch(
+        "src.handlers.tasks.jobs.AWSServiceAdapter.s3_get_json_obj",
+        return_value={"revalidation_id": "newer"},
+    )
+    mocked_s3_delete_objects = mocker.patch(
+        "src.handlers.tasks.jobs.AWSServiceAdapter.s3_delete_objects"
+    )
+    mocker.patch("src.handlers.tasks.jobs.run_job", side_effect=ValueError)
+
+    await async_handler(
+        *get_sqs_mock_data(
+            task_id="123",
+            task_name=consts.Tasks.AMADEUS_PRESELECTION,
+            task_refresh=True,
+            task_partition="2024-04-25",
+            task_revalidate=True,
+            task_revalidation_id="abc",
+        )
+    )
+
+    mocked_s3_delete_objects.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_results_are_stored_gzipped_once_serialized(mocker):
+    mocked_s3_put_json_obj = mocker.patch(
+        "src.handlers.tasks.jobs.AWSServiceAdapter.s3_put_json_obj"
+    )
+    mocker.patch("src.handlers.tasks.jobs.AWSServiceAdapter.s3_delete_objects")
+    mocked_s3_put_obj = mocker.patch(
+        "src.handlers.tasks.jobs.AWSServiceAdapter.s3_put_obj"
+    )
+    mocker.patch("src.handlers.tasks.jobs.run_job", return_value=[{"id": 1}])
+
+    await async_handler(
+        *get_sqs_mock_data(
+            task_id="123",
+            task_name=consts.Tasks.AMADEUS_PRESELECTION,
+            task_partition="2024-04-25",
+        )
+    )
+
+    stored = {
+        i.kwargs["key"]: i.kwargs["body"] for i in mocked_s3_put_obj.call_args_list
+    }
+    assert orjson.loads(gzip.decompress(stored["2024-04-25/123-results"])) == {
+        "status": consts.TaskStatus.READY,
+        "results": [{"id": 1}],
+    }
+    index = mocked_s3_put_json_obj.call_args.kwargs
+    assert index["key"] == "2024-04-25/123-results.index"
+    version = index["message"]["version"]
+    assert (
+        gzip.decompress(stored[f"2024-04-25/123-results-{version}.ndjson.gz"])
+        == b'{"id":1}\n'
+    )
+
+
+@pytest.mark.asyncio
+async def test_only_serialized_bytes_are_passed_to_process_pool(mocker):
+    mocker.patch.object(settings, "JOBS_CPU_EXECUTOR", "process")
+    mocker.patch.object(settings, "JOBS_RESULTS_NDJSON_ENABLED", True)
+    mocker.patch("src.handlers.tasks.jobs.AWSServiceAdapter.s3_put_json_obj")
+    mocker.patch("src.handlers.tasks.jobs.AWSServiceAdapter.s3_delete_objects")
+    mocker.patch("src.handlers.tasks.jobs.AWSServiceAdapter.s3_put_obj")
+    mocker.patch("src.handlers.tasks.jobs.run_job", return_value=[{"id": 1}])
+    process_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    mocked_submit = mocker.patch.object(
+        process_pool, "submit", wraps=process_pool.submit
+    )
+    mocker.patch(
+        "src.handlers.tasks.jobs.executors.get_executor", return_value=process_pool
+    )
+
+    await async_handler(
+        *get_sqs_mock_data(
+            task_id="123",
+            task_name=consts.Tasks.AMADEUS_PRESELECTION,
+            task_partition="2024-04-25",
+        )
+    )
+
+    submitted = [i.args[1:] for i in mocked_submit.call_args_list]
+    assert submitted
+    assert all(isinstance(i[0], (bytes, list)) for i in submitted)
+    assert all(
+        isinstance(line, bytes)
+        for i in submitted
+        if isinstance(i[0], list)
+        for line in i[0]
+    )
+
+
+@pytest.mark.asyncio
+async def test_previous_results_pages_are_deleted_when_task_is_pending(mocker):
+    mocker.patch.object(settings, "JOBS_KEYS_PARTITIONED", True)
+    mocker.patch(
+        "src.handlers.tasks.jobs.AWSServiceAdapter.key_partitions",
+        return_value=["2024-04-26", "2024-04-25"],
+    )
+    mocked_s3_put_json_obj = mocker.patch(
+        "src.handlers.tasks.jobs.AWSServiceAdapter.s3_put_json_obj"
+    )
+    mocked_s3_delete_objects = mocker.patch(
+        "src.handlers.tasks.jobs.AWSServiceAdapter.s3_delete_objects"
+    )
+    mocker.patch("src.handlers.tasks.jobs.run_job", side_effect=ValueError)
+
+    await async_handler(
+        *get_sqs_mock_data(
+            task_id="123",
+            task_name=consts.Tasks.AMADEUS_PRESELECTION,
+            task_partition="2024-04-25",
+        )
+    )
+
+    assert mocked_s3_put_json_obj.call_args_list[0].kwargs["message"] == {
+        "status": consts.TaskStatus.PENDING,
+        "results": None,
+    }
+    mocked_s3_delete_objects.assert_called_once_with(
+        bucket=settings.JOBS_BUCKET,
+        items=[
+            "2024-04-25/123-results.index",
+            "2024-04-25/123-results.ndjson.gz",
+            "2024-04-26/123-results.index",
+            "2024-04-26/123-results.ndjson.gz",
+        ],
+    )
+
+
+@pytest.mark.asyncio
+async def test_undecodable_message_does_not_fail_others(mocker):
+    mocker.patch("src.handlers.tasks.jobs.AWSServiceAdapter.s3_put_json_obj")
+    mocker.patch("src.handlers.tasks.jobs.AWSServiceAdapter.s3_put_obj")
+    mocker.patch("src.handlers.tasks.jobs.AWSServiceAdapter.s3_delete_objects")
+    mocker.patch(
+        "src.handlers.tasks.jobs.AWSServiceAdapter.s3_get_json_obj",
+        side_effect=ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject"),
+    )
+    mocked_run_job = mocker.patch(
+        "src.handlers.tasks.jobs.run_job", return_value=[{"id": 1}]
+    )
+    event, context = get_sqs_mock_data(
+        task_id="123", task_name=consts.Tasks.AMADEUS_PRESELECTION
+    )
+    claimed = {
+        **event["Records"][0],
+        "messageId": "claimed",
+        "body": orjson.dumps(
+            {"claim_check": {"bucket": settings.JOBS_BUCKET, "key": "_claims/1"}}
+        ).decode(),
+    }
+
+    await async_handler({"Records": [claimed, *event["Records"]]}, context)
+
+    assert [i.kwargs["task_id"] for i in mocked_run_job.call_args_list] == ["123"]
+
+
+@pytest.mark.asyncio
+async def test_memory_phases_are_reported_when_profiling(mocker):
+    mocker.patch.object(settings, "JOBS_MEMORY_PROFILING", True)
+    mocker.patch("src.handlers.tasks.jobs.AWSServiceAdapter.s3_put_json_obj")
+    mocker.patch("src.handlers.tasks.jobs.AWSServiceAdapter.s3_put_obj")
+    mocker.patch("src.handlers.tasks.jobs.AWSServiceAdapter.s3_delete_objects")
+    mocked_run_job = mocker.patch(
+        "src.handlers.tasks.jobs.run_job", return_value=[{"id": 1}]
+    )
+    mocked_emit = mocker.patch("src.handlers.tasks.jobs.metrics.emit")
+
+    await async_handler(
+        *get_sqs_mock_data(task_id="123", task_name=consts.Tasks.AMADEUS_PRESELECTION)
+    )
+
+    profiler = mocked_run_job.call_args.kwargs["profiler"]
+    assert list(profiler.phases) == ["serialize"]
+    assert profiler.started is False
+    assert mocked_emit.call_args.kwargs["dimensions"] == {
+        "TaskName": consts.Tasks.AMADEUS_PRESELECTION
+    }
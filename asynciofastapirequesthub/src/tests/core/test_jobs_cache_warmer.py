@@ -0,0 +1,159 @@
+import pytest
+from botocore.exceptions import ClientError
+
+from ...conf import settings
+from ...handlers.tasks.jobs_cache_warmer import async_handler, is_warm
+from ...helpers import consts
+from ...helpers.aws import AWSServiceAdapter
+from ..helpers import get_amadeus_task_params
+
+
+def get_popularity_pages(counts):
+    prefix = AWSServiceAdapter().key_popularity_prefix(
+        AWSServiceAdapter().key_partition()
+    )
+    return [
+        {
+            "Contents": [
+                {"Key": f"{prefix}{task_id}-{i}"}
+                for task_id, count in counts.items()
+                for i in range(count)
+            ]
+        }
+    ]
+
+
+@pytest.mark.asyncio
+async def test_warms_most_popular_tasks_within_budget(mocker):
+    mocker.patch.object(settings, "JOBS_WARMER_BUDGET", 4)
+    mocker.patch(
+        "src.handlers.tasks.jobs_cache_warmer.AWSServiceAdapter.key_partitions",
+        return_value=[AWSServiceAdapter().key_partition()],
+    )
+    mocker.patch(
+        "src.handlers.tasks.jobs_cache_warmer.AWSServiceAdapter.s3_get_obj_iterator",
+        return_value=get_popularity_pages({"hot": 5, "warm": 4, "big": 3, "cold": 1}),
+    )
+    mocker.patch(
+        "src.handlers.tasks.jobs_cache_warmer.AWSServiceAdapter.s3_find_partition",
+        side_effect=lambda bucket, key_func: "p" if "warm" in key_func("p") else None,
+    )
+    # warm task results are fresh, "cold" one is being revalidated already
+    mocker.patch(
+        "src.handlers.tasks.jobs_cache_warmer.AWSServiceAdapter.s3_get_obj_age",
+        side_effect=lambda bucket, key: (
+            0 if "warm" in key or "cold-revalidation" in key else None
+        ),
+    )
+    mocked_s3_put_json_obj = mocker.patch(
+        "src.handlers.tasks.jobs_cache_warmer.AWSServiceAdapter.s3_put_json_obj"
+    )
+    params = {
+        "hot": get_amadeus_task_params(),
+        "big": get_amadeus_task_params(date_to="2024-04-26", nights_in_dst_to=8),
+        "cold": get_amadeus_task_params(),
+    }
+
+    def s3_get_json_obj(bucket, key, gzipped):
+        if key.startswith("_warmer/"):
+            raise ClientError(error_response={}, operation_name="GetObject")
+        return {
+            "task_name": consts.Tasks.AMADEUS_PRESELECTION,
+            "task_params": params[key.rsplit("/", 1)[-1].split("-")[0]],
+        }
+
+    mocker.patch(
+        "src.handlers.tasks.jobs_cache_warmer.AWSServiceAdapter.s3_get_json_obj",
+        side_effect=s3_get_json_obj,
+    )
+    mocker.patch(
+        "src.handlers.tasks.jobs_cache_warmer.AWSServiceAdapter.sqs_get_queue_url"
+    )
+    mocked_sqs_send_json_message = mocker.patch(
+        "src.handlers.tasks.jobs_cache_warmer.AWSServiceAdapter.sqs_send_json_message"
+    )
+
+    stats = await async_handler(None, None)
+
+    sent = [i.kwargs["message"] for i in mocked_sqs_send_json_message.call_args_list]
+    assert [i["task_id"] for i in sent] == ["hot"]
+    assert all(i["task_revalidate"] and i["task_refresh"] for i in sent)
+    assert all(i["task_lane"] == consts.TaskLane.BULK for i in sent)
+    # marker is written after send, holding id the job releases it by
+    marker, spend = [i.kwargs for i in mocked_s3_put_json_obj.call_args_list]
+    assert marker["key"] == f"{AWSServiceAdapter().key_partition()}/hot-revalidation"
+    assert marker["message"] == {"revalidation_id": sent[0]["task_revalidation_id"]}
+    assert spend["key"].startswith("_warmer/")
+    assert spend["message"] == {"spent": 2}
+    assert stats == {
+        "tracked": 4,
+        "warm": 1,
+        "warmed": 1,
+        "revalidating": 1,
+        "skipped": 1,
+        "spent": 2,
+    }
+
+
+@pytest.mark.asyncio
+async def test_budget_is_shared_by_runs_of_a_day(mocker):
+    mocker.patch.object(settings, "JOBS_WARMER_BUDGET", 4)
+    mocker.patch(
+        "src.handlers.tasks.jobs_cache_warmer.AWSServiceAdapter.key_partitions",
+        return_value=[AWSServiceAdapter().key_partition()],
+    )
+    mocker.patch(
+        "src.handlers.tasks.jobs_cache_warmer.AWSServiceAdapter.s3_get_obj_iterator",
+        return_value=get_popularity_pages({"hot": 5}),
+    )
+    mocker.patch(
+        "src.handlers.tasks.jobs_cache_warmer.AWSServiceAdapter.s3_find_partition",
+        return_value=None,
+    )
+    mocker.patch(
+        "src.handlers.tasks.jobs_cache_warmer.AWSServiceAdapter.s3_get_json_obj",
+        side_effect=lambda bucket, key, gzipped: (
+            {"spent": 3}
+            if key.startswith("_warmer/")
+            else {
+                "task_name": consts.Tasks.AMADEUS_PRESELECTION,
+                "task_params": get_amadeus_task_params(),
+            }
+        ),
+    )
+    mocked_s3_put_json_obj = mocker.patch(
+        "src.handlers.tasks.jobs_cache_warmer.AWSServiceAdapter.s3_put_json_obj"
+    )
+    mocker.patch(
+        "src.handlers.tasks.jobs_cache_warmer.AWSServiceAdapter.sqs_get_queue_url"
+    )
+    mocked_sqs_send_json_message = mocker.patch(
+        "src.handlers.tasks.jobs_cache_warmer.AWSServiceAdapter.sqs_send_json_message"
+    )
+
+    stats = await async_handler(None, None)
+
+    # task of cost 2 does not fit in what is left of today's budget
+    mocked_sqs_send_json_message.assert_not_called()
+    mocked_s3_put_json_obj.assert_not_called()
+    assert stats["skipped"] == 1
+    assert stats["spent"] == 0
+
+
+@pytest.mark.parametrize(
+    "age,expected",
+    [(None, False), (0, True), (3600 * 1.5, False), (3600 * 4, False)],
+)
+def test_results_turning_stale_before_next_run_are_not_warm(mocker, age, expected):
+    mocker.patch.object(settings, "JOBS_RESULTS_SOFT_TTL", 3600 * 3)
+    mocker.patch.object(settings, "JOBS_WARMER_INTERVAL", 3600 * 2)
+    mocker.patch(
+        "src.handlers.tasks.jobs_cache_warmer.AWSServiceAdapter.s3_find_partition",
+        return_value="p",
+    )
+    mocker.patch(
+        "src.handlers.tasks.jobs_cache_warmer.AWSServiceAdapter.s3_get_obj_age",
+        return_value=age,
+    )
+
+    assert is_warm(AWSServiceAdapter(), "123") is expected
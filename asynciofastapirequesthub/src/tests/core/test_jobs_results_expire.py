@@ -59,3 +59,90 @@ async def test_schedules_delete(mocker):
     mocked_s3_delete_objects.assert_called_with(
         bucket=settings.JOBS_BUCKET, items=["test-key"]
     )
+
+
+@pytest.mark.asyncio
+async def test_lists_and_deletes_only_expired_partitions(mocker):
+    now = datetime.now(timezone.utc)
+    expired = now - timedelta(days=3)
+    fresh = now.strftime("%Y-%m-%d/")
+    old = expired.strftime("%Y-%m-%d/")
+    pages = {
+        "": [{"CommonPrefixes": [{"Prefix": old}, {"Prefix": fresh}, {"Prefix": "x/"}]}],
+        old: [
+            {
+                "Contents": [{"Key": f"{old}123-results", "LastModified": expired}],
+                "CommonPrefixes": [{"Prefix": f"{old}nested/"}],
+            }
+        ],
+        f"{old}nested/": [
+            {"Contents": [{"Key": f"{old}nested/123", "LastModified": expired}]}
+        ],
+    }
+    mocked_s3_get_obj_iterator = mocker.patch(
+        "src.handlers.tasks.jobs_results_expire.AWSServiceAdapter.s3_get_obj_iterator",
+        side_effect=lambda bucket, prefix: pages[prefix],
+    )
+    mocked_s3_delete_objects = mocker.patch(
+        "src.handlers.tasks.jobs_results_expire.AWSServiceAdapter.s3_delete_objects"
+    )
+
+    await async_handler(None, None)
+
+    listed = [i.kwargs["prefix"] for i in mocked_s3_get_obj_iterator.call_args_list]
+    assert listed == ["", old, f"{old}nested/"]
+    mocked_s3_delete_objects.assert_called_once_with(
+        bucket=settings.JOBS_BUCKET, items=[f"{old}123-results", f"{old}nested/123"]
+    )
+
+
+@pytest.mark.asyncio
+async def test_claim_checks_are_kept_while_messages_are_retained(mocker):
+    now = datetime.now(timezone.utc)
+    retained = now - timedelta(days=3)
+    expired = now - timedelta(seconds=settings.SQS_CLAIM_CHECK_RETENTION + 1)
+    pages = {
+        "": [{"CommonPrefixes": [{"Prefix": "_claims/"}]}],
+        "_claims/": [
+            {
+                "Contents": [
+                    {"Key": "_claims/retained", "LastModified": retained},
+                    {"Key": "_claims/expired", "LastModified": expired},
+                ]
+            }
+        ],
+    }
+    mocker.patch(
+        "src.handlers.tasks.jobs_results_expire.AWSServiceAdapter.s3_get_obj_iterator",
+        side_effect=lambda bucket, prefix: pages[prefix],
+    )
+    mocked_s3_delete_objects = mocker.patch(
+        "src.handlers.tasks.jobs_results_expire.AWSServiceAdapter.s3_delete_objects"
+    )
+
+    await async_handler(None, None)
+
+    mocked_s3_delete_objects.assert_called_once_with(
+        bucket=settings.JOBS_BUCKET, items=["_claims/expired"]
+    )
+
+
+@pytest.mark.asyncio
+async def test_deletes_in_concurrent_batches(mocker):
+    expired = datetime.now(timezone.utc) - timedelta(
+        seconds=settings.JOBS_RESULTS_EXPIRE + 1
+    )
+    mocker.patch(
+        "src.handlers.tasks.jobs_results_expire.AWSServiceAdapter.s3_get_obj_iterator",
+        return_value=[
+            {"Contents": [{"Key": f"{i}", "LastModified": expired} for i in range(2500)]}
+        ],
+    )
+    mocked_s3_delete_objects = mocker.patch(
+        "src.handlers.tasks.jobs_results_expire.AWSServiceAdapter.s3_delete_objects"
+    )
+
+    await async_handler(None, None)
+
+    batches = [i.kwargs["items"] for i in mocked_s3_delete_objects.call_args_list]
+    assert sorted(len(i) for i in batches) == [500, 1000, 1000]
@@ -0,0 +1,58 @@
+import tracemalloc
+
+from ...helpers.profiling import MemoryProfiler
+
+
+def test_disabled_profiler_reports_rss_only():
+    profiler = MemoryProfiler(enabled=False)
+    profiler.start()
+    with profiler.phase("filter"):
+        offers = b"x" * (32 * 1024 * 1024)
+
+    assert tracemalloc.is_tracing() is False
+    assert list(profiler.stats) == ["peak_rss_mb", "rss_delta_mb"]
+    assert profiler.stats["peak_rss_mb"] > 0
+    assert profiler.stats["rss_delta_mb"] >= 30
+    del offers
+
+
+def test_tracing_is_stopped_by_last_concurrent_profiler():
+    first, second = MemoryProfiler(enabled=True), MemoryProfiler(enabled=True)
+    first.start()
+    second.start()
+    try:
+        first.stop()
+        assert tracemalloc.is_tracing() is True
+        with second.phase("filter"):
+            offers = [{"price": str(i)} for i in range(10_000)]
+    finally:
+        first.stop()
+        second.stop()
+
+    assert tracemalloc.is_tracing() is False
+    assert second.phases["filter"]["retained_mb"] > 0
+    del offers
+
+
+def test_profiler_reports_most_demanding_phase():
+    profiler = MemoryProfiler(enabled=True)
+    profiler.start()
+    try:
+        with profiler.phase("aggregation"):
+            offers = [{"price": str(i)} for i in range(50_000)]
+        with profiler.phase("filter"):
+            offers = offers[:10]
+        profiler.count("offers_results", len(offers))
+    finally:
+        profiler.stop()
+
+    stats = profiler.stats
+    assert tracemalloc.is_tracing() is False
+    assert stats["memory_top_phase"] == "aggregation"
+    assert stats["memory_phases"]["aggregation"]["retained_mb"] > 1
+    assert (
+        stats["memory_phases"]["filter"]["peak_mb"]
+        < stats["memory_phases"]["aggregation"]["peak_mb"]
+    )
+    assert stats["memory_counts"] == {"offers_results": 10}
+    assert "test_profiling.py" in profiler.top_allocations[0]
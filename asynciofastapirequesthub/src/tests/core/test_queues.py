@@ -0,0 +1,120 @@
+import os
+
+import pytest
+
+from ...helpers.aws import AWSServiceAdapter
+from ...helpers.queues import LocalQueueBackend, QueueBackend, SQSQueueBackend
+
+
+@pytest.fixture
+def clock():
+    return {"now": 1_000.0}
+
+
+@pytest.fixture
+def backend(tmp_path, clock):
+    return LocalQueueBackend(
+        root=str(tmp_path), visibility_timeout=60, clock=lambda: clock["now"]
+    )
+
+
+@pytest.mark.asyncio
+async def test_local_queue_delivers_messages_once_in_order(backend):
+    queue_url = backend.get_queue_url("jobs")
+    ids = [
+        backend.send_json_message(queue_url, {"n": i})["MessageId"] for i in range(3)
+    ]
+
+    records = await backend.receive_messages(queue_url, max_messages=2, wait_seconds=0)
+    assert [i["messageId"] for i in records] == ids[:2]
+    assert [AWSServiceAdapter().sqs_decode_body(i["body"]) for i in records] == [
+        {"n": 0},
+        {"n": 1},
+    ]
+
+    records += await backend.receive_messages(
+        queue_url, max_messages=2, wait_seconds=0
+    )
+    assert [i["messageId"] for i in records] == ids
+    assert not await backend.receive_messages(
+        queue_url, max_messages=2, wait_seconds=0
+    )
+
+    for record in records:
+        await backend.delete_message(queue_url, record["receiptHandle"])
+    assert os.listdir(os.path.join(queue_url, "inflight")) == []
+
+
+@pytest.mark.asyncio
+async def test_local_queue_redelivers_after_visibility_timeout(backend, clock):
+    queue_url = backend.get_queue_url("jobs")
+    backend.send_json_message(queue_url, {"n": 0})
+
+    [record] = await backend.receive_messages(
+        queue_url, max_messages=1, wait_seconds=0
+    )
+    clock["now"] += 59
+    assert not await backend.receive_messages(
+        queue_url, max_messages=1, wait_seconds=0
+    )
+
+    clock["now"] += 1
+    [redelivered] = await backend.receive_messages(
+        queue_url, max_messages=1, wait_seconds=0
+    )
+    assert redelivered["messageId"] == record["messageId"]
+
+
+@pytest.mark.asyncio
+async def test_local_queue_sets_claim_time_before_moving_to_inflight(
+    backend, clock, mocker
+):
+    queue_url = backend.get_queue_url("jobs")
+    backend.send_json_message(queue_url, {"n": 0})
+    [name] = [i for i in os.listdir(queue_url) if i.endswith(".json")]
+    os.utime(os.path.join(queue_url, name), (0, 0))
+    rename = os.rename
+    claim_times = []
+
+    def check_rename(src, dst):
+        claim_times.append(os.path.getmtime(src))
+        rename(src, dst)
+
+    mocker.patch("src.helpers.queues.os.rename", side_effect=check_rename)
+
+    await backend.receive_messages(queue_url, max_messages=1, wait_seconds=0)
+
+    assert claim_times == [clock["now"]]
+
+
+@pytest.mark.asyncio
+async def test_sqs_queue_receives_lambda_event_records(mocker):
+    mocked_sqs_receive_messages = mocker.patch(
+        "src.helpers.aws.AWSServiceAdapter.sqs_receive_messages",
+        return_value=[
+            {
+                "MessageId": "1",
+                "ReceiptHandle": "handle",
+                "Body": '{"n":0}',
+                "Attributes": {"ApproximateReceiveCount": "1"},
+            }
+        ],
+    )
+
+    [record] = await SQSQueueBackend(AWSServiceAdapter()).receive_messages(
+        "queue-url", max_messages=50, wait_seconds=5
+    )
+
+    assert mocked_sqs_receive_messages.call_args.kwargs["max_messages"] == 10
+    assert AWSServiceAdapter().sqs_get_messages({"Records": [record]}) == [
+        {"attributes": {"ApproximateReceiveCount": "1"}, "id": "1", "body": {"n": 0}}
+    ]
+
+
+def test_queue_backend_requires_all_operations():
+    class SendOnlyBackend(QueueBackend):
+        def send_json_message(self, queue_url, message):
+            return {"MessageId": "1"}
+
+    with pytest.raises(TypeError):
+        SendOnlyBackend()
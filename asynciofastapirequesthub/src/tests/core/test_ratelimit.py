@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+
+from ...conf import settings
+from ...helpers.ratelimit import (
+    DynamoDBTokenBucketStore,
+    LocalTokenBucketStore,
+    SharedLimiter,
+    TokenBucketLimiter,
+    get_dynamodb_store,
+    get_rate_limiter,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_local_store_grants_up_to_capacity_and_refills_with_rate():
+    clock = Clock()
+    store = LocalTokenBucketStore(clock=clock)
+
+    assert await store.take("key", rate=2, capacity=4, requested=3) == (3, 0.0)
+    assert await store.take("key", rate=2, capacity=4, requested=3) == (1, 0.0)
+    assert await store.take("key", rate=2, capacity=4) == (0, 0.5)
+
+    clock.now += 1
+    assert await store.take("key", rate=2, capacity=4, requested=3) == (2, 0.0)
+
+
+@pytest.mark.asyncio
+async def test_local_store_keeps_separate_buckets_per_key():
+    store = LocalTokenBucketStore(clock=Clock())
+
+    assert await store.take("a", rate=1, capacity=1) == (1, 0.0)
+    assert await store.take("b", rate=1, capacity=1) == (1, 0.0)
+
+
+@pytest.mark.asyncio
+async def test_limiters_share_store_budget(mocker):
+    clock = Clock()
+    store = LocalTokenBucketStore(clock=clock)
+
+    async def sleep(seconds):
+        clock.now += seconds
+
+    mocked_sleep = mocker.patch("src.helpers.ratelimit.asyncio.sleep", side_effect=sleep)
+    limiters = [
+        TokenBucketLimiter(store=store, key="amadeus", rate=2, batch=2)
+        for _ in range(2)
+    ]
+
+    await limiters[0].acquire()
+    await limiters[0].acquire()
+    assert mocked_sleep.call_count == 0
+
+    # whole budget was drawn by the first limiter batch
+    await limiters[1].acquire()
+    assert mocked_sleep.call_count == 1
+
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+
+class DynamoDBClient:
+    """
+    Stub of a table with a single item, concurrent writer bumps its version
+    between get_item and put_item as many times as conflicts.
+    """
+
+    exceptions = type(
+        "Exceptions",
+        (),
+        {"ConditionalCheckFailedException": ConditionalCheckFailedException},
+    )
+
+    def __init__(self, item=None, conflicts=0):
+        self.item = item
+        self.conflicts = conflicts
+        self.puts = []
+
+    def get_item(self, **kwargs):
+        return {"Item": self.item} if self.item else {}
+
+    def put_item(self, Item, ExpressionAttributeValues, **kwargs):
+        self.puts.append(Item)
+        if self.conflicts:
+            self.conflicts -= 1
+            raise ConditionalCheckFailedException
+
+        expected = ExpressionAttributeValues[":v"]["N"]
+        current = self.item["version"]["N"] if self.item else "0"
+        if expected != current:
+            raise ConditionalCheckFailedException
+        self.item = Item
+
+
+@pytest.mark.asyncio
+async def test_dynamodb_store_updates_bucket_with_version_check():
+    client = DynamoDBClient(
+        item={
+            "key": {"S": "amadeus"},
+            "tokens": {"N": "1.5"},
+            "updated_at": {"N": "999.0"},
+            "version": {"N": "3"},
+        }
+    )
+    store = DynamoDBTokenBucketStore("table", client=client, clock=Clock())
+
+    # 1.5 tokens refilled by 2 for a second
+    assert await store.take("amadeus", rate=2, capacity=10, requested=3) == (3, 0.0)
+    assert client.item["version"] == {"N": "4"}
+    assert float(client.item["tokens"]["N"]) == 0.5
+
+
+@pytest.mark.asyncio
+async def test_dynamodb_store_retries_on_conflicts_and_backs_off():
+    client = DynamoDBClient(conflicts=1)
+    store = DynamoDBTokenBucketStore("table", client=client, clock=Clock())
+
+    assert await store.take("amadeus", rate=4, capacity=4, requested=2) == (2, 0.0)
+    assert len(client.puts) == 2
+
+    client.conflicts = DynamoDBTokenBucketStore.MAX_CONFLICT_RETRIES
+    assert await store.take("amadeus", rate=4, capacity=4) == (0, 0.25)
+    assert client.item["tokens"] == {"N": "2"}
+
+
+def test_dynamodb_store_is_reused_by_limiters(mocker):
+    mocker.patch.object(settings, "AMADEUS_RATE_LIMITER_BACKEND", "dynamodb")
+    mocked_store = mocker.patch(
+        "src.helpers.ratelimit.DynamoDBTokenBucketStore", return_value=mocker.MagicMock()
+    )
+    get_dynamodb_store.cache_clear()
+    try:
+        assert get_rate_limiter().store is get_rate_limiter().store
+    finally:
+        get_dynamodb_store.cache_clear()
+
+    mocked_store.assert_called_once_with(
+        table_name=settings.AMADEUS_RATE_LIMITER_TABLE
+    )
+
+
+@pytest.mark.asyncio
+async def test_shared_limiter_caps_requests_at_once_of_all_jobs():
+    limiter = SharedLimiter(max_at_once=2, max_per_second=1000)
+    running = []
+    peak = 0
+
+    async def request():
+        nonlocal peak
+        running.append(1)
+        peak = max(peak, len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+
+    # two jobs of three requests each
+    await asyncio.gather(
+        *[limiter.run(request) for _ in range(3)],
+        *[limiter.run(request) for _ in range(3)],
+    )
+
+    assert peak == 2
@@ -0,0 +1,46 @@
+import gzip
+
+import orjson
+
+from ...helpers.utils import gzip_json, ndjson_gzip_chunks, ndjson_page_chunks
+
+
+def test_gzip_json_returns_size_of_serialized_json():
+    message = {"status": "READY", "results": [{"id": 1}]}
+    size, body = gzip_json(message)
+
+    assert size == len(orjson.dumps(message))
+    assert orjson.loads(gzip.decompress(body)) == message
+
+
+def test_ndjson_gzip_chunks_are_separate_gzip_members():
+    items = [{"id": i} for i in range(5)]
+    payload, index = ndjson_gzip_chunks(items, chunk_size=2)
+
+    assert index["total"] == 5
+    assert [count for _, _, count in index["chunks"]] == [2, 2, 1]
+
+    offset, length, _ = index["chunks"][1]
+    lines = gzip.decompress(payload[offset : offset + length]).splitlines()  # noqa: E203
+    assert [orjson.loads(i) for i in lines] == [{"id": 2}, {"id": 3}]
+    assert gzip.decompress(payload) == b"".join(
+        orjson.dumps(i) + b"\n" for i in items
+    )
+
+
+def test_ndjson_gzip_chunks_for_empty_items():
+    assert ndjson_gzip_chunks([], chunk_size=2) == (
+        b"",
+        {"chunk_size": 2, "total": 0, "chunks": []},
+    )
+
+
+def test_ndjson_page_chunks_cover_requested_page():
+    index = {"chunk_size": 10, "chunks": [[0, 1, 10], [1, 1, 10], [2, 1, 10]]}
+
+    assert ndjson_page_chunks(index, offset=0, limit=10) == ([[0, 1, 10]], 0)
+    assert ndjson_page_chunks(index, offset=15, limit=10) == (
+        [[1, 1, 10], [2, 1, 10]],
+        5,
+    )
+    assert ndjson_page_chunks(index, offset=40, limit=10) == ([], 0)
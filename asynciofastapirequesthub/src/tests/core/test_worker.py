@@ -0,0 +1,105 @@
+import asyncio
+import os
+
+import pytest
+
+from ...conf import settings
+from ...handlers.tasks.worker import Worker, share_rate_limits
+from ...helpers.queues import LocalQueueBackend
+
+
+@pytest.mark.asyncio
+async def test_worker_handles_higher_priority_queue_first(mocker, tmp_path):
+    backend = LocalQueueBackend(root=str(tmp_path), visibility_timeout=60)
+    bulk_url = backend.get_queue_url("bulk")
+    jobs_url = backend.get_queue_url("jobs")
+    backend.send_json_message(bulk_url, {"task_id": "bulk"})
+    backend.send_json_message(jobs_url, {"task_id": "interactive"})
+
+    worker = Worker(backend, queue_names=["jobs", "bulk"], concurrency=1)
+    handled = []
+
+    async def async_handler(event, context):
+        [record] = event["Records"]
+        handled.append(record["body"])
+        if len(handled) == 2:
+            worker.stopping.set()
+
+    mocker.patch("src.handlers.tasks.worker.jobs.async_handler", async_handler)
+    mocker.patch("src.handlers.tasks.worker.RECEIVE_WAIT_SECONDS", 0)
+
+    stats = await asyncio.wait_for(worker.run(), timeout=5)
+
+    assert handled == ['{"task_id":"interactive"}', '{"task_id":"bulk"}']
+    assert stats == {"handled": 2, "failed": 0}
+    assert os.listdir(os.path.join(jobs_url, "inflight")) == []
+    assert os.listdir(os.path.join(bulk_url, "inflight")) == []
+
+
+@pytest.mark.asyncio
+async def test_worker_leaves_failed_message_for_redelivery(mocker, tmp_path):
+    backend = LocalQueueBackend(root=str(tmp_path), visibility_timeout=60)
+    jobs_url = backend.get_queue_url("jobs")
+    backend.send_json_message(jobs_url, {"task_id": "123"})
+
+    worker = Worker(backend, queue_names=["jobs"], concurrency=2)
+
+    async def async_handler(event, context):
+        worker.stopping.set()
+        raise ValueError
+
+    mocker.patch("src.handlers.tasks.worker.jobs.async_handler", async_handler)
+    mocker.patch("src.handlers.tasks.worker.RECEIVE_WAIT_SECONDS", 0)
+
+    stats = await asyncio.wait_for(worker.run(), timeout=10)
+
+    assert stats == {"handled": 0, "failed": 1}
+    assert len(os.listdir(os.path.join(jobs_url, "inflight"))) == 1
+
+
+def test_rate_limits_are_split_between_processes(mocker):
+    mocker.patch.object(settings, "AMADEUS_MAX_REQUESTS_AT_ONCE", 50)
+    mocker.patch.object(settings, "AMADEUS_MAX_REQUESTS_PER_SECOND", 50)
+    mocker.patch.object(settings, "AMADEUS_BULK_MAX_REQUESTS_AT_ONCE", 40)
+    mocker.patch.object(settings, "AMADEUS_BULK_MAX_REQUESTS_PER_SECOND", 5)
+    mocker.patch.object(settings, "AMADEUS_SHARED_JOB_LIMITS", False)
+    mocker.patch.object(settings, "AMADEUS_RATE_LIMITER_BACKEND", "local")
+    mocker.patch.object(settings, "AMADEUS_GLOBAL_MAX_REQUESTS_PER_SECOND", 140)
+
+    share_rate_limits(processes=2)
+
+    assert settings.AMADEUS_MAX_REQUESTS_AT_ONCE == 25
+    assert settings.AMADEUS_MAX_REQUESTS_PER_SECOND == 25
+    assert settings.AMADEUS_BULK_MAX_REQUESTS_AT_ONCE == 20
+    assert settings.AMADEUS_BULK_MAX_REQUESTS_PER_SECOND == 2
+    assert settings.AMADEUS_SHARED_JOB_LIMITS is True
+    assert settings.AMADEUS_GLOBAL_MAX_REQUESTS_PER_SECOND == 70
+
+
+@pytest.mark.asyncio
+async def test_worker_keeps_polling_after_receive_error(mocker, tmp_path):
+    backend = LocalQueueBackend(root=str(tmp_path), visibility_timeout=60)
+    jobs_url = backend.get_queue_url("jobs")
+    backend.send_json_message(jobs_url, {"task_id": "123"})
+    receive_messages = backend.receive_messages
+    errors = [OSError("queue is not available")]
+
+    async def flaky_receive_messages(*args, **kwargs):
+        if errors:
+            raise errors.pop()
+        return await receive_messages(*args, **kwargs)
+
+    mocker.patch.object(backend, "receive_messages", flaky_receive_messages)
+
+    worker = Worker(backend, queue_names=["jobs"], concurrency=2)
+
+    async def async_handler(event, context):
+        worker.stopping.set()
+
+    mocker.patch("src.handlers.tasks.worker.jobs.async_handler", async_handler)
+    mocker.patch("src.handlers.tasks.worker.RECEIVE_WAIT_SECONDS", 0)
+    mocker.patch("src.handlers.tasks.worker.RECEIVE_ERROR_BACKOFF_SECONDS", 0)
+
+    stats = await asyncio.wait_for(worker.run(), timeout=10)
+
+    assert stats == {"handled": 1, "failed": 0}
@@ -0,0 +1,23 @@
+import pytest
+
+from ...benchmarks.api_load import DRIVERS, SCENARIOS, main
+from ...conf import settings
+
+
+def test_api_load_reports_all_scenarios_against_moto(mocker):
+    pytest.importorskip("moto")
+    # harness adjusts these for the run
+    for name in ("METRICS_ENABLED", "JOBS_INLINE_EXECUTOR", "DEFAULT_AWS_REGION"):
+        mocker.patch.object(settings, name, getattr(settings, name))
+
+    reports = main(
+        ["--requests", "4", "--concurrency", "2", "--offers", "5", "--verbose"]
+    )
+
+    assert [(i["driver"], i["scenario"]) for i in reports] == [
+        (driver, scenario) for driver in DRIVERS for scenario in SCENARIOS
+    ]
+    for report in reports:
+        assert report["requests"] == 4
+        assert report["errors"] == 0
+        assert report["p50_ms"] <= report["p95_ms"] <= report["p99_ms"]
@@ -1,15 +1,26 @@
+import asyncio
+import gzip
+import io
+
+import orjson
 import pytest
 from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
 from httpx import AsyncClient
 from starlette.status import (
     HTTP_200_OK,
     HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
     HTTP_422_UNPROCESSABLE_ENTITY,
 )
 
 from ...conf import settings
+from ...endpoints import tasks
+from ...endpoints.tasks import accepts_gzip
 from ...helpers import consts
-from ..helpers import get_auth_headers
+from ...helpers.aws import AWSServiceAdapter, get_client_s3
+from ...helpers.utils import ndjson_gzip_chunks
+from ..helpers import get_amadeus_task_params, get_auth_headers
 
 
 @pytest.mark.asyncio
@@ -149,8 +160,15 @@ async def test_schedule_properly_calls_aws_services_and_put_message_in_queue(
             == response_data["task_id"]
         )
 
+        aws = AWSServiceAdapter()
+        partition = aws.key_partition()
         mocked_s3_generate_presigned_url.assert_called_with(
-            bucket=settings.JOBS_BUCKET, key=f"{response_data['task_id']}-results"
+            bucket=settings.JOBS_BUCKET,
+            key=f"{partition}/{response_data['task_id']}-results",
+        )
+        assert (
+            mocked_sqs_send_json_message.call_args.kwargs["message"]["task_partition"]
+            == partition
         )
         assert mocked_s3_put_json_obj.called is True
 
@@ -159,6 +177,9 @@ async def test_schedule_properly_calls_aws_services_and_put_message_in_queue(
 async def test_schedule_serves_results_from_cache_and_does_not_schedule_message(
     async_client: AsyncClient, mocker
 ):
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_get_obj_age", return_value=0
+    )
     queue_url = "test-url"
     task_name = "task"
     task_params = {"asd": 2}
@@ -292,3 +313,615 @@ async def test_task_status_returns_200_response_and_results_for_scheduled_job(
             "processed": True,
             "task_id": "123",
         }
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "task_params,queue_name,task_lane",
+    [
+        (
+            get_amadeus_task_params(),
+            settings.JOBS_QUEUE_NAME,
+            consts.TaskLane.INTERACTIVE,
+        ),
+        (
+            get_amadeus_task_params(
+                date_to="2024-05-05",
+                fly_from_airports=["GDN", "KRK", "WAW"],
+                fly_to_airports=["GAN", "MLE"],
+                return_from_airports=["GAN", "MLE"],
+                return_to_airports=["GDN", "KRK", "WAW"],
+                nights_in_dst_to=11,
+                return_to="2024-05-12",
+            ),
+            settings.JOBS_BULK_QUEUE_NAME,
+            consts.TaskLane.BULK,
+        ),
+    ],
+)
+async def test_schedule_routes_task_to_lane_by_its_cost(
+    async_client: AsyncClient, mocker, task_params, queue_name, task_lane
+):
+    mocker.patch("src.endpoints.tasks.find_subsuming_task", return_value=None)
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_check_key_exists", return_value=False
+    )
+    mocked_get_queue_url = mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.sqs_get_queue_url"
+    )
+    mocked_sqs_send_json_message = mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.sqs_send_json_message"
+    )
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.s3_put_json_obj")
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.s3_generate_presigned_url")
+
+    task_name = consts.Tasks.AMADEUS_PRESELECTION
+    data = {"task_name": task_name, "task_params": task_params}
+
+    async with async_client:
+        r = await async_client.post(
+            "/api/tasks/schedule", json=data, headers=get_auth_headers()
+        )
+
+        assert r.status_code == HTTP_200_OK
+        mocked_get_queue_url.assert_called_with(queue_name)
+        message = mocked_sqs_send_json_message.call_args.kwargs["message"]
+        assert message["task_lane"] == task_lane
+        assert message["task_params"] == task_params
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "task_params",
+    [
+        {"asd": 2},
+        get_amadeus_task_params(date_from="2024-04-27"),
+        get_amadeus_task_params(passengers_map={"adults": 0}),
+        get_amadeus_task_params(return_to_airports=["KRK"]),
+        get_amadeus_task_params(return_from_airports=["JFK"]),
+    ],
+)
+async def test_schedule_rejects_invalid_task_params(
+    async_client: AsyncClient, mocker, task_params
+):
+    mocked_sqs_send_json_message = mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.sqs_send_json_message"
+    )
+    data = {"task_name": consts.Tasks.AMADEUS_PRESELECTION, "task_params": task_params}
+
+    async with async_client:
+        r = await async_client.post(
+            "/api/tasks/schedule", json=data, headers=get_auth_headers()
+        )
+
+        assert r.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+        assert r.json()["error_code"] == "INVALID_TASK_PARAMS"
+        mocked_sqs_send_json_message.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_schedule_gives_equivalent_searches_same_task_id(
+    async_client: AsyncClient, mocker
+):
+    mocker.patch("src.endpoints.tasks.find_subsuming_task", return_value=None)
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_check_key_exists", return_value=False
+    )
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.sqs_get_queue_url")
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.sqs_send_json_message")
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.s3_put_json_obj")
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.s3_generate_presigned_url")
+    equivalent = [
+        get_amadeus_task_params(
+            fly_from_airports=["WAW", "KRK"],
+            return_to_airports=["KRK", "WAW"],
+            passengers_map={"adults": 2, "children": [9, 4]},
+        ),
+        get_amadeus_task_params(
+            fly_from_airports=["krk", "WAW", "WAW"],
+            return_to_airports=["WAW", "KRK", "GDN"],
+            passengers_map={"adults": 2, "children": [4, 9]},
+            allow_opposite_route=True,
+            currency_code="pln",
+        ),
+    ]
+
+    async with async_client:
+        task_ids = set()
+        for task_params in equivalent:
+            data = {
+                "task_name": consts.Tasks.AMADEUS_PRESELECTION,
+                "task_params": task_params,
+            }
+            r = await async_client.post(
+                "/api/tasks/schedule", json=data, headers=get_auth_headers()
+            )
+            assert r.status_code == HTTP_200_OK
+            task_ids.add(r.json()["task_id"])
+
+        assert len(task_ids) == 1
+
+
+@pytest.mark.asyncio
+async def test_schedule_emits_cache_hit_metrics(
+    async_client: AsyncClient, mocker, capsys
+):
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_get_obj_age", return_value=0
+    )
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_check_key_exists", return_value=True
+    )
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.s3_generate_presigned_url")
+    data = {"task_name": "task", "task_params": {"asd": 2}}
+
+    async with async_client:
+        r = await async_client.post(
+            "/api/tasks/schedule", json=data, headers=get_auth_headers()
+        )
+
+        assert r.status_code == HTTP_200_OK
+        line = orjson.loads(capsys.readouterr().out.splitlines()[-1])
+        assert line["TaskName"] == "task"
+        assert line["CacheRequests"] == 1
+        assert line["CacheHits"] == 1
+        assert line["_aws"]["CloudWatchMetrics"][0]["Namespace"] == (
+            settings.METRICS_NAMESPACE
+        )
+
+
+@pytest.mark.asyncio
+async def test_schedule_sends_subsumed_task_with_source_task(
+    async_client: AsyncClient, mocker, capsys
+):
+    mocker.patch.object(settings, "JOBS_SNAPSHOTS_ENABLED", True)
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_check_key_exists", return_value=False
+    )
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_get_json_obj",
+        return_value={
+            "tasks": [
+                {
+                    "task_id": "wide",
+                    "task_params": get_amadeus_task_params(date_to="2024-04-30"),
+                    "max_flight_offers": 250,
+                    "completed_at": 10**10,
+                }
+            ]
+        },
+    )
+    mocked_get_queue_url = mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.sqs_get_queue_url"
+    )
+    mocked_sqs_send_json_message = mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.sqs_send_json_message"
+    )
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.s3_put_json_obj")
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.s3_generate_presigned_url")
+    data = {
+        "task_name": consts.Tasks.AMADEUS_PRESELECTION,
+        "task_params": get_amadeus_task_params(),
+    }
+
+    async with async_client:
+        r = await async_client.post(
+            "/api/tasks/schedule", json=data, headers=get_auth_headers()
+        )
+
+        assert r.status_code == HTTP_200_OK
+        message = mocked_sqs_send_json_message.call_args.kwargs["message"]
+        assert message["task_source_id"] == "wide"
+        mocked_get_queue_url.assert_called_with(settings.JOBS_QUEUE_NAME)
+        line = orjson.loads(capsys.readouterr().out.splitlines()[-1])
+        assert line["CacheSubsumedHits"] == 1
+
+
+def test_find_subsuming_task_is_skipped_without_snapshots(mocker):
+    mocker.patch.object(settings, "JOBS_SNAPSHOTS_ENABLED", False)
+    mocked_find_subsuming_task = mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.find_subsuming_task"
+    )
+
+    assert (
+        tasks.find_subsuming_task(
+            consts.Tasks.AMADEUS_PRESELECTION, get_amadeus_task_params()
+        )
+        is None
+    )
+    mocked_find_subsuming_task.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_schedule_serves_stale_results_and_enqueues_revalidation(
+    async_client: AsyncClient, mocker
+):
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_check_key_exists", return_value=True
+    )
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_get_obj_age",
+        side_effect=[settings.JOBS_RESULTS_SOFT_TTL + 1, None],
+    )
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.sqs_get_queue_url")
+    mocked_sqs_send_json_message = mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.sqs_send_json_message"
+    )
+    mocked_s3_put_json_obj = mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_put_json_obj"
+    )
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_generate_presigned_url",
+        return_value="cached-url",
+    )
+    data = {"task_name": "task", "task_params": {"asd": 2}}
+
+    async with async_client:
+        r = await async_client.post(
+            "/api/tasks/schedule", json=data, headers=get_auth_headers()
+        )
+
+        assert r.status_code == HTTP_200_OK
+        assert r.json()["task_results_url"] == "cached-url"
+        message = mocked_sqs_send_json_message.call_args.kwargs["message"]
+        assert message["task_revalidate"] is True
+        assert message["task_refresh"] is True
+        # only revalidation marker is written, cached results stay served
+        partition = AWSServiceAdapter().key_partition()
+        mocked_s3_put_json_obj.assert_called_once_with(
+            bucket=settings.JOBS_BUCKET,
+            key=f"{partition}/{r.json()['task_id']}-revalidation",
+            message={"revalidation_id": message["task_revalidation_id"]},
+            gzipped=False,
+        )
+
+
+@pytest.mark.asyncio
+async def test_schedule_writes_no_revalidation_marker_when_send_fails(
+    async_client: AsyncClient, mocker
+):
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_check_key_exists", return_value=True
+    )
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_get_obj_age",
+        side_effect=[settings.JOBS_RESULTS_SOFT_TTL + 1, None],
+    )
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.sqs_get_queue_url")
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.sqs_send_json_message",
+        side_effect=ClientError({"Error": {"Code": "500"}}, "SendMessage"),
+    )
+    mocked_s3_put_json_obj = mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_put_json_obj"
+    )
+    data = {"task_name": "task", "task_params": {"asd": 2}}
+
+    async with async_client:
+        r = await async_client.post(
+            "/api/tasks/schedule", json=data, headers=get_auth_headers()
+        )
+
+        assert r.status_code == 400
+        mocked_s3_put_json_obj.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_schedule_coalesces_revalidations_of_same_task(
+    async_client: AsyncClient, mocker
+):
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_check_key_exists", return_value=True
+    )
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_get_obj_age",
+        side_effect=[settings.JOBS_RESULTS_SOFT_TTL + 1, 10],
+    )
+    mocked_sqs_send_json_message = mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.sqs_send_json_message"
+    )
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.s3_generate_presigned_url")
+    data = {"task_name": "task", "task_params": {"asd": 2}}
+
+    async with async_client:
+        r = await async_client.post(
+            "/api/tasks/schedule", json=data, headers=get_auth_headers()
+        )
+
+        assert r.status_code == HTTP_200_OK
+        mocked_sqs_send_json_message.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_schedule_tracks_task_popularity(async_client: AsyncClient, mocker):
+    mocker.patch.object(settings, "JOBS_POPULARITY_TRACKING", True)
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_check_key_exists", return_value=True
+    )
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_get_obj_age", return_value=0
+    )
+    mocked_s3_put_obj = mocker.patch("src.endpoints.tasks.AWSServiceAdapter.s3_put_obj")
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.s3_generate_presigned_url")
+    data = {"task_name": "task", "task_params": {"asd": 2}}
+
+    async with async_client:
+        r = await async_client.post(
+            "/api/tasks/schedule", json=data, headers=get_auth_headers()
+        )
+
+        assert r.status_code == HTTP_200_OK
+        # put runs off the request path
+        await asyncio.gather(*tasks.popularity_tracking)
+        prefix = AWSServiceAdapter().key_popularity_prefix(
+            AWSServiceAdapter().key_partition()
+        )
+        kwargs = mocked_s3_put_obj.call_args.kwargs
+        assert kwargs["key"].startswith(f"{prefix}{r.json()['task_id']}-")
+        assert orjson.loads(kwargs["body"]) == data
+
+
+@pytest.mark.asyncio
+async def test_estimate_returns_task_cost_and_eta(async_client: AsyncClient, mocker):
+    mocker.patch(
+        "src.handlers.tasks.runners.amadeus_preselection.AWSServiceAdapter.s3_get_json_obj",
+        return_value={"latency": 1.0, "samples": 100},
+    )
+    mocked_sqs_send_json_message = mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.sqs_send_json_message"
+    )
+    data = {
+        "task_name": consts.Tasks.AMADEUS_PRESELECTION,
+        "task_params": get_amadeus_task_params(),
+    }
+
+    async with async_client:
+        r = await async_client.post(
+            "/api/tasks/estimate", json=data, headers=get_auth_headers()
+        )
+
+        assert r.status_code == HTTP_200_OK
+        assert r.json() == {
+            "task_cost": 2,
+            "task_lane": consts.TaskLane.INTERACTIVE,
+            "task_eta_seconds": 1.54,
+            "task_max_cost": settings.TASKS_MAX_COST,
+            "task_admitted": True,
+            "task_shards": None,
+        }
+        mocked_sqs_send_json_message.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_schedule_rejects_task_over_cost_ceiling(
+    async_client: AsyncClient, mocker
+):
+    mocker.patch.object(settings, "TASKS_MAX_COST", 1)
+    mocked_sqs_send_json_message = mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.sqs_send_json_message"
+    )
+    data = {
+        "task_name": consts.Tasks.AMADEUS_PRESELECTION,
+        "task_params": get_amadeus_task_params(),
+    }
+
+    async with async_client:
+        r = await async_client.post(
+            "/api/tasks/schedule", json=data, headers=get_auth_headers()
+        )
+
+        assert r.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+        assert r.json()["error_code"] == "TASK_COST_EXCEEDED"
+        mocked_sqs_send_json_message.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_schedule_shards_task_over_cost_ceiling(
+    async_client: AsyncClient, mocker
+):
+    mocker.patch("src.endpoints.tasks.find_subsuming_task", return_value=None)
+    mocker.patch.object(settings, "TASKS_MAX_COST", 1)
+    mocker.patch.object(
+        settings, "TASKS_OVER_COST_POLICY", consts.TaskOverCostPolicy.SHARD
+    )
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_check_key_exists", return_value=False
+    )
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.sqs_get_queue_url")
+    mocked_sqs_send_json_message = mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.sqs_send_json_message"
+    )
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.s3_put_json_obj")
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.s3_generate_presigned_url")
+    data = {
+        "task_name": consts.Tasks.AMADEUS_PRESELECTION,
+        "task_params": get_amadeus_task_params(),
+    }
+
+    async with async_client:
+        r = await async_client.post(
+            "/api/tasks/schedule", json=data, headers=get_auth_headers()
+        )
+
+        assert r.status_code == HTTP_200_OK
+        assert r.json()["task_id"] is None
+        assert len(r.json()["task_shards"]) == 2
+        sent = [
+            i.kwargs["message"]["task_params"]
+            for i in mocked_sqs_send_json_message.call_args_list
+        ]
+        assert [(i["date_from"], i["date_to"]) for i in sent] == [
+            ("2024-04-25", "2024-04-25"),
+            ("2024-04-26", "2024-04-26"),
+        ]
+
+
+@pytest.mark.asyncio
+async def test_task_status_returns_price_matrix_when_requested(
+    async_client: AsyncClient, mocker
+):
+    matrix = {"currency_code": "PLN", "by_dates": [], "by_airports": []}
+    mocked_s3_get_json_obj = mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_get_json_obj",
+        side_effect=[{"results": [], "status": consts.TaskStatus.READY}, matrix],
+    )
+
+    async with async_client:
+        r = await async_client.get(
+            "/api/tasks/123/status?price_matrix=true", headers=get_auth_headers()
+        )
+        assert r.status_code == HTTP_200_OK
+        assert r.json()["price_matrix"] == matrix
+        partition = AWSServiceAdapter().key_partition()
+        mocked_s3_get_json_obj.assert_called_with(
+            bucket=settings.JOBS_BUCKET, key=f"{partition}/123-price-matrix"
+        )
+
+
+@pytest.mark.asyncio
+async def test_schedule_sends_refresh_task_when_cached_results_exist(
+    async_client: AsyncClient, mocker
+):
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_check_key_exists", return_value=True
+    )
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.sqs_get_queue_url")
+    mocked_sqs_send_json_message = mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.sqs_send_json_message"
+    )
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.s3_put_json_obj")
+    mocker.patch("src.endpoints.tasks.AWSServiceAdapter.s3_generate_presigned_url")
+
+    data = {"task_name": "task", "task_params": {"asd": 2}, "task_refresh": True}
+
+    async with async_client:
+        r = await async_client.post(
+            "/api/tasks/schedule", json=data, headers=get_auth_headers()
+        )
+
+        assert r.status_code == HTTP_200_OK
+        message = mocked_sqs_send_json_message.call_args.kwargs["message"]
+        assert message["task_refresh"] is True
+
+
+@pytest.mark.asyncio
+async def test_task_results_streams_requested_page_using_byte_ranges(
+    async_client: AsyncClient, mocker
+):
+    items = [{"id": i} for i in range(10)]
+    payload, index = ndjson_gzip_chunks(items, chunk_size=3)
+    index["version"] = "abc"
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_get_json_obj", return_value=index
+    )
+    mocked_s3_get_obj_range = mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_get_obj_range",
+        side_effect=lambda bucket, key, start, end: io.BytesIO(payload[start : end + 1]),  # noqa: E203
+    )
+
+    async with async_client:
+        r = await async_client.get(
+            "/api/tasks/123/results?offset=4&limit=4", headers=get_auth_headers()
+        )
+
+        assert r.status_code == HTTP_200_OK
+        assert r.headers["X-Total-Count"] == "10"
+        assert [orjson.loads(i) for i in r.text.splitlines()] == items[4:8]
+        assert mocked_s3_get_obj_range.call_count == 1
+        partition = AWSServiceAdapter().key_partition()
+        assert (
+            mocked_s3_get_obj_range.call_args.kwargs["key"]
+            == f"{partition}/123-results-abc.ndjson.gz"
+        )
+        assert mocked_s3_get_obj_range.call_args.kwargs["start"] == index["chunks"][1][0]
+
+
+@pytest.mark.asyncio
+async def test_task_results_returns_404_when_results_are_not_available(
+    async_client: AsyncClient, mocker
+):
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_get_json_obj",
+        side_effect=get_client_s3().exceptions.NoSuchKey(
+            error_response={}, operation_name="GetObject"
+        ),
+    )
+
+    async with async_client:
+        r = await async_client.get("/api/tasks/123/results", headers=get_auth_headers())
+        assert r.status_code == HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_task_status_streams_stored_gzip_for_raw_requests(
+    async_client: AsyncClient, mocker
+):
+    meta = {"results": [{"id": 1}], "status": consts.TaskStatus.READY}
+    data = gzip.compress(orjson.dumps(meta))
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_get_obj",
+        return_value={
+            "Body": StreamingBody(io.BytesIO(data), len(data)),
+            "ContentLength": len(data),
+        },
+    )
+    mocked_s3_get_json_obj = mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_get_json_obj"
+    )
+
+    async with async_client:
+        r = await async_client.get(
+            "/api/tasks/123/status?raw=true",
+            headers={**get_auth_headers(), "Accept-Encoding": "gzip"},
+        )
+
+        assert r.status_code == HTTP_200_OK
+        assert r.headers["Content-Encoding"] == "gzip"
+        assert r.headers["X-Task-Id"] == "123"
+        assert r.headers["X-Task-Bucket"] == settings.JOBS_BUCKET
+        assert r.headers["X-Task-Processed"] == "true"
+        assert r.json() == meta
+        assert mocked_s3_get_json_obj.called is False
+
+
+@pytest.mark.asyncio
+async def test_task_status_ignores_raw_when_gzip_is_not_accepted(
+    async_client: AsyncClient, mocker
+):
+    mocked_s3_get_obj = mocker.patch("src.endpoints.tasks.AWSServiceAdapter.s3_get_obj")
+    mocker.patch(
+        "src.endpoints.tasks.AWSServiceAdapter.s3_get_json_obj",
+        return_value={"results": "sth", "status": consts.TaskStatus.READY},
+    )
+
+    async with async_client:
+        r = await async_client.get(
+            "/api/tasks/123/status?raw=true",
+            headers={**get_auth_headers(), "Accept-Encoding": "identity"},
+        )
+
+        assert r.status_code == HTTP_200_OK
+        assert r.json()["processed"] is True
+        assert mocked_s3_get_obj.called is False
+
+
+@pytest.mark.parametrize(
+    "accept_encoding,expected",
+    [
+        ("gzip", True),
+        ("gzip, deflate, br", True),
+        ("br;q=1.0, gzip;q=0.8", True),
+        ("*", True),
+        ("gzip;q=0", False),
+        ("gzip;q=0.0", False),
+        ("gzip; q=0.00", False),
+        ("gzip;q=0.001", True),
+        ("gzip;q=0, *", False),
+        ("*;q=0", False),
+        ("deflate, *;q=0.5", True),
+        ("identity", False),
+        ("", False),
+    ],
+)
+def test_accepts_gzip(accept_encoding, expected):
+    assert accepts_gzip(accept_encoding) is expected
@@ -3,3 +3,33 @@ from ..conf import settings
 
 def get_auth_headers():
     return {settings.API_KEY_HEADER_NAME: settings.API_KEY_HEADER_VALUE}
+
+
+def get_amadeus_task_params(**kwargs):
+    return {
+        "date_from": "2024-04-25",
+        "date_to": "2024-04-26",
+        "nights_in_dst_from": 7,
+        "nights_in_dst_to": 7,
+        "passengers_map": {"adults": 2, "children": [9]},
+        "fly_from_airports": ["WAW"],
+        "fly_to_airports": ["MLE"],
+        "return_from_airports": ["MLE"],
+        "return_to_airports": ["WAW"],
+        "return_from": "2024-05-02",
+        "return_to": "2024-05-03",
+        "allow_opposite_route": False,
+        "currency_code": "PLN",
+        "multicity": False,
+        **kwargs,
+    }
+
+
+def get_amadeus_offer(price, duration="PT2H30M", segments=1, **kwargs):
+    itinerary = {"duration": duration, "segments": [{}] * segments}
+    return {
+        "type": "flight-offer",
+        "price": {"currency": "PLN", "total": price, "grandTotal": price},
+        "itineraries": [itinerary, itinerary],
+        **kwargs,
+    }